@@ -1,10 +1,11 @@
-from flask import Flask, request, abort
+from flask import Flask
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 from app.models import db
 import logging
@@ -26,6 +27,27 @@ def create_app(config_class=Config):
     csrf.init_app(app)
     limiter.init_app(app)
 
+    # Tentativas de login e bloqueios de IP (compartilhados entre os workers)
+    from app.contadores import CacheBloqueios, criar_armazenamento
+    app.extensions['contadores_seguranca'] = criar_armazenamento(app.config['SEGURANCA_STORAGE_URL'])
+    app.extensions['bloqueios_ip'] = CacheBloqueios(
+        app.extensions['contadores_seguranca'], app.config['BLOQUEIO_CACHE_SEGUNDOS']
+    )
+
+    # IP do cliente a partir do X-Forwarded-For dos proxies confiáveis (nginx)
+    if app.config.get('PROXIES_CONFIAVEIS'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXIES_CONFIAVEIS'])
+
+    # Perfil por requisição (consultas SQL, tempo no banco e nos templates);
+    # registrado antes dos demais hooks para que o tempo total inclua todos
+    if app.config.get('PERFIL_REQUISICOES'):
+        from app.perfilamento import registrar_perfilamento
+        registrar_perfilamento(app)
+
+    # Métricas no formato Prometheus (GET /metrics, protegido por METRICAS_TOKEN)
+    from app.metricas import registrar_metricas
+    registrar_metricas(app)
+
     # Configurar Talisman (HTTPS e Security Headers)
     if app.config.get('FLASK_ENV') == 'production':
         Talisman(app,
@@ -33,8 +55,8 @@ def create_app(config_class=Config):
                 strict_transport_security=app.config.get('TALISMAN_STRICT_TRANSPORT_SECURITY', True),
                 content_security_policy=app.config.get('TALISMAN_CONTENT_SECURITY_POLICY'))
 
-    # Configurar logging de segurança
-    if not app.debug:
+    # Configurar logging de segurança (arquivos em logs/, exceto em debug e nos testes)
+    if not app.debug and not app.testing:
         if not os.path.exists('logs'):
             os.mkdir('logs')
 
@@ -59,6 +81,16 @@ def create_app(config_class=Config):
         security_logger.addHandler(security_handler)
         security_logger.setLevel(logging.INFO)
 
+        # Log de consultas lentas (acima de CONSULTA_LENTA_MS)
+        consultas_lentas_handler = RotatingFileHandler('logs/consultas_lentas.log',
+                                                       maxBytes=10240000, backupCount=10)
+        consultas_lentas_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s'
+        ))
+        consultas_lentas_logger = logging.getLogger('consultas_lentas')
+        consultas_lentas_logger.addHandler(consultas_lentas_handler)
+        consultas_lentas_logger.setLevel(logging.INFO)
+
     # Configurar Flask-Login
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
@@ -70,23 +102,9 @@ def create_app(config_class=Config):
         from app.models import User
         return User.query.get(int(user_id))
 
-    # Middleware de segurança
-    @app.before_request
-    def security_checks():
-        from app.security import get_client_ip, is_ip_blocked, log_suspicious_activity
-
-        # Verificar IP bloqueado
-        client_ip = get_client_ip()
-        if is_ip_blocked(client_ip):
-            log_suspicious_activity(f"Tentativa de acesso de IP bloqueado: {client_ip}", level='warning')
-            abort(403)
-
-        # Verificar tamanho do conteúdo
-        if request.content_length:
-            max_size = app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
-            if request.content_length > max_size:
-                log_suspicious_activity(f"Requisição muito grande rejeitada: {request.content_length} bytes", level='warning')
-                abort(413)
+    # Middleware de segurança (IP bloqueado e tamanho do conteúdo)
+    from app.security import registrar_middleware
+    registrar_middleware(app)
 
     # Headers de segurança adicionais
     @app.after_request
@@ -114,4 +132,22 @@ def create_app(config_class=Config):
     app.register_blueprint(auth.auth)
     app.register_blueprint(investimentos.investimentos_bp)
 
+    # Atualizador de cotações em segundo plano: iniciado na primeira requisição
+    # de cada processo (não roda em comandos de CLI nem em testes)
+    if app.config.get('COTACOES_ATUALIZADOR_AUTOMATICO'):
+        @app.before_request
+        def iniciar_atualizador_cotacoes():
+            if not app.testing:
+                from app.services.atualizador_cotacoes import iniciar_atualizador
+                iniciar_atualizador(app)
+
+    # Em debug, avisa sobre relacionamentos carregados sob demanda nos templates
+    # (registrada sempre: app.run(debug=True) ativa o debug depois de create_app)
+    from app.carregamento import registrar_guarda
+    registrar_guarda(app)
+
+    # Registrar comandos de CLI
+    from app.commands import registrar_comandos
+    registrar_comandos(app)
+
     return app
@@ -0,0 +1,120 @@
+"""
+Perfis de carregamento dos relacionamentos nas listagens
+
+Os relacionamentos dos modelos continuam lazy=True (carregados sob demanda);
+cada listagem aplica o perfil correspondente com
+query.options(*perfil('transacoes')), para que os acessos feitos no template
+(transacao.categoria.nome, fatura.cartao.nome, ...) não gerem um SELECT por
+linha.
+
+Relacionamentos muitos-para-um usam joinedload (no mesmo SELECT) e coleções
+usam selectinload (um SELECT extra para todas as linhas).
+
+Em modo debug, a guarda registrada por registrar_guarda(app) avisa quando
+algum relacionamento é carregado sob demanda durante a renderização de um
+template (CARGA_SOB_DEMANDA_EM_TEMPLATES = 'log', 'raise' ou 'off'). O modo
+debug é conferido a cada renderização, não em create_app: `python run.py`
+só o ativa depois, em app.run(debug=True).
+"""
+from flask import before_render_template, template_rendered, current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, configure_mappers, joinedload, selectinload
+
+from app.models import (
+    Transacao, Fatura, ConciliacaoBancaria, ItemConciliacao, Orcamento, Meta, Ativo
+)
+
+
+# Os backrefs (Transacao.conta, Fatura.cartao, Ativo.tipo, ...) só existem após a configuração dos mappers
+configure_mappers()
+
+PERFIS = {
+    # Listagens de transações (listar, dashboard, faturas, relatórios)
+    'transacoes': (
+        joinedload(Transacao.conta),
+        joinedload(Transacao.categoria),
+    ),
+    'faturas': (
+        joinedload(Fatura.cartao),
+    ),
+    'conciliacoes': (
+        joinedload(ConciliacaoBancaria.conta),
+    ),
+    'itens_conciliacao': (
+        joinedload(ItemConciliacao.transacao),
+        joinedload(ItemConciliacao.categoria_sugerida),
+    ),
+    'orcamentos': (
+        joinedload(Orcamento.categoria),
+    ),
+    'metas': (
+        joinedload(Meta.conta),
+        selectinload(Meta.depositos),
+    ),
+    'ativos': (
+        joinedload(Ativo.tipo),
+    ),
+}
+
+
+class CargaSobDemandaError(RuntimeError):
+    """Relacionamento carregado sob demanda durante a renderização (modo 'raise')"""
+
+
+def perfil(nome):
+    """
+    Opções de carregamento de um perfil
+
+    Args:
+        nome: chave de PERFIS
+
+    Returns:
+        tuple: opções para query.options(*perfil(nome))
+    """
+    return PERFIS[nome]
+
+
+def _inicio_renderizacao(sender, template, context, **extra):
+    if not sender.debug:
+        return
+    g.templates_em_renderizacao = getattr(g, 'templates_em_renderizacao', ()) + (template.name or '<string>',)
+
+
+def _fim_renderizacao(sender, template, context, **extra):
+    if not sender.debug:
+        return
+    g.templates_em_renderizacao = getattr(g, 'templates_em_renderizacao', ())[:-1]
+
+
+def _verificar_carga(estado):
+    """Listener do do_orm_execute: detecta cargas sob demanda durante a renderização"""
+    if not estado.is_select or estado.lazy_loaded_from is None or not has_app_context():
+        return
+    if not current_app.debug or not current_app.extensions.get('guarda_carga_sob_demanda'):
+        return
+
+    templates = g.get('templates_em_renderizacao')
+    modo = current_app.config.get('CARGA_SOB_DEMANDA_EM_TEMPLATES', 'log')
+    if not templates or modo not in ('log', 'raise'):
+        return
+
+    relacionamento = estado.loader_strategy_path[-1]
+    mensagem = f'Carga sob demanda de {relacionamento} ao renderizar {templates[-1]} (use um perfil de app/carregamento.py)'
+    if modo == 'raise':
+        raise CargaSobDemandaError(mensagem)
+    current_app.logger.warning(mensagem)
+
+
+def registrar_guarda(app):
+    """
+    Ativa a verificação de cargas sob demanda nos templates da aplicação
+
+    Args:
+        app: aplicação Flask (chamado em create_app; só atua com app.debug ativo)
+    """
+    app.extensions['guarda_carga_sob_demanda'] = True
+    before_render_template.connect(_inicio_renderizacao, app)
+    template_rendered.connect(_fim_renderizacao, app)
+
+    if not event.contains(Session, 'do_orm_execute', _verificar_carga):
+        event.listen(Session, 'do_orm_execute', _verificar_carga)
@@ -0,0 +1,308 @@
+"""
+Comandos de linha de comando da aplicação (flask <comando>)
+"""
+import json
+import time
+from datetime import date, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from app.models import (
+    db, User, Conta, Transacao, CartaoCredito, Fatura, Orcamento, ResumoMensal, IndiceCategoria, ItemConciliacao,
+    SaldoDiario
+)
+
+
+def _consultas_criticas(user_id, conta_id, cartao_id, fatura_id):
+    """
+    Consultas mais executadas pela aplicação, montadas como nas rotas
+
+    Returns:
+        list: tuplas (nome, statement)
+    """
+    hoje = date.today()
+    inicio_mes = hoje.replace(day=1)
+    fim_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    consultas = [
+        ('dashboard: transações do mês', Transacao.query.filter(
+            Transacao.user_id == user_id,
+            Transacao.data >= inicio_mes,
+            Transacao.data <= fim_mes
+        ).order_by(Transacao.data)),
+        ('listagem de transações (página 1)', Transacao.query.filter(
+            Transacao.user_id == user_id,
+            Transacao.data >= inicio_mes,
+            Transacao.data <= fim_mes
+        ).order_by(Transacao.data.desc(), Transacao.id.desc()).limit(51)),
+        ('orçamentos: gasto por categoria', Orcamento.consulta_gastos(user_id, hoje.month, hoje.year)),
+        ('conciliação: candidatos ao matching', Transacao.query.filter(
+            Transacao.conta_id == conta_id,
+            Transacao.data >= inicio_mes - timedelta(days=7),
+            Transacao.data <= fim_mes + timedelta(days=7),
+            Transacao.tipo.in_(['despesa', 'receita'])
+        )),
+        ('conciliação: candidatos já vinculados', db.session.query(ItemConciliacao.transacao_id).filter(
+            ItemConciliacao.transacao_id.in_([1, 2, 3])
+        ).distinct()),
+        ('fatura: transações vinculadas', Transacao.query.filter_by(fatura_id=fatura_id)),
+        ('cartões: gasto dos últimos 6 meses', Transacao.query.filter(
+            Transacao.cartao_credito_id == cartao_id,
+            Transacao.data >= hoje - timedelta(days=180)
+        )),
+        ('evolução patrimonial: saldos diários', SaldoDiario.query.filter(
+            SaldoDiario.user_id == user_id,
+            SaldoDiario.data >= hoje - timedelta(days=365),
+            SaldoDiario.data <= hoje
+        )),
+        ('recorrências: parcelas geradas', Transacao.query.filter_by(transacao_recorrente_pai_id=0)),
+        ('faturas pendentes do usuário', Fatura.query.join(CartaoCredito).filter(
+            CartaoCredito.user_id == user_id,
+            Fatura.status.in_(['aberta', 'fechada'])
+        )),
+    ]
+
+    return [(nome, consulta.statement) for nome, consulta in consultas]
+
+
+def _varreduras_postgres(no):
+    """Percorre o plano JSON do PostgreSQL e retorna as tabelas com Seq Scan"""
+    tabelas = []
+    if no.get('Node Type') == 'Seq Scan':
+        tabelas.append(no.get('Relation Name'))
+    for filho in no.get('Plans', []):
+        tabelas.extend(_varreduras_postgres(filho))
+    return tabelas
+
+
+def explicar_consulta(conexao, statement):
+    """
+    Executa EXPLAIN em uma consulta e identifica varreduras sequenciais
+
+    Args:
+        conexao: conexão SQLAlchemy
+        statement: consulta (select) a ser analisada
+
+    Returns:
+        list: nomes das tabelas lidas por varredura sequencial
+    """
+    compilado = statement.compile(dialect=conexao.dialect, compile_kwargs={'render_postcompile': True})
+    parametros = compilado.params
+    if compilado.positional:
+        parametros = tuple(compilado.params[nome] for nome in compilado.positiontup)
+
+    if conexao.dialect.name == 'postgresql':
+        plano = conexao.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compilado}', parametros).scalar()
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return _varreduras_postgres(plano[0]['Plan'])
+
+    if conexao.dialect.name == 'sqlite':
+        linhas = conexao.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilado}', parametros).all()
+        return [
+            linha[-1].split()[1] for linha in linhas
+            if linha[-1].startswith('SCAN ') and ' USING ' not in linha[-1]
+        ]
+
+    raise click.ClickException(f'Banco {conexao.dialect.name} não suportado pelo db-advise')
+
+
+@click.command('db-advise')
+@click.option('--user-id', type=int, default=None,
+              help='Usuário usado como exemplo nas consultas (padrão: o primeiro cadastrado)')
+@click.option('--strict', is_flag=True,
+              help='Termina com código de erro se alguma consulta fizer varredura sequencial')
+@with_appcontext
+def db_advise_command(user_id, strict):
+    """Executa EXPLAIN nas consultas críticas e aponta varreduras sequenciais"""
+    usuario = db.session.get(User, user_id) if user_id else User.query.order_by(User.id).first()
+    if not usuario:
+        raise click.ClickException('Nenhum usuário encontrado para montar as consultas')
+
+    conta = Conta.query.filter_by(user_id=usuario.id).first()
+    cartao = CartaoCredito.query.filter_by(user_id=usuario.id).first()
+    fatura = Fatura.query.filter_by(cartao_id=cartao.id).first() if cartao else None
+
+    consultas = _consultas_criticas(
+        usuario.id,
+        conta.id if conta else 0,
+        cartao.id if cartao else 0,
+        fatura.id if fatura else 0
+    )
+
+    com_varredura = 0
+    conexao = db.session.connection()
+    for nome, statement in consultas:
+        tabelas = explicar_consulta(conexao, statement)
+        if tabelas:
+            com_varredura += 1
+            click.secho(f'[SEQ SCAN] {nome}: {", ".join(sorted(set(tabelas)))}', fg='yellow')
+        else:
+            click.secho(f'[OK]       {nome}', fg='green')
+
+    click.echo(f'\n{com_varredura} de {len(consultas)} consultas com varredura sequencial')
+    if com_varredura:
+        click.echo('Obs.: em tabelas pequenas o planejador pode preferir Seq Scan mesmo com índice disponível.')
+
+    if strict and com_varredura:
+        raise SystemExit(1)
+
+
+@click.command('resumo-rebuild')
+@click.option('--user-id', type=int, default=None,
+              help='Reconstrói apenas o resumo deste usuário (padrão: todos)')
+@with_appcontext
+def resumo_rebuild_command(user_id):
+    """Recalcula a tabela resumo_mensal a partir das transações"""
+    linhas = ResumoMensal.reconstruir(user_id)
+    db.session.commit()
+
+    alvo = f'usuário {user_id}' if user_id else 'todos os usuários'
+    click.echo(f'Resumo mensal reconstruído para {alvo}: {linhas} linhas')
+
+
+@click.command('indice-categorias-rebuild')
+@click.option('--user-id', type=int, default=None,
+              help='Reconstrói apenas o índice deste usuário (padrão: todos)')
+@with_appcontext
+def indice_categorias_rebuild_command(user_id):
+    """Recalcula o índice de sugestão de categorias a partir das transações"""
+    linhas = IndiceCategoria.reconstruir(user_id)
+    db.session.commit()
+
+    alvo = f'usuário {user_id}' if user_id else 'todos os usuários'
+    click.echo(f'Índice de categorias reconstruído para {alvo}: {linhas} termos')
+
+
+@click.command('saldos-rebuild')
+@click.option('--user-id', type=int, default=None,
+              help='Reconstrói apenas os saldos das contas deste usuário (padrão: todos)')
+@with_appcontext
+def saldos_rebuild_command(user_id):
+    """Recalcula os saldos diários das contas a partir das transações pagas"""
+    linhas = SaldoDiario.reconstruir(user_id)
+    db.session.commit()
+
+    alvo = f'usuário {user_id}' if user_id else 'todos os usuários'
+    click.echo(f'Saldos diários reconstruídos para {alvo}: {linhas} linhas')
+
+
+@click.command('saldos-verificar')
+@click.option('--user-id', type=int, default=None,
+              help='Verifica apenas as contas deste usuário (padrão: todas)')
+@click.option('--corrigir', is_flag=True,
+              help='Grava o saldo calculado (checkpoint do dia) em todas as contas verificadas')
+@with_appcontext
+def saldos_verificar_command(user_id, corrigir):
+    """Compara o saldo das contas com o extrato de transações pagas (--corrigir grava o checkpoint do dia)"""
+    divergentes = Conta.verificar_saldos(user_id)
+    for conta_id, registrado, calculado in divergentes:
+        click.secho(f'[DIVERGENTE] conta {conta_id}: registrado {registrado}, calculado {calculado}', fg='yellow')
+
+    click.echo(f'{len(divergentes)} contas com saldo divergente')
+
+    if corrigir:
+        conta_ids = None
+        if user_id is not None:
+            conta_ids = [conta_id for (conta_id,) in db.session.query(Conta.id).filter_by(user_id=user_id)]
+        atualizadas = Conta.atualizar_checkpoints(db.session.connection(), conta_ids)
+        db.session.commit()
+        click.echo(f'Checkpoint de saldo gravado em {atualizadas} contas')
+
+
+@click.command('cotacoes-worker')
+@click.option('--uma-vez', is_flag=True, help='Executa um único ciclo e termina')
+@with_appcontext
+def cotacoes_worker_command(uma_vez):
+    """Mantém o cache de cotações atualizado (processo dedicado)"""
+    from flask import current_app
+    from app.services.atualizador_cotacoes import AtualizadorCotacoes, executar_ciclo
+
+    if uma_vez:
+        stats = executar_ciclo()
+        click.echo(
+            f"{stats['atualizados']} tickers buscados, {stats['cache']} em cache, "
+            f"{stats['erros']} erros, {stats['ativos']} ativos atualizados"
+        )
+        return
+
+    app = current_app._get_current_object()
+    atualizador = AtualizadorCotacoes(app, app.config.get('COTACOES_INTERVALO_SEGUNDOS', 300))
+    click.echo(f'Atualizando cotações a cada {atualizador.intervalo}s (Ctrl+C para sair)')
+    try:
+        atualizador.run()
+    except KeyboardInterrupt:
+        atualizador.parar()
+
+
+@click.command('conciliacao-worker')
+@click.option('--workers', type=int, default=None,
+              help='Conciliações processadas em paralelo (padrão: CONCILIACAO_WORKERS ou 2)')
+@click.option('--intervalo', type=float, default=2.0, show_default=True,
+              help='Segundos entre consultas à fila quando não há trabalho')
+@click.option('--uma-vez', is_flag=True, help='Processa a fila atual e termina')
+@with_appcontext
+def conciliacao_worker_command(workers, intervalo, uma_vez):
+    """Processa as conciliações bancárias enviadas (processo dedicado)"""
+    from flask import current_app
+    from app.services.conciliacao_jobs import executar_pendentes
+
+    workers = workers or current_app.config.get('CONCILIACAO_WORKERS') or 2
+
+    if uma_vez:
+        click.echo(f'{executar_pendentes(workers)} conciliações processadas')
+        return
+
+    click.echo(f'Processando conciliações com {workers} workers (Ctrl+C para sair)')
+    try:
+        while True:
+            if not executar_pendentes(workers):
+                time.sleep(intervalo)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command('seguranca-benchmark')
+@click.option('--requisicoes', type=int, default=5000, show_default=True,
+              help='Requisições simuladas por cenário')
+@with_appcontext
+def seguranca_benchmark_command(requisicoes):
+    """Mede o custo por requisição do middleware de segurança"""
+    from flask import current_app
+    from app.contadores import esta_bloqueado
+
+    app = current_app._get_current_object()
+    middleware = next(f for f in app.before_request_funcs[None] if f.__name__ == 'verificar_requisicao')
+    armazenamento = app.extensions['contadores_seguranca']
+    ip = {'REMOTE_ADDR': '192.0.2.1'}
+
+    cenarios = [
+        ('página (middleware)', '/login', middleware),
+        ('arquivo estático (middleware)', '/static/css/style.css', middleware),
+        # O que cada requisição custava antes do cache local de bloqueios
+        ('consulta de bloqueio sem cache', '/login', lambda: esta_bloqueado(armazenamento, ip['REMOTE_ADDR'])),
+    ]
+
+    click.echo(f"Armazenamento: {app.config['SEGURANCA_STORAGE_URL']}, {requisicoes} requisições por cenário")
+    for nome, caminho, funcao in cenarios:
+        total = 0.0
+        for _ in range(requisicoes):
+            # Um contexto novo por requisição: nada fica em cache no request
+            with app.test_request_context(caminho, environ_base=ip):
+                inicio = time.perf_counter()
+                funcao()
+                total += time.perf_counter() - inicio
+        click.echo(f'{nome:32s} {total / requisicoes * 1e6:8.1f} µs/requisição')
+
+
+def registrar_comandos(app):
+    """Registra os comandos de CLI na aplicação"""
+    app.cli.add_command(db_advise_command)
+    app.cli.add_command(resumo_rebuild_command)
+    app.cli.add_command(indice_categorias_rebuild_command)
+    app.cli.add_command(saldos_rebuild_command)
+    app.cli.add_command(saldos_verificar_command)
+    app.cli.add_command(cotacoes_worker_command)
+    app.cli.add_command(conciliacao_worker_command)
+    app.cli.add_command(seguranca_benchmark_command)
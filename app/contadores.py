@@ -0,0 +1,218 @@
+"""
+Contadores com expiração para tentativas de login e bloqueios de IP
+
+Os dados ficam em um armazenamento compartilhado entre os workers do
+gunicorn, escolhido por SEGURANCA_STORAGE_URL:
+
+- database:// (padrão sem REDIS_URL): tabela contadores_seguranca no banco
+  da aplicação
+- memory://: dicionário do próprio processo, com expiração e limite de chaves
+  (cada worker tem sua visão; apenas para desenvolvimento)
+- redis://, memcached://, ...: qualquer URL da biblioteca limits, a mesma
+  usada pelo Flask-Limiter em RATELIMIT_STORAGE_URL (requer o driver)
+
+Todos os armazenamentos oferecem incr/get de contadores que expiram; a
+janela deslizante e os bloqueios são montados sobre eles, com custo O(1) por
+operação. A verificação de bloqueio feita a cada requisição passa por
+CacheBloqueios, que guarda o resultado no processo por
+BLOQUEIO_CACHE_SEGUNDOS.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, select, update
+
+from app.models import db, ContadorSeguranca, _insert_com_conflito
+
+
+class ContadorMemoria:
+    """
+    Contadores em memória com expiração (um por processo)
+
+    As chaves vencidas são descartadas na leitura e em varreduras periódicas;
+    ao atingir max_chaves, as que vencem primeiro são removidas.
+    """
+
+    INTERVALO_LIMPEZA = 60  # segundos entre varreduras das chaves vencidas
+
+    def __init__(self, max_chaves=10000):
+        self.max_chaves = max_chaves
+        self._valores = {}  # chave -> [valor, expira_em (time.monotonic)]
+        self._lock = threading.Lock()
+        self._proxima_limpeza = time.monotonic() + self.INTERVALO_LIMPEZA
+
+    def _limpar(self, agora):
+        vencidas = [chave for chave, (_, expira_em) in self._valores.items() if expira_em <= agora]
+        for chave in vencidas:
+            del self._valores[chave]
+
+        # Cheio: remove de uma vez 10% das chaves (as que vencem primeiro),
+        # para não ordenar a cada nova chave
+        if len(self._valores) >= self.max_chaves:
+            excesso = len(self._valores) - self.max_chaves * 9 // 10
+            for chave in sorted(self._valores, key=lambda c: self._valores[c][1])[:excesso]:
+                del self._valores[chave]
+
+        self._proxima_limpeza = agora + self.INTERVALO_LIMPEZA
+
+    def incr(self, chave, expiracao):
+        agora = time.monotonic()
+        with self._lock:
+            if agora >= self._proxima_limpeza or len(self._valores) >= self.max_chaves:
+                self._limpar(agora)
+
+            item = self._valores.get(chave)
+            if item is None or item[1] <= agora:
+                item = self._valores[chave] = [0, agora + expiracao]
+            item[0] += 1
+            return item[0]
+
+    def get(self, chave):
+        item = self._valores.get(chave)
+        if item is None or item[1] <= time.monotonic():
+            return 0
+        return item[0]
+
+
+class ContadorLimits:
+    """Contadores em um storage da biblioteca limits (Redis, Memcached, ...)"""
+
+    def __init__(self, url):
+        from limits.storage import storage_from_string
+        self._storage = storage_from_string(url)
+
+    def incr(self, chave, expiracao):
+        return self._storage.incr(chave, expiracao)
+
+    def get(self, chave):
+        return self._storage.get(chave)
+
+
+class ContadorBanco:
+    """
+    Contadores na tabela contadores_seguranca
+
+    Cada incremento roda em uma transação própria (independente da sessão da
+    requisição), com upsert atômico no PostgreSQL e no SQLite.
+    """
+
+    def incr(self, chave, expiracao):
+        agora = datetime.utcnow()
+        expira_em = agora + timedelta(seconds=expiracao)
+        tabela = ContadorSeguranca.__table__
+
+        with db.engine.begin() as conexao:
+            conexao.execute(delete(tabela).where(tabela.c.expira_em <= agora))
+
+            insert = _insert_com_conflito(conexao)
+            if insert is not None:
+                stmt = insert(tabela).values(chave=chave, valor=1, expira_em=expira_em)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['chave'],
+                    set_={'valor': tabela.c.valor + 1}
+                ).returning(tabela.c.valor)
+                return conexao.execute(stmt).scalar_one()
+
+            # Outros bancos: UPDATE e, se a linha não existir, INSERT
+            resultado = conexao.execute(
+                update(tabela).where(tabela.c.chave == chave).values(valor=tabela.c.valor + 1)
+            )
+            if resultado.rowcount == 0:
+                conexao.execute(tabela.insert().values(chave=chave, valor=1, expira_em=expira_em))
+            return conexao.execute(select(tabela.c.valor).where(tabela.c.chave == chave)).scalar_one()
+
+    def get(self, chave):
+        tabela = ContadorSeguranca.__table__
+        with db.engine.connect() as conexao:
+            valor = conexao.execute(
+                select(case((tabela.c.expira_em > datetime.utcnow(), tabela.c.valor), else_=0))
+                .where(tabela.c.chave == chave)
+            ).scalar()
+        return valor or 0
+
+
+def criar_armazenamento(url):
+    """
+    Cria o armazenamento de contadores a partir da URL
+
+    Args:
+        url: 'database://', 'memory://' ou URL de storage da biblioteca limits
+
+    Returns:
+        objeto com os métodos incr(chave, expiracao) e get(chave)
+    """
+    if url == 'database://':
+        return ContadorBanco()
+    if url == 'memory://':
+        return ContadorMemoria()
+    return ContadorLimits(url)
+
+
+def contar_na_janela(armazenamento, chave, janela):
+    """
+    Registra um evento e estima quantos ocorreram nos últimos `janela` segundos
+
+    Janela deslizante aproximada: dois contadores de janela fixa (a atual e a
+    anterior), com o da anterior ponderado pela parte dela que ainda está
+    dentro da janela deslizante.
+
+    Args:
+        armazenamento: armazenamento de contadores
+        chave: identificador do evento (ex.: 'login/<ip>')
+        janela: tamanho da janela em segundos
+
+    Returns:
+        int: eventos estimados na janela, incluindo o atual
+    """
+    agora = time.time()
+    indice = int(agora // janela)
+
+    atual = armazenamento.incr(f'{chave}/{indice}', janela * 2)
+    anterior = armazenamento.get(f'{chave}/{indice - 1}')
+    decorrido = (agora % janela) / janela
+
+    return atual + int(anterior * (1 - decorrido))
+
+
+def bloquear(armazenamento, chave, segundos):
+    """Marca a chave como bloqueada por `segundos` (um novo bloqueio não estende o atual)"""
+    armazenamento.incr(f'bloqueio/{chave}', segundos)
+
+
+def esta_bloqueado(armazenamento, chave):
+    """Verifica se a chave tem bloqueio vigente"""
+    return armazenamento.get(f'bloqueio/{chave}') > 0
+
+
+class CacheBloqueios:
+    """
+    Resultado de esta_bloqueado por chave, guardado no processo por alguns segundos
+
+    Evita uma consulta ao armazenamento compartilhado a cada requisição. Um
+    bloqueio feito por outro worker é percebido em até `segundos`; os feitos
+    pelo próprio processo valem na hora.
+    """
+
+    def __init__(self, armazenamento, segundos, max_chaves=10000):
+        self.armazenamento = armazenamento
+        self.segundos = segundos
+        self.max_chaves = max_chaves
+        self._itens = {}  # chave -> (bloqueado, valido_ate (time.monotonic))
+
+    def bloqueado(self, chave):
+        agora = time.monotonic()
+        item = self._itens.get(chave)
+        if item is not None and item[1] > agora:
+            return item[0]
+
+        resultado = esta_bloqueado(self.armazenamento, chave)
+        if self.segundos > 0:
+            if len(self._itens) >= self.max_chaves:
+                self._itens.clear()
+            self._itens[chave] = (resultado, agora + self.segundos)
+        return resultado
+
+    def bloquear(self, chave, segundos):
+        bloquear(self.armazenamento, chave, segundos)
+        self._itens[chave] = (True, time.monotonic() + min(segundos, self.segundos))
@@ -4,6 +4,7 @@ Blueprint de rotas para módulo de Investimentos
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from app.models import db, Ativo, TipoAtivo, TransacaoAtivo, Dividendo
+from app.carregamento import perfil
 from app.services.brapi_service import brapi_service
 from datetime import datetime, date
 from decimal import Decimal
@@ -16,11 +17,11 @@ investimentos_bp = Blueprint('investimentos', __name__, url_prefix='/investiment
 @login_required
 def index():
     """Dashboard principal de investimentos"""
-    ativos = Ativo.query.filter_by(user_id=current_user.id, ativo=True).all()
+    ativos = Ativo.query.options(*perfil('ativos')).filter_by(user_id=current_user.id, ativo=True).all()
 
-    # Atualizar cotações se necessário
+    # Cotações mantidas pelo atualizador em segundo plano
     if ativos:
-        brapi_service.atualizar_carteira(ativos)
+        brapi_service.aplicar_cache(ativos)
 
     # Calcular estatísticas
     stats = calcular_estatisticas_carteira(ativos)
@@ -162,7 +163,7 @@ def excluir(ativo_id):
 @login_required
 def transacoes(ativo_id):
     """Ver histórico de transações de um ativo"""
-    ativo = Ativo.query.get_or_404(ativo_id)
+    ativo = Ativo.query.options(*perfil('ativos')).get_or_404(ativo_id)
 
     # Verificar permissão
     if ativo.user_id != current_user.id:
@@ -291,10 +292,10 @@ def relatorios():
 @login_required
 def api_grafico_distribuicao_tipos():
     """API: Distribuição da carteira por tipo de ativo"""
-    ativos = Ativo.query.filter_by(user_id=current_user.id, ativo=True).all()
+    ativos = Ativo.query.options(*perfil('ativos')).filter_by(user_id=current_user.id, ativo=True).all()
 
-    # Atualizar cotações se necessário
-    brapi_service.atualizar_carteira(ativos)
+    # Cotações mantidas pelo atualizador em segundo plano
+    brapi_service.aplicar_cache(ativos)
 
     # Agrupar por tipo
     distribuicao = {}
@@ -319,8 +320,8 @@ def api_grafico_rentabilidade_ativos():
     """API: Rentabilidade individual de cada ativo"""
     ativos = Ativo.query.filter_by(user_id=current_user.id, ativo=True).all()
 
-    # Atualizar cotações se necessário
-    brapi_service.atualizar_carteira(ativos)
+    # Cotações mantidas pelo atualizador em segundo plano
+    brapi_service.aplicar_cache(ativos)
 
     dados = []
     for ativo in ativos:
@@ -343,8 +344,8 @@ def api_grafico_composicao_carteira():
     """API: Composição da carteira por ativo (top 10)"""
     ativos = Ativo.query.filter_by(user_id=current_user.id, ativo=True).all()
 
-    # Atualizar cotações se necessário
-    brapi_service.atualizar_carteira(ativos)
+    # Cotações mantidas pelo atualizador em segundo plano
+    brapi_service.aplicar_cache(ativos)
 
     # Calcular valor atual de cada ativo
     dados = []
@@ -423,10 +424,10 @@ def api_evolucao_patrimonial():
 @login_required
 def api_resumo_estatisticas():
     """API: Resumo de estatísticas gerais"""
-    ativos = Ativo.query.filter_by(user_id=current_user.id, ativo=True).all()
+    ativos = Ativo.query.options(*perfil('ativos')).filter_by(user_id=current_user.id, ativo=True).all()
 
-    # Atualizar cotações
-    brapi_service.atualizar_carteira(ativos)
+    # Cotações mantidas pelo atualizador em segundo plano
+    brapi_service.aplicar_cache(ativos)
 
     stats = calcular_estatisticas_carteira(ativos)
 
@@ -1,10 +1,19 @@
 """
 Módulo para matching inteligente de transações
 """
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from datetime import timedelta
 from decimal import Decimal
-from fuzzywuzzy import fuzz
-from app.models import Transacao, Categoria
+import numpy as np
+from fuzzywuzzy import fuzz, utils as fuzz_utils
+from rapidfuzz import process as rf_process
+from rapidfuzz.distance import Indel
+from app.models import db, Transacao, Categoria, IndiceCategoria, ItemConciliacao, TAMANHO_LOTE
+
+
+# Janela (em dias) em torno da data do extrato para buscar transações candidatas
+JANELA_MATCHING_DIAS = 7
 
 
 def calcular_score_matching(item_extrato, transacao):
@@ -52,41 +61,222 @@ def calcular_score_matching(item_extrato, transacao):
     return int(min(score, max_score))
 
 
-def encontrar_matches(item_extrato, conta_id, user_id, threshold=60):
+def preparar_descricao(descricao):
     """
-    Encontra possíveis matches para um item do extrato
+    Normaliza uma descrição como o fuzz.token_sort_ratio faz internamente
+
+    Minúsculas, apenas ASCII, letras e números, palavras em ordem alfabética.
+    Feito uma vez por descrição, e não a cada par comparado.
+
+    Returns:
+        str: descrição pronta para calcular_scores_matching
+    """
+    palavras = fuzz_utils.full_process(descricao.lower(), force_ascii=True).split()
+    return ' '.join(sorted(palavras)).strip()
+
+
+class CandidatosMatching:
+    """
+    Transações candidatas de um tipo, ordenadas por data
+
+    Guarda as colunas usadas no score já convertidas (valores em float, datas
+    em dias e descrições normalizadas) para o cálculo em lote.
+    """
+
+    def __init__(self, transacoes):
+        self.transacoes = transacoes
+        self.datas = [t.data for t in transacoes]
+        self.valores = np.array([float(t.valor) for t in transacoes], dtype=np.float64)
+        self.dias = np.array([t.data.toordinal() for t in transacoes], dtype=np.int64)
+        self.descricoes = [preparar_descricao(t.descricao) for t in transacoes]
+
+    def janela(self, data):
+        """
+        Posições das transações a até JANELA_MATCHING_DIAS da data (busca binária)
+
+        Returns:
+            tuple: (inicio, fim) para fatiar as colunas
+        """
+        janela = timedelta(days=JANELA_MATCHING_DIAS)
+        return bisect_left(self.datas, data - janela), bisect_right(self.datas, data + janela)
+
+
+def calcular_scores_matching(item_extrato, valores, dias, descricoes, descricao_item=None):
+    """
+    Calcula de uma vez o score entre um item do extrato e várias transações
+
+    Mesmos critérios e mesmo resultado de calcular_score_matching, com valor e
+    data comparados em arrays e a descrição comparada em lote (rapidfuzz).
 
     Args:
         item_extrato: dict com dados do item do extrato
+        valores: array com os valores das transações
+        dias: array com as datas das transações (date.toordinal())
+        descricoes: descrições das transações já passadas por preparar_descricao
+        descricao_item: descrição do item já preparada (opcional)
+
+    Returns:
+        numpy.ndarray: scores inteiros de 0 a 100, na ordem das transações
+    """
+    if not len(valores):
+        return np.zeros(0, dtype=np.int64)
+
+    # 1. Comparação de valor (40 pontos)
+    diferenca = np.abs(float(item_extrato['valor']) - valores)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        proporcional = np.maximum(0, 40 - (diferenca / valores * 40))
+    score = np.where(diferenca < 0.01, 40.0, np.nan_to_num(proporcional, nan=0.0))
+
+    # 2. Comparação de data (30 pontos)
+    diferenca_dias = np.abs(item_extrato['data'].toordinal() - dias)
+    score = score + np.select(
+        [diferenca_dias == 0, diferenca_dias <= 1, diferenca_dias <= 3, diferenca_dias <= 7],
+        [30, 25, 20, 10],
+        default=0
+    )
+
+    # 3. Comparação de descrição (30 pontos), arredondada como no fuzzywuzzy
+    if descricao_item is None:
+        descricao_item = preparar_descricao(item_extrato['descricao'])
+    similaridade = rf_process.cdist(
+        [descricao_item], descricoes, scorer=Indel.normalized_similarity, dtype=np.float64
+    )[0]
+    score = score + np.round(100 * similaridade) / 100 * 30
+
+    return np.minimum(score, 100).astype(np.int64)
+
+
+def carregar_candidatos(itens_extrato, conta_id):
+    """
+    Carrega em uma única consulta as transações candidatas de todo o extrato
+
+    Busca as transações da conta no período do extrato (±JANELA_MATCHING_DIAS),
+    descarta as já vinculadas a itens de conciliação e as indexa por tipo,
+    ordenadas por data, para que a janela de cada item seja encontrada com bisect.
+
+    Args:
+        itens_extrato: lista de dicts com itens do extrato
         conta_id: ID da conta
-        user_id: ID do usuário
-        threshold: score mínimo para considerar match (padrão: 60)
 
     Returns:
-        list: lista de tuplas (transacao, score) ordenada por score descendente
+        dict: {tipo: CandidatosMatching}
     """
-    # Buscar transações em uma janela de ±7 dias
-    data_inicio = item_extrato['data'] - timedelta(days=7)
-    data_fim = item_extrato['data'] + timedelta(days=7)
+    if not itens_extrato:
+        return {}
+
+    janela = timedelta(days=JANELA_MATCHING_DIAS)
+    data_inicio = min(item['data'] for item in itens_extrato) - janela
+    data_fim = max(item['data'] for item in itens_extrato) + janela
+    tipos = {item['tipo'] for item in itens_extrato}
 
-    # Buscar transações não conciliadas na conta
-    transacoes = Transacao.query.join(
-        Transacao.conta
-    ).filter(
+    transacoes = Transacao.query.filter(
         Transacao.conta_id == conta_id,
         Transacao.data >= data_inicio,
         Transacao.data <= data_fim,
-        Transacao.tipo == item_extrato['tipo'],
-        # Apenas transações que ainda não foram conciliadas
-        ~Transacao.itens_conciliacao.any()
-    ).all()
+        Transacao.tipo.in_(tipos)
+    ).order_by(Transacao.data, Transacao.id).all()
 
-    # Calcular score para cada transação
-    matches = []
+    # Apenas transações que ainda não foram conciliadas
+    vinculadas = transacoes_vinculadas([t.id for t in transacoes])
+
+    por_tipo = defaultdict(list)
     for transacao in transacoes:
-        score = calcular_score_matching(item_extrato, transacao)
-        if score >= threshold:
-            matches.append((transacao, score))
+        if transacao.id not in vinculadas:
+            por_tipo[transacao.tipo].append(transacao)
+
+    return {tipo: CandidatosMatching(lista) for tipo, lista in por_tipo.items()}
+
+
+def transacoes_vinculadas(transacao_ids):
+    """
+    Filtra as transações que já estão vinculadas a algum item de conciliação
+
+    Args:
+        transacao_ids: IDs das transações candidatas
+
+    Returns:
+        set: IDs já vinculados
+    """
+    vinculadas = set()
+    for inicio in range(0, len(transacao_ids), TAMANHO_LOTE):
+        lote = transacao_ids[inicio:inicio + TAMANHO_LOTE]
+        vinculadas.update(
+            transacao_id for (transacao_id,) in
+            db.session.query(ItemConciliacao.transacao_id)
+            .filter(ItemConciliacao.transacao_id.in_(lote))
+            .distinct()
+        )
+    return vinculadas
+
+
+def atribuir_matches(matches_por_item):
+    """
+    Escolhe o match de cada item considerando o extrato inteiro
+
+    Cada transação é atribuída a no máximo um item. Guloso pelo score no grafo
+    bipartido (esparso) item × transação: os pares mais fortes são fixados
+    primeiro; em caso de empate vence o item que aparece antes no extrato.
+
+    Args:
+        matches_por_item: para cada item, lista de (transacao, score) como
+            retornada por encontrar_matches
+
+    Returns:
+        list: (transacao, score) atribuído a cada item, ou None
+    """
+    arestas = sorted(
+        (-score, indice, posicao, transacao)
+        for indice, matches in enumerate(matches_por_item)
+        for posicao, (transacao, score) in enumerate(matches)
+    )
+
+    atribuidos = [None] * len(matches_por_item)
+    transacoes_usadas = set()
+    for negativo_score, indice, _, transacao in arestas:
+        if atribuidos[indice] is None and transacao.id not in transacoes_usadas:
+            atribuidos[indice] = (transacao, -negativo_score)
+            transacoes_usadas.add(transacao.id)
+
+    return atribuidos
+
+
+def encontrar_matches(item_extrato, conta_id, user_id, threshold=60, candidatos=None):
+    """
+    Encontra possíveis matches para um item do extrato
+
+    Args:
+        item_extrato: dict com dados do item do extrato
+        conta_id: ID da conta
+        user_id: ID do usuário
+        threshold: score mínimo para considerar match (padrão: 60)
+        candidatos: índice retornado por carregar_candidatos (se omitido, é carregado
+            apenas para este item)
+
+    Returns:
+        list: lista de tuplas (transacao, score) ordenada por score descendente
+    """
+    if candidatos is None:
+        candidatos = carregar_candidatos([item_extrato], conta_id)
+
+    grupo = candidatos.get(item_extrato['tipo'])
+    if grupo is None:
+        return []
+
+    # Transações na janela de ±7 dias (busca binária no índice por data)
+    inicio, fim = grupo.janela(item_extrato['data'])
+
+    # Calcular o score de todas as transações da janela de uma vez
+    scores = calcular_scores_matching(
+        item_extrato,
+        grupo.valores[inicio:fim],
+        grupo.dias[inicio:fim],
+        grupo.descricoes[inicio:fim]
+    )
+    matches = [
+        (grupo.transacoes[inicio + posicao], int(score))
+        for posicao, score in enumerate(scores)
+        if score >= threshold
+    ]
 
     # Ordenar por score descendente
     matches.sort(key=lambda x: x[1], reverse=True)
@@ -94,82 +284,201 @@ def encontrar_matches(item_extrato, conta_id, user_id, threshold=60):
     return matches
 
 
-def sugerir_categoria(item_extrato, user_id):
+class ClassificadorCategorias:
+    """
+    Sugestão de categorias a partir do índice persistido (IndiceCategoria)
+
+    Carregado uma vez por importação; cada sugestão é resolvida em memória:
+    1. descrição normalizada idêntica a uma já categorizada;
+    2. votação das palavras (ou, se nenhuma for conhecida, dos trigramas);
+    3. fuzzy matching apenas contra as descrições das categorias mais votadas.
+    """
+
+    CONFIANCA_MINIMA = 0.75  # Fração dos votos para aceitar sem fuzzy
+    SCORE_FUZZY_MINIMO = 70
+    CATEGORIAS_FUZZY = 3
+    DESCRICOES_POR_CATEGORIA = 20
+
+    def __init__(self, linhas, categorias):
+        """
+        Args:
+            linhas: tuplas (tipo, nivel, termo, categoria_id, frequencia) do índice
+            categorias: dict {id: Categoria}
+        """
+        self.categorias = categorias
+        self.termos = defaultdict(dict)
+        descricoes = defaultdict(list)
+
+        for tipo, nivel, termo, categoria_id, frequencia in linhas:
+            self.termos[(tipo, nivel, termo)][categoria_id] = frequencia
+            if nivel == 'descricao':
+                descricoes[(tipo, categoria_id)].append((frequencia, termo))
+
+        # Descrições mais frequentes de cada categoria (candidatas ao fuzzy)
+        self.descricoes = {
+            chave: [termo for _, termo in sorted(lista, reverse=True)[:self.DESCRICOES_POR_CATEGORIA]]
+            for chave, lista in descricoes.items()
+        }
+
+    @classmethod
+    def carregar(cls, user_id, tipos=None):
+        """
+        Carrega o índice do usuário em uma única consulta
+
+        Args:
+            user_id: ID do usuário
+            tipos: limita aos tipos informados (receita, despesa)
+
+        Returns:
+            ClassificadorCategorias
+        """
+        consulta = db.session.query(
+            IndiceCategoria.tipo,
+            IndiceCategoria.nivel,
+            IndiceCategoria.termo,
+            IndiceCategoria.categoria_id,
+            IndiceCategoria.frequencia
+        ).filter(
+            IndiceCategoria.user_id == user_id,
+            IndiceCategoria.frequencia > 0
+        )
+        if tipos:
+            consulta = consulta.filter(IndiceCategoria.tipo.in_(list(tipos)))
+
+        categorias = {c.id: c for c in Categoria.query.filter_by(user_id=user_id).all()}
+        return cls(consulta.all(), categorias)
+
+    def _votar(self, tipo, nivel, termos):
+        """Cada termo distribui um voto entre as categorias, proporcional à frequência"""
+        votos = defaultdict(float)
+        for termo in termos:
+            distribuicao = self.termos.get((tipo, nivel, termo))
+            if not distribuicao:
+                continue
+            total = sum(distribuicao.values())
+            for categoria_id, frequencia in distribuicao.items():
+                votos[categoria_id] += frequencia / total
+        return votos
+
+    def sugerir(self, descricao, tipo):
+        """
+        Sugere uma categoria para a descrição
+
+        Args:
+            descricao: descrição do item do extrato
+            tipo: receita ou despesa
+
+        Returns:
+            Categoria ou None
+        """
+        palavras = IndiceCategoria.normalizar(descricao)
+        if not palavras:
+            return None
+        texto = ' '.join(palavras)[:200]
+
+        # 1. Descrição idêntica
+        exata = self.termos.get((tipo, 'descricao', texto))
+        if exata:
+            return self.categorias.get(max(exata, key=exata.get))
+
+        # 2. Votação por palavras (trigramas como alternativa para palavras novas)
+        termos = set(palavras)
+        votos = self._votar(tipo, 'token', termos)
+        if not votos:
+            termos = IndiceCategoria.trigramas(palavras)
+            votos = self._votar(tipo, 'trigrama', termos)
+        if not votos:
+            return None
+
+        ranking = sorted(votos.items(), key=lambda kv: (-kv[1], kv[0]))
+        categoria_id, pontos = ranking[0]
+        if pontos / len(termos) >= self.CONFIANCA_MINIMA:
+            return self.categorias.get(categoria_id)
+
+        # 3. Fuzzy apenas contra as descrições das categorias mais votadas
+        melhor_categoria = None
+        melhor_score = 0
+        for categoria_id, _ in ranking[:self.CATEGORIAS_FUZZY]:
+            for candidata in self.descricoes.get((tipo, categoria_id), []):
+                score = fuzz.token_sort_ratio(texto, candidata)
+                if score > melhor_score:
+                    melhor_score = score
+                    melhor_categoria = categoria_id
+
+        if melhor_score >= self.SCORE_FUZZY_MINIMO:
+            return self.categorias.get(melhor_categoria)
+        return None
+
+
+def sugerir_categoria(item_extrato, user_id, classificador=None):
     """
     Sugere uma categoria para um item do extrato baseado em transações anteriores
 
     Args:
         item_extrato: dict com dados do item do extrato
         user_id: ID do usuário
+        classificador: ClassificadorCategorias já carregado (se omitido, é
+            carregado apenas para este item)
 
     Returns:
         Categoria ou None
     """
-    # Buscar transações com descrição similar
-    todas_transacoes = Transacao.query.join(
-        Transacao.conta
-    ).filter(
-        Transacao.conta.has(user_id=user_id),
-        Transacao.tipo == item_extrato['tipo']
-    ).limit(1000).all()  # Limitar para performance
-
-    # Calcular similaridade de descrição
-    scores_categoria = {}
-
-    for transacao in todas_transacoes:
-        if not transacao.categoria_id:
-            continue
-
-        # Calcular similaridade
-        similarity = fuzz.token_sort_ratio(
-            item_extrato['descricao'].lower(),
-            transacao.descricao.lower()
-        )
-
-        # Acumular score por categoria
-        if transacao.categoria_id not in scores_categoria:
-            scores_categoria[transacao.categoria_id] = {
-                'score_total': 0,
-                'count': 0,
-                'categoria': transacao.categoria
-            }
+    if classificador is None:
+        classificador = ClassificadorCategorias.carregar(user_id, [item_extrato['tipo']])
 
-        scores_categoria[transacao.categoria_id]['score_total'] += similarity
-        scores_categoria[transacao.categoria_id]['count'] += 1
+    return classificador.sugerir(item_extrato['descricao'], item_extrato['tipo'])
 
-    # Encontrar categoria com melhor score médio
-    melhor_categoria = None
-    melhor_score = 0
 
-    for cat_id, data in scores_categoria.items():
-        score_medio = data['score_total'] / data['count']
-        if score_medio > melhor_score and score_medio >= 70:  # Threshold de 70%
-            melhor_score = score_medio
-            melhor_categoria = data['categoria']
-
-    return melhor_categoria
-
-
-def processar_matching(itens_extrato, conta_id, user_id):
+def processar_matching(itens_extrato, conta_id, user_id, callback_progresso=None, intervalo_progresso=200,
+                       classificador=None):
     """
     Processa matching para todos os itens de um extrato
 
+    Também usado bloco a bloco em extratos grandes: as transações já
+    vinculadas a itens gravados pelos blocos anteriores não são candidatas.
+
     Args:
         itens_extrato: lista de dicts com itens do extrato
         conta_id: ID da conta
         user_id: ID do usuário
+        callback_progresso: função chamada com a quantidade de itens já processados
+        intervalo_progresso: itens processados entre chamadas do callback
+        classificador: ClassificadorCategorias já carregado (reaproveitado entre blocos)
 
     Returns:
         list: lista de dicts com itens processados incluindo matches e sugestões
     """
-    resultados = []
+    # Candidatas de todo o extrato e índice de categorias: uma consulta cada
+    candidatos = carregar_candidatos(itens_extrato, conta_id)
+    if classificador is None:
+        classificador = ClassificadorCategorias.carregar(user_id, {item['tipo'] for item in itens_extrato})
+
+    matches_por_item = []
+    categorias_sugeridas = []
 
     for item in itens_extrato:
         # Encontrar possíveis matches
-        matches = encontrar_matches(item, conta_id, user_id)
+        matches_por_item.append(encontrar_matches(item, conta_id, user_id, candidatos=candidatos))
 
         # Sugerir categoria
-        categoria_sugerida = sugerir_categoria(item, user_id)
+        categorias_sugeridas.append(sugerir_categoria(item, user_id, classificador))
+
+        if callback_progresso and len(matches_por_item) % intervalo_progresso == 0:
+            callback_progresso(len(matches_por_item))
+
+    # Uma transação para no máximo um item, considerando o extrato inteiro
+    atribuidos = atribuir_matches(matches_por_item)
+    ocupadas = {melhor_match[0].id for melhor_match in atribuidos if melhor_match}
+
+    resultados = []
+    for indice, item in enumerate(itens_extrato):
+        melhor_match = atribuidos[indice]
+
+        # Alternativas: candidatas que não ficaram com outro item
+        matches = [
+            (transacao, score) for transacao, score in matches_por_item[indice]
+            if transacao.id not in ocupadas or (melhor_match and melhor_match[0] is transacao)
+        ]
 
         # Adicionar informações ao item
         item_processado = item.copy()
@@ -185,14 +494,14 @@ def processar_matching(itens_extrato, conta_id, user_id):
             for transacao, score in matches[:5]  # Top 5 matches
         ]
 
-        item_processado['melhor_match'] = matches[0] if matches else None
-        item_processado['categoria_sugerida'] = categoria_sugerida
-        item_processado['score_matching'] = matches[0][1] if matches else 0
+        item_processado['melhor_match'] = melhor_match
+        item_processado['categoria_sugerida'] = categorias_sugeridas[indice]
+        item_processado['score_matching'] = melhor_match[1] if melhor_match else 0
 
         # Definir status inicial
-        if matches and matches[0][1] >= 90:
+        if melhor_match and melhor_match[1] >= 90:
             item_processado['status_sugerido'] = 'conciliar'  # Match muito forte
-        elif matches and matches[0][1] >= 70:
+        elif melhor_match and melhor_match[1] >= 70:
             item_processado['status_sugerido'] = 'revisar'  # Match razoável
         else:
             item_processado['status_sugerido'] = 'importar'  # Sem match, importar como novo
@@ -0,0 +1,203 @@
+"""
+Métricas no formato Prometheus (GET /metrics)
+
+- requisições HTTP por endpoint (histograma de duração)
+- pool de conexões do SQLAlchemy (checkouts, conexões em uso e overflow)
+- chamadas à brapi.dev por ticker (latência e erros)
+- conciliações bancárias (duração de parse/matching/gravação e linhas)
+- acertos e faltas dos caches (cotações)
+
+Com vários workers do gunicorn, defina PROMETHEUS_MULTIPROC_DIR (diretório
+gravável, limpo a cada início pelo gunicorn.conf.py): cada processo grava
+seus valores em arquivos nesse diretório e o /metrics de qualquer worker
+agrega todos. Sem a variável, as métricas são as do próprio processo.
+
+O endpoint só responde com METRICAS_TOKEN configurado, enviado pelo
+Prometheus como "Authorization: Bearer <token>".
+"""
+import hmac
+import os
+import time
+
+from flask import Response, abort, current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+
+from app.models import db
+
+
+# Em modo multiprocesso os valores vão para arquivos no diretório, criados
+# junto com as métricas (inclusive em comandos de CLI e no init_db.py)
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+requisicoes_http = Histogram(
+    'gestao_http_requisicao_segundos',
+    'Duração das requisições HTTP por endpoint',
+    ['endpoint', 'metodo', 'status']
+)
+
+pool_checkouts = Counter(
+    'gestao_db_pool_checkouts_total',
+    'Conexões retiradas do pool do SQLAlchemy'
+)
+
+pool_conexoes_criadas = Counter(
+    'gestao_db_pool_conexoes_criadas_total',
+    'Conexões abertas com o banco pelo pool'
+)
+
+pool_em_uso = Gauge(
+    'gestao_db_pool_conexoes_em_uso',
+    'Conexões do pool em uso (somadas entre os workers)',
+    multiprocess_mode='livesum'
+)
+
+pool_overflow = Gauge(
+    'gestao_db_pool_overflow',
+    'Conexões abertas além de pool_size (somadas entre os workers)',
+    multiprocess_mode='livesum'
+)
+
+brapi_requisicoes = Histogram(
+    'gestao_brapi_requisicao_segundos',
+    'Latência das chamadas à brapi.dev por ticker',
+    ['ticker'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+
+brapi_erros = Counter(
+    'gestao_brapi_erros_total',
+    'Chamadas à brapi.dev com erro, por ticker e motivo',
+    ['ticker', 'motivo']
+)
+
+conciliacao_etapas = Histogram(
+    'gestao_conciliacao_etapa_segundos',
+    'Duração das etapas do processamento de conciliações',
+    ['etapa'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+
+conciliacao_linhas = Histogram(
+    'gestao_conciliacao_linhas',
+    'Linhas de extrato por conciliação processada',
+    buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+)
+
+conciliacoes_processadas = Counter(
+    'gestao_conciliacoes_processadas_total',
+    'Conciliações processadas, por resultado',
+    ['resultado']
+)
+
+cache_consultas = Counter(
+    'gestao_cache_consultas_total',
+    'Consultas aos caches da aplicação, por resultado (acerto/falta)',
+    ['cache', 'resultado']
+)
+
+
+def registrar_chamada_brapi(tickers, segundos, erro=None):
+    """
+    Registra uma chamada à brapi.dev (pode rodar fora do contexto da aplicação)
+
+    Args:
+        tickers: tickers consultados na chamada
+        segundos: duração da chamada
+        erro: motivo do erro ('status_404', 'rede', ...) ou None
+    """
+    for ticker in tickers:
+        brapi_requisicoes.labels(ticker=ticker).observe(segundos)
+        if erro:
+            brapi_erros.labels(ticker=ticker, motivo=erro).inc()
+
+
+def registrar_cache(cache, acertos, faltas):
+    """
+    Registra acertos e faltas de um cache
+
+    Args:
+        cache: nome do cache (ex.: 'cotacoes')
+        acertos: itens encontrados válidos no cache
+        faltas: itens ausentes ou vencidos
+    """
+    if acertos:
+        cache_consultas.labels(cache=cache, resultado='acerto').inc(acertos)
+    if faltas:
+        cache_consultas.labels(cache=cache, resultado='falta').inc(faltas)
+
+
+def _observar_pool(pool):
+    """Registra os eventos de checkout/checkin do pool de conexões"""
+    def atualizar_overflow():
+        # Apenas QueuePool tem overflow (SQLite em memória usa outro pool)
+        if hasattr(pool, 'overflow'):
+            pool_overflow.set(max(0, pool.overflow()))
+
+    def ao_conectar(dbapi_connection, connection_record):
+        pool_conexoes_criadas.inc()
+
+    def ao_retirar(dbapi_connection, connection_record, connection_proxy):
+        pool_checkouts.inc()
+        pool_em_uso.inc()
+        atualizar_overflow()
+
+    def ao_devolver(dbapi_connection, connection_record):
+        pool_em_uso.dec()
+        atualizar_overflow()
+
+    event.listen(pool, 'connect', ao_conectar)
+    event.listen(pool, 'checkout', ao_retirar)
+    event.listen(pool, 'checkin', ao_devolver)
+
+
+def _inicio_requisicao():
+    g.inicio_metricas = time.perf_counter()
+
+
+def _fim_requisicao(response):
+    inicio = g.pop('inicio_metricas', None)
+    if inicio is not None and request.endpoint and request.endpoint != 'static':
+        requisicoes_http.labels(
+            endpoint=request.endpoint,
+            metodo=request.method,
+            status=response.status_code
+        ).observe(time.perf_counter() - inicio)
+    return response
+
+
+def metricas():
+    """GET /metrics: exposição no formato texto do Prometheus"""
+    token = current_app.config.get('METRICAS_TOKEN')
+    if not token:
+        abort(404)
+
+    autorizacao = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(autorizacao, f'Bearer {token}'):
+        abort(401)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+
+    return Response(generate_latest(registro), content_type=CONTENT_TYPE_LATEST)
+
+
+def registrar_metricas(app):
+    """
+    Ativa a coleta de métricas e o endpoint /metrics na aplicação
+
+    Args:
+        app: aplicação Flask
+    """
+    app.before_request(_inicio_requisicao)
+    app.after_request(_fim_requisicao)
+    app.add_url_rule('/metrics', 'metricas', metricas)
+
+    with app.app_context():
+        _observar_pool(db.engine.pool)
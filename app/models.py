@@ -1,11 +1,138 @@
-from datetime import datetime
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from uuid import uuid4
+from decimal import Decimal
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, cast, event, extract, false, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session, aliased
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
 
+def _insert_com_conflito(connection):
+    """
+    Retorna o insert do dialeto com suporte a ON CONFLICT (PostgreSQL e SQLite)
+
+    Returns:
+        função insert do dialeto, ou None se o banco não suportar
+    """
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _upsert_incremental(connection, tabela, chave, linhas, somas):
+    """
+    Insere linhas ou soma os valores nas linhas já existentes (mesma chave)
+
+    Args:
+        connection: conexão da transação corrente
+        tabela: Table de destino (com unique constraint nas colunas da chave)
+        chave (tuple): colunas que identificam a linha
+        linhas (list): dicts com as colunas da chave e das somas
+        somas (tuple): colunas incrementadas em caso de conflito
+    """
+    insert = _insert_com_conflito(connection)
+
+    if insert is not None:
+        stmt = insert(tabela).values(linhas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(chave),
+            set_={coluna: tabela.c[coluna] + stmt.excluded[coluna] for coluna in somas}
+        )
+        connection.execute(stmt)
+        return
+
+    # Outros bancos: UPDATE e, se a linha não existir, INSERT
+    for linha in linhas:
+        filtro = [tabela.c[coluna] == linha[coluna] for coluna in chave]
+        resultado = connection.execute(
+            tabela.update().where(*filtro).values(
+                **{coluna: tabela.c[coluna] + linha[coluna] for coluna in somas}
+            )
+        )
+        if resultado.rowcount == 0:
+            connection.execute(tabela.insert().values(**linha))
+
+
+# Linhas por comando nas operações em lote
+TAMANHO_LOTE = 1000
+
+
+def _inserir_em_lote(modelo, linhas, retornar_ids=True):
+    """
+    Insere várias linhas com um INSERT em lote (insertmanyvalues/executemany)
+
+    Não passa pelo unit of work: eventos de flush e do mapper não são disparados.
+    Com retornar_ids, usa RETURNING ordenado pelos parâmetros; o PostgreSQL faz
+    isso em lote, o SQLite (desenvolvimento) recai para uma linha por comando.
+
+    Args:
+        modelo: classe do modelo
+        linhas: lista de dicts (todos com as mesmas chaves)
+        retornar_ids: se os ids gerados são necessários
+
+    Returns:
+        list: ids gerados, na ordem das linhas (vazia se retornar_ids=False)
+    """
+    if not linhas:
+        return []
+
+    if not retornar_ids:
+        db.session.execute(insert(modelo), linhas)
+        return []
+
+    return list(db.session.scalars(
+        insert(modelo).returning(modelo.id, sort_by_parameter_order=True),
+        linhas
+    ))
+
+
+def _atualizar_por_id(modelo, valores_por_id):
+    """
+    Atualiza várias linhas com valores diferentes usando UPDATE ... CASE id
+
+    Um comando a cada TAMANHO_LOTE linhas, em vez de um UPDATE por linha.
+
+    Args:
+        modelo: classe do modelo
+        valores_por_id: dict {id: {coluna: valor}} (todos com as mesmas colunas)
+
+    Returns:
+        int: quantidade de linhas atualizadas
+    """
+    ids = list(valores_por_id)
+    if not ids:
+        return 0
+
+    tabela = modelo.__table__
+    colunas = list(valores_por_id[ids[0]])
+    atualizadas = 0
+
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+        valores = {
+            coluna: cast(
+                case({id_: valores_por_id[id_][coluna] for id_ in lote}, value=tabela.c.id),
+                tabela.c[coluna].type
+            )
+            for coluna in colunas
+        }
+        resultado = db.session.execute(update(tabela).where(tabela.c.id.in_(lote)).values(**valores))
+        atualizadas += resultado.rowcount
+
+    return atualizadas
+
+
 class User(UserMixin, db.Model):
     """Modelo para usuários do sistema"""
     __tablename__ = 'users'
@@ -34,7 +161,16 @@ class User(UserMixin, db.Model):
         return f'<User {self.email}>'
 
 class Conta(db.Model):
-    """Modelo para contas bancárias"""
+    """
+    Modelo para contas bancárias
+
+    O saldo é derivado do extrato: saldo_inicial + transações pagas até o dia.
+    `saldo_atual` é um checkpoint desse cálculo para o dia `data_saldo`,
+    recalculado a cada flush que altera transações da conta e pelo
+    `flask saldos-verificar --corrigir`. Em outro dia o checkpoint é ignorado
+    e Conta.saldos consulta os saldos diários. As rotas não o alteram
+    diretamente.
+    """
     __tablename__ = 'contas'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -42,12 +178,112 @@ class Conta(db.Model):
     tipo = db.Column(db.String(50), nullable=False)  # corrente, poupanca, investimento
     saldo_inicial = db.Column(db.Numeric(10, 2), default=0.00)
     saldo_atual = db.Column(db.Numeric(10, 2), default=0.00)
+    data_saldo = db.Column(db.Date)  # dia a que saldo_atual se refere
     ativa = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
 
     transacoes = db.relationship('Transacao', backref='conta', lazy=True)
 
+    @staticmethod
+    def _saldo_em(data):
+        """Expressão do saldo de cada conta ao fim do dia (último saldo diário até a data)"""
+        acumulado = select(SaldoDiario.acumulado).where(
+            SaldoDiario.conta_id == Conta.id,
+            SaldoDiario.data <= data
+        ).order_by(SaldoDiario.data.desc()).limit(1).scalar_subquery()
+        return func.coalesce(Conta.saldo_inicial, 0) + func.coalesce(acumulado, 0)
+
+    @classmethod
+    def saldos(cls, contas, data=None):
+        """
+        Saldo de várias contas ao fim de um dia
+
+        Usa o checkpoint (saldo_atual) das contas já calculadas para o dia e
+        busca as demais em uma única consulta nos saldos diários.
+
+        Args:
+            contas: objetos Conta
+            data: dia de referência (padrão: hoje)
+
+        Returns:
+            dict: {conta_id: Decimal}
+        """
+        data = data or date.today()
+        saldos = {conta.id: conta.saldo_atual for conta in contas if conta.data_saldo == data}
+
+        pendentes = [conta.id for conta in contas if conta.id not in saldos]
+        if pendentes:
+            saldos.update(db.session.execute(
+                select(cls.id, cls._saldo_em(data)).where(cls.id.in_(pendentes))
+            ).all())
+
+        return {conta_id: Decimal(str(saldo)).quantize(Decimal('0.01')) for conta_id, saldo in saldos.items()}
+
+    def saldo(self, data=None):
+        """
+        Saldo da conta ao fim de um dia (padrão: hoje)
+
+        Returns:
+            Decimal: saldo_inicial + transações pagas até a data
+        """
+        return Conta.saldos([self], data)[self.id]
+
+    @classmethod
+    def atualizar_checkpoints(cls, connection, conta_ids=None, data=None):
+        """
+        Recalcula saldo_atual a partir dos saldos diários
+
+        Args:
+            connection: conexão da transação corrente
+            conta_ids: contas a atualizar (padrão: todas)
+            data: dia do checkpoint (padrão: hoje)
+
+        Returns:
+            int: quantidade de contas atualizadas
+        """
+        data = data or date.today()
+        comando = update(cls.__table__).values(saldo_atual=cls._saldo_em(data), data_saldo=data)
+        if conta_ids is not None:
+            comando = comando.where(cls.id.in_(conta_ids))
+        return connection.execute(comando).rowcount
+
+    @classmethod
+    def verificar_saldos(cls, user_id=None, data=None):
+        """
+        Compara o saldo_atual de todas as contas com o extrato em uma única consulta agrupada
+
+        Soma diretamente as transações pagas (não os saldos diários), então
+        também detecta divergências nos snapshots.
+
+        Args:
+            user_id: limita a verificação às contas de um usuário
+            data: dia de referência (padrão: hoje)
+
+        Returns:
+            list: tuplas (conta_id, saldo registrado, saldo calculado) das contas divergentes
+        """
+        data = data or date.today()
+        efeito = case(
+            (Transacao.tipo == 'receita', Transacao.valor),
+            else_=-Transacao.valor
+        )
+        calculado = func.coalesce(cls.saldo_inicial, 0) + func.coalesce(func.sum(efeito), 0)
+
+        consulta = select(cls.id, cls.saldo_atual, calculado).outerjoin(
+            Transacao,
+            (Transacao.conta_id == cls.id) & (Transacao.pago == True) & (Transacao.data <= data)
+        ).group_by(cls.id, cls.saldo_atual, cls.saldo_inicial)
+        if user_id is not None:
+            consulta = consulta.where(cls.user_id == user_id)
+
+        divergentes = []
+        for conta_id, registrado, saldo in db.session.execute(consulta):
+            saldo = Decimal(str(saldo)).quantize(Decimal('0.01'))
+            if registrado is None or Decimal(str(registrado)) != saldo:
+                divergentes.append((conta_id, registrado, saldo))
+        return divergentes
+
     def __repr__(self):
         return f'<Conta {self.nome}>'
 
@@ -101,20 +337,594 @@ class Transacao(db.Model):
     data_fim_recorrencia = db.Column(db.Date, nullable=True)  # Mantido para compatibilidade
     quantidade_recorrencias = db.Column(db.Integer, nullable=True)  # Número de vezes que deve ocorrer
     transacao_recorrente_pai_id = db.Column(db.Integer, nullable=True)  # ID da transação recorrente original
+    numero_ocorrencia = db.Column(db.Integer, nullable=True)  # Posição na recorrência (1 = a própria transação original)
+    # Recorrência virtual: só a transação original é gravada; as demais ocorrências
+    # são calculadas na consulta e gravadas apenas ao serem pagas ou editadas
+    recorrencia_virtual = db.Column(db.Boolean, default=False)
+    # Na regra de uma recorrência virtual: números das ocorrências excluídas, separados por vírgula
+    ocorrencias_excluidas = db.Column(db.Text, nullable=True)
 
     conta_id = db.Column(db.Integer, db.ForeignKey('contas.id'), nullable=False)
     categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
     fatura_id = db.Column(db.Integer, db.ForeignKey('faturas.id'), nullable=True)
 
+    # Dono da transação (cópia de Conta.user_id, mantida pelos eventos abaixo)
+    # Evita o JOIN com contas em todas as consultas por usuário
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    # Índices compostos para os filtros mais frequentes (extrato por usuário/período,
+    # extrato por conta/período, matching por conta/tipo/período, faturas, cartões
+    # e recorrências)
+    __table_args__ = (
+        db.Index('ix_transacoes_user_data_id', 'user_id', 'data', 'id'),
+        db.Index('ix_transacoes_conta_data', 'conta_id', 'data'),
+        db.Index('ix_transacoes_conta_tipo_data', 'conta_id', 'tipo', 'data'),
+        db.Index('ix_transacoes_categoria_data', 'categoria_id', 'data'),
+        db.Index('ix_transacoes_cartao_data', 'cartao_credito_id', 'data'),
+        db.Index('ix_transacoes_fatura_id', 'fatura_id'),
+        db.Index('ix_transacoes_recorrente_pai_id', 'transacao_recorrente_pai_id'),
+        db.Index('ix_transacoes_user_recorrencia_virtual', 'user_id', 'recorrencia_virtual'),
+    )
+
+    # Ocorrências de recorrências virtuais (ver app/services/recorrencias_virtuais.py) têm True
+    virtual = False
+
     def pode_marcar_pago(self):
         """Verifica se a transação pode ser marcada como paga"""
         # Transações de cartão de crédito não podem ser marcadas individualmente
         return self.forma_pagamento != 'cartao_credito'
 
+    @classmethod
+    def inserir_em_lote(cls, linhas, retornar_ids=True):
+        """
+        Insere várias transações de uma vez, mantendo os agregados
+
+        Como os eventos do flush não são disparados, user_id deve vir preenchido
+        e os agregados (resumo, índice, saldos) são atualizados aqui.
+
+        Args:
+            linhas: lista de dicts com as colunas das transações (mesmas chaves em todos)
+            retornar_ids: se os ids gerados são necessários
+
+        Returns:
+            list: ids das transações criadas, na ordem das linhas (vazia se retornar_ids=False)
+        """
+        ids = _inserir_em_lote(cls, linhas, retornar_ids)
+        _aplicar_agregados_transacoes(
+            db.session.connection(),
+            [],
+            [SimpleNamespace(**{'pago': False, 'categoria_id': None, **linha}) for linha in linhas]
+        )
+        return ids
+
     def __repr__(self):
         return f'<Transacao {self.descricao} - R$ {self.valor}>'
 
 
+def _user_id_da_conta(connection, conta_id):
+    """Busca o dono de uma conta usando a conexão do flush"""
+    return connection.scalar(select(Conta.user_id).where(Conta.id == conta_id))
+
+
+@event.listens_for(Transacao, 'before_insert')
+def _preencher_user_id_transacao(mapper, connection, target):
+    """Preenche user_id a partir da conta quando não foi informado"""
+    if target.user_id is None:
+        target.user_id = _user_id_da_conta(connection, target.conta_id)
+
+
+@event.listens_for(Transacao, 'before_update')
+def _sincronizar_user_id_transacao(mapper, connection, target):
+    """Mantém user_id consistente quando a transação muda de conta"""
+    if target.user_id is None or inspect(target).attrs.conta_id.history.has_changes():
+        target.user_id = _user_id_da_conta(connection, target.conta_id)
+
+
+class ResumoMensal(db.Model):
+    """
+    Totais mensais de transações por categoria, tipo e status de pagamento
+
+    Tabela de agregados lida pelos relatórios. É mantida incrementalmente a cada
+    flush (ver eventos abaixo) e pode ser reconstruída com `flask resumo-rebuild`.
+    """
+    __tablename__ = 'resumo_mensal'
+
+    CHAVE = ('user_id', 'ano', 'mes', 'categoria_id', 'tipo', 'pago')
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)  # 1-12
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # receita, despesa
+    pago = db.Column(db.Boolean, nullable=False, default=False)
+
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(*CHAVE, name='uq_resumo_mensal_chave'),
+    )
+
+    @staticmethod
+    def chave(user_id, data, categoria_id, tipo, pago):
+        """Monta a chave do resumo para uma transação"""
+        return (user_id, data.year, data.month, int(categoria_id), tipo, bool(pago))
+
+    @classmethod
+    def aplicar_deltas(cls, connection, deltas):
+        """
+        Soma variações de total e quantidade nas linhas do resumo (upsert)
+
+        Args:
+            connection: conexão da transação corrente
+            deltas: dict {chave: [total, quantidade]}
+        """
+        linhas = [
+            dict(zip(cls.CHAVE, chave), total=total, quantidade=quantidade)
+            for chave, (total, quantidade) in deltas.items()
+            if total or quantidade
+        ]
+        if linhas:
+            _upsert_incremental(connection, cls.__table__, cls.CHAVE, linhas, ('total', 'quantidade'))
+
+    @classmethod
+    def reconstruir(cls, user_id=None):
+        """
+        Recalcula o resumo a partir das transações (backfill e correção de divergências)
+
+        Args:
+            user_id: limita a reconstrução a um usuário (padrão: todos)
+
+        Returns:
+            int: quantidade de linhas geradas
+        """
+        ano = cast(extract('year', Transacao.data), db.Integer)
+        mes = cast(extract('month', Transacao.data), db.Integer)
+        pago = func.coalesce(Transacao.pago, false())
+
+        origem = select(
+            Transacao.user_id, ano, mes, Transacao.categoria_id, Transacao.tipo, pago,
+            func.sum(Transacao.valor), func.count(Transacao.id)
+        ).group_by(Transacao.user_id, ano, mes, Transacao.categoria_id, Transacao.tipo, pago)
+
+        remocao = cls.__table__.delete()
+        if user_id is not None:
+            origem = origem.where(Transacao.user_id == user_id)
+            remocao = remocao.where(cls.user_id == user_id)
+
+        db.session.execute(remocao)
+        db.session.execute(
+            cls.__table__.insert().from_select(list(cls.CHAVE) + ['total', 'quantidade'], origem)
+        )
+
+        contagem = select(func.count(cls.id))
+        if user_id is not None:
+            contagem = contagem.where(cls.user_id == user_id)
+        return db.session.scalar(contagem)
+
+    def __repr__(self):
+        return f'<ResumoMensal {self.user_id} {self.mes}/{self.ano} {self.tipo}: R$ {self.total}>'
+
+
+class SaldoDiario(db.Model):
+    """
+    Saldo diário de cada conta (snapshots do extrato pago)
+
+    Uma linha por conta e dia com transações pagas: `movimento` é o efeito
+    líquido do dia (receitas - despesas) e `acumulado` a soma dos movimentos
+    até o dia, inclusive. O saldo da conta ao fim do dia é saldo_inicial +
+    acumulado. É mantida incrementalmente a cada flush (ver eventos abaixo) e
+    pode ser reconstruída com `flask saldos-rebuild`.
+    """
+    __tablename__ = 'saldos_diarios'
+
+    # Acima de tantas datas distintas de uma conta no mesmo flush, reconstrói a conta
+    LIMITE_INCREMENTAL = 31
+
+    id = db.Column(db.Integer, primary_key=True)
+    conta_id = db.Column(db.Integer, db.ForeignKey('contas.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    movimento = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    acumulado = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('conta_id', 'data', name='uq_saldos_diarios_conta_data'),
+        db.Index('ix_saldos_diarios_user_data', 'user_id', 'data'),
+    )
+
+    @staticmethod
+    def efeito(tipo, valor):
+        """Efeito de uma transação paga no saldo da conta"""
+        valor = Decimal(str(valor))
+        return valor if tipo == 'receita' else -valor
+
+    @classmethod
+    def aplicar_deltas(cls, connection, deltas):
+        """
+        Aplica variações de movimento nos snapshots
+
+        Dois comandos por conta, independente da quantidade de dias: cria as
+        linhas dos dias que ainda não existem (com o acumulado do dia
+        anterior) e soma, em um único UPDATE, a variação no movimento do
+        próprio dia e no acumulado dele e de todos os dias seguintes.
+
+        Args:
+            connection: conexão da transação corrente
+            deltas: dict {(conta_id, user_id, data): variação}
+        """
+        por_conta = defaultdict(list)
+        for (conta_id, user_id, data), valor in deltas.items():
+            if valor:
+                por_conta[(conta_id, user_id)].append((data, valor))
+
+        tabela = cls.__table__
+        insert_dialeto = _insert_com_conflito(connection)
+        reconstruir = []
+
+        for (conta_id, user_id), movimentos in por_conta.items():
+            if len(movimentos) > cls.LIMITE_INCREMENTAL:
+                reconstruir.append(conta_id)
+                continue
+
+            movimentos.sort()
+            datas = [data for data, _ in movimentos]
+
+            # Dias ainda sem linha, com movimento zero e o acumulado do último dia anterior
+            novos = [
+                dict(
+                    conta_id=conta_id, user_id=user_id, data=data, movimento=0,
+                    acumulado=func.coalesce(
+                        select(tabela.c.acumulado).where(
+                            tabela.c.conta_id == conta_id, tabela.c.data < data
+                        ).order_by(tabela.c.data.desc()).limit(1).scalar_subquery(),
+                        0
+                    )
+                )
+                for data in datas
+            ]
+            if insert_dialeto is not None:
+                connection.execute(
+                    insert_dialeto(tabela).values(novos)
+                    .on_conflict_do_nothing(index_elements=['conta_id', 'data'])
+                )
+            else:
+                existentes = set(connection.scalars(
+                    select(tabela.c.data).where(tabela.c.conta_id == conta_id, tabela.c.data.in_(datas))
+                ))
+                novos = [linha for linha in novos if linha['data'] not in existentes]
+                if novos:
+                    connection.execute(tabela.insert().values(novos))
+
+            # Acumulado: cada dia recebe a soma das variações até ele (faixas em ordem decrescente)
+            faixas = []
+            soma = Decimal('0')
+            for data, valor in movimentos:
+                soma += valor
+                faixas.append((tabela.c.data >= data, soma))
+
+            connection.execute(
+                update(tabela)
+                .where(tabela.c.conta_id == conta_id, tabela.c.data >= datas[0])
+                .values(
+                    movimento=tabela.c.movimento + case(dict(movimentos), value=tabela.c.data, else_=0),
+                    acumulado=tabela.c.acumulado + case(*reversed(faixas), else_=0)
+                )
+            )
+
+        if reconstruir:
+            cls.reconstruir(conta_ids=reconstruir)
+
+    @classmethod
+    def reconstruir(cls, user_id=None, conta_ids=None):
+        """
+        Recalcula os snapshots a partir das transações pagas (backfill e correção de divergências)
+
+        Args:
+            user_id: limita a reconstrução às contas de um usuário
+            conta_ids: limita a reconstrução a estas contas
+
+        Returns:
+            int: quantidade de linhas geradas
+        """
+        movimento = func.sum(case((Transacao.tipo == 'receita', Transacao.valor), else_=-Transacao.valor))
+        diario = select(
+            Transacao.conta_id, Conta.user_id, Transacao.data, movimento.label('movimento')
+        ).join(Conta, Conta.id == Transacao.conta_id).where(
+            Transacao.pago == True
+        ).group_by(Transacao.conta_id, Conta.user_id, Transacao.data)
+
+        remocao = cls.__table__.delete()
+        contagem = select(func.count(cls.id))
+        if user_id is not None:
+            diario = diario.where(Conta.user_id == user_id)
+            remocao = remocao.where(cls.user_id == user_id)
+            contagem = contagem.where(cls.user_id == user_id)
+        if conta_ids is not None:
+            diario = diario.where(Transacao.conta_id.in_(conta_ids))
+            remocao = remocao.where(cls.conta_id.in_(conta_ids))
+            contagem = contagem.where(cls.conta_id.in_(conta_ids))
+
+        diario = diario.subquery()
+        origem = select(
+            diario.c.conta_id, diario.c.user_id, diario.c.data, diario.c.movimento,
+            func.sum(diario.c.movimento).over(partition_by=diario.c.conta_id, order_by=diario.c.data)
+        )
+
+        conexao = db.session.connection()
+        conexao.execute(remocao)
+        conexao.execute(
+            cls.__table__.insert().from_select(['conta_id', 'user_id', 'data', 'movimento', 'acumulado'], origem)
+        )
+        return conexao.scalar(contagem)
+
+    @classmethod
+    def serie(cls, user_id, inicio, fim, pontos):
+        """
+        Soma do acumulado de todas as contas do usuário ao longo de um período
+
+        Uma única leitura indexada: as linhas do período mais a última linha
+        de cada conta antes dele. Períodos com mais dias que `pontos` são
+        amostrados em datas igualmente espaçadas (sempre incluindo o início e o fim).
+
+        Args:
+            user_id: ID do usuário
+            inicio: primeiro dia (None = primeiro dia com movimento)
+            fim: último dia
+            pontos: quantidade máxima de pontos
+
+        Returns:
+            list: tuplas (data, acumulado) em ordem cronológica
+        """
+        consulta = select(cls.conta_id, cls.data, cls.acumulado).where(
+            cls.user_id == user_id,
+            cls.data <= fim
+        )
+        if inicio is not None:
+            anterior = aliased(cls)
+            ultimo_antes = select(func.max(anterior.data)).where(
+                anterior.conta_id == cls.conta_id,
+                anterior.data < inicio
+            ).scalar_subquery()
+            consulta = consulta.where(or_(cls.data >= inicio, cls.data == ultimo_antes))
+
+        linhas = db.session.execute(consulta.order_by(cls.data)).all()
+
+        if inicio is None:
+            inicio = linhas[0].data if linhas else fim
+        dias = (fim - inicio).days
+        if dias < 0:
+            return []
+
+        pontos = max(pontos, 2)
+        if dias + 1 <= pontos:
+            datas = [inicio + timedelta(days=i) for i in range(dias + 1)]
+        else:
+            datas = sorted({inicio + timedelta(days=round(i * dias / (pontos - 1))) for i in range(pontos)})
+
+        serie = []
+        por_conta = {}
+        total = Decimal('0')
+        posicao = 0
+        for dia in datas:
+            while posicao < len(linhas) and linhas[posicao].data <= dia:
+                linha = linhas[posicao]
+                total += linha.acumulado - por_conta.get(linha.conta_id, 0)
+                por_conta[linha.conta_id] = linha.acumulado
+                posicao += 1
+            serie.append((dia, total))
+
+        return serie
+
+    def __repr__(self):
+        return f'<SaldoDiario conta {self.conta_id} {self.data}: R$ {self.acumulado}>'
+
+
+class IndiceCategoria(db.Model):
+    """
+    Índice de sugestão de categorias por usuário
+
+    Para cada termo das descrições já categorizadas (descrição normalizada
+    completa, palavras e trigramas de caracteres) guarda quantas transações
+    de cada categoria o contêm. É mantido incrementalmente a cada flush (ver
+    eventos abaixo) e pode ser reconstruído com `flask indice-categorias-rebuild`.
+    """
+    __tablename__ = 'indice_categorias'
+
+    CHAVE = ('user_id', 'tipo', 'nivel', 'termo', 'categoria_id')
+    TAMANHO_MINIMO_PALAVRA = 3
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # receita, despesa
+    nivel = db.Column(db.String(10), nullable=False)  # descricao, token, trigrama
+    termo = db.Column(db.String(200), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
+    frequencia = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(*CHAVE, name='uq_indice_categorias_chave'),
+    )
+
+    @classmethod
+    def normalizar(cls, descricao):
+        """
+        Quebra a descrição em palavras normalizadas
+
+        Minúsculas, sem acentos, números e pontuação; descarta palavras curtas.
+
+        Returns:
+            list: palavras na ordem original
+        """
+        texto = unicodedata.normalize('NFKD', descricao or '').encode('ascii', 'ignore').decode().lower()
+        return [p for p in re.findall(r'[a-z]+', texto) if len(p) >= cls.TAMANHO_MINIMO_PALAVRA]
+
+    @staticmethod
+    def trigramas(palavras):
+        """Trigramas de caracteres das palavras (com espaço nas bordas)"""
+        return {f' {p} '[i:i + 3] for p in palavras for i in range(len(p))}
+
+    @classmethod
+    def termos(cls, descricao):
+        """
+        Termos indexados de uma descrição
+
+        Returns:
+            list: tuplas (nivel, termo)
+        """
+        palavras = cls.normalizar(descricao)
+        if not palavras:
+            return []
+
+        termos = [('descricao', ' '.join(palavras)[:200])]
+        termos += [('token', p[:200]) for p in set(palavras)]
+        termos += [('trigrama', t) for t in cls.trigramas(palavras)]
+        return termos
+
+    @classmethod
+    def acumular(cls, deltas, user_id, tipo, categoria_id, descricao, sinal):
+        """Soma (ou subtrai) em deltas os termos de uma transação"""
+        if categoria_id is None:
+            return
+        for nivel, termo in cls.termos(descricao):
+            deltas[(user_id, tipo, nivel, termo, int(categoria_id))] += sinal
+
+    @classmethod
+    def aplicar_deltas(cls, connection, deltas):
+        """
+        Soma variações de frequência nas linhas do índice (upsert)
+
+        Args:
+            connection: conexão da transação corrente
+            deltas: dict {chave: variação}
+        """
+        linhas = [
+            dict(zip(cls.CHAVE, chave), frequencia=frequencia)
+            for chave, frequencia in deltas.items()
+            if frequencia
+        ]
+        if linhas:
+            _upsert_incremental(connection, cls.__table__, cls.CHAVE, linhas, ('frequencia',))
+
+    @classmethod
+    def reconstruir(cls, user_id=None):
+        """
+        Recalcula o índice a partir das transações (backfill e correção de divergências)
+
+        Args:
+            user_id: limita a reconstrução a um usuário (padrão: todos)
+
+        Returns:
+            int: quantidade de linhas geradas
+        """
+        origem = select(Transacao.user_id, Transacao.tipo, Transacao.categoria_id, Transacao.descricao)
+        remocao = cls.__table__.delete()
+        if user_id is not None:
+            origem = origem.where(Transacao.user_id == user_id)
+            remocao = remocao.where(cls.user_id == user_id)
+
+        contagem = defaultdict(int)
+        for linha in db.session.execute(origem.execution_options(yield_per=1000)):
+            cls.acumular(contagem, linha.user_id, linha.tipo, linha.categoria_id, linha.descricao, 1)
+
+        db.session.execute(remocao)
+        linhas = [dict(zip(cls.CHAVE, chave), frequencia=frequencia) for chave, frequencia in contagem.items()]
+        for inicio in range(0, len(linhas), 1000):
+            db.session.execute(cls.__table__.insert(), linhas[inicio:inicio + 1000])
+
+        return len(linhas)
+
+    def __repr__(self):
+        return f'<IndiceCategoria {self.nivel}:{self.termo} -> {self.categoria_id} ({self.frequencia})>'
+
+
+_COLUNAS_ANTERIORES = (
+    Transacao.id, Transacao.user_id, Transacao.conta_id, Transacao.data, Transacao.categoria_id,
+    Transacao.tipo, Transacao.pago, Transacao.valor, Transacao.descricao
+)
+
+
+@event.listens_for(Session, 'before_flush')
+def _capturar_transacoes_anteriores(session, flush_context, instances):
+    """
+    Guarda o estado gravado das transações que serão alteradas ou removidas
+
+    Sempre substitui o estado do flush anterior: o de um flush que falhou não
+    pode ser aplicado pelo próximo.
+    """
+    ids = [
+        obj.id for obj in session.deleted
+        if isinstance(obj, Transacao) and obj.id is not None
+    ]
+    ids += [
+        obj.id for obj in session.dirty
+        if isinstance(obj, Transacao) and obj.id is not None and session.is_modified(obj)
+    ]
+    if not ids:
+        session.info['transacoes_anteriores'] = {}
+        return
+
+    linhas = session.connection().execute(
+        select(*_COLUNAS_ANTERIORES).where(Transacao.id.in_(ids))
+    ).all()
+    session.info['transacoes_anteriores'] = {linha.id: linha for linha in linhas}
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _descartar_transacoes_anteriores(session, previous_transaction):
+    """Descarta o estado capturado por um flush desfeito"""
+    session.info.pop('transacoes_anteriores', None)
+
+
+def _aplicar_agregados_transacoes(conexao, removidas, incluidas):
+    """
+    Aplica no resumo mensal, no índice de categorias, nos saldos diários e
+    no saldo das contas a diferença entre transações removidas e incluídas
+
+    Args:
+        conexao: conexão da transação corrente
+        removidas: estado anterior das transações (objetos com user_id, conta_id,
+            data, categoria_id, tipo, pago, valor e descricao)
+        incluidas: estado novo das transações (mesmos atributos)
+    """
+    resumo = defaultdict(lambda: [Decimal('0'), 0])
+    indice = defaultdict(int)
+    saldos = defaultdict(Decimal)
+
+    for sinal, transacoes in ((-1, removidas), (1, incluidas)):
+        for obj in transacoes:
+            chave = ResumoMensal.chave(obj.user_id, obj.data, obj.categoria_id, obj.tipo, obj.pago)
+            resumo[chave][0] += sinal * Decimal(str(obj.valor))
+            resumo[chave][1] += sinal
+            IndiceCategoria.acumular(indice, obj.user_id, obj.tipo, obj.categoria_id, obj.descricao, sinal)
+            if obj.pago:
+                saldos[(obj.conta_id, obj.user_id, obj.data)] += sinal * SaldoDiario.efeito(obj.tipo, obj.valor)
+
+    ResumoMensal.aplicar_deltas(conexao, resumo)
+    IndiceCategoria.aplicar_deltas(conexao, indice)
+    SaldoDiario.aplicar_deltas(conexao, saldos)
+
+    contas = {conta_id for (conta_id, _, _), valor in saldos.items() if valor}
+    if contas:
+        Conta.atualizar_checkpoints(conexao, contas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_agregados_transacoes(session, flush_context):
+    """Aplica nos agregados (resumo, índice, saldos) a diferença causada pelas transações do flush"""
+    anteriores = session.info.pop('transacoes_anteriores', {})
+    atuais = [obj for obj in session.new if isinstance(obj, Transacao)]
+    atuais += [
+        obj for obj in session.dirty
+        if isinstance(obj, Transacao) and obj.id in anteriores
+    ]
+    if not anteriores and not atuais:
+        return
+
+    _aplicar_agregados_transacoes(session.connection(), anteriores.values(), atuais)
+
+
 class CartaoCredito(db.Model):
     """Modelo para cartões de crédito"""
     __tablename__ = 'cartoes_credito'
@@ -130,7 +940,7 @@ class CartaoCredito(db.Model):
     dia_vencimento = db.Column(db.Integer, nullable=False)  # 1-31
     ativo = db.Column(db.Boolean, default=True)
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
 
     faturas = db.relationship('Fatura', backref='cartao', lazy=True)
 
@@ -153,7 +963,7 @@ class Fatura(db.Model):
     __tablename__ = 'faturas'
 
     id = db.Column(db.Integer, primary_key=True)
-    cartao_id = db.Column(db.Integer, db.ForeignKey('cartoes_credito.id'), nullable=False)
+    cartao_id = db.Column(db.Integer, db.ForeignKey('cartoes_credito.id'), nullable=False, index=True)
     mes_referencia = db.Column(db.Integer, nullable=False)  # 1-12
     ano_referencia = db.Column(db.Integer, nullable=False)
     data_fechamento = db.Column(db.Date, nullable=False)
@@ -165,6 +975,16 @@ class Fatura(db.Model):
 
     transacoes = db.relationship('Transacao', backref='fatura', lazy=True)
 
+    @classmethod
+    def inserir_em_lote(cls, linhas):
+        """
+        Insere várias faturas de uma vez (sem retornar os ids)
+
+        Args:
+            linhas: lista de dicts com as colunas das faturas (mesmas chaves em todos)
+        """
+        _inserir_em_lote(cls, linhas, retornar_ids=False)
+
     def __repr__(self):
         return f'<Fatura {self.mes_referencia}/{self.ano_referencia} - {self.cartao.nome}>'
 
@@ -192,11 +1012,21 @@ class ConciliacaoBancaria(db.Model):
     data_inicio = db.Column(db.Date, nullable=True)
     data_fim = db.Column(db.Date, nullable=True)
 
+    # Processamento em segundo plano (ver app/services/conciliacao_jobs.py)
+    arquivo_conteudo = db.deferred(db.Column(db.LargeBinary, nullable=True))  # Removido após o processamento
+    progresso = db.Column(db.Integer, default=0)  # 0-100
+    mensagem_erro = db.Column(db.Text, nullable=True)
+    ultima_atividade = db.Column(db.DateTime, nullable=True)  # Heartbeat do job que está processando
+
     # Relacionamentos
     usuario = db.relationship('User', backref='conciliacoes')
     conta = db.relationship('Conta', backref='conciliacoes')
     itens = db.relationship('ItemConciliacao', backref='conciliacao', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_conciliacoes_bancarias_status', 'status'),
+    )
+
     def __repr__(self):
         return f'<ConciliacaoBancaria {self.arquivo_nome} - {self.conta.nome}>'
 
@@ -206,7 +1036,7 @@ class ItemConciliacao(db.Model):
     __tablename__ = 'itens_conciliacao'
 
     id = db.Column(db.Integer, primary_key=True)
-    conciliacao_id = db.Column(db.Integer, db.ForeignKey('conciliacoes_bancarias.id'), nullable=False)
+    conciliacao_id = db.Column(db.Integer, db.ForeignKey('conciliacoes_bancarias.id'), nullable=False, index=True)
 
     # Dados do item do extrato
     data = db.Column(db.Date, nullable=False)
@@ -220,7 +1050,7 @@ class ItemConciliacao(db.Model):
 
     # Status de conciliação
     status = db.Column(db.String(20), default='pendente')  # pendente, conciliado, importado, ignorado
-    transacao_id = db.Column(db.Integer, db.ForeignKey('transacoes.id'), nullable=True)  # Se foi conciliado com transação existente
+    transacao_id = db.Column(db.Integer, db.ForeignKey('transacoes.id'), nullable=True, index=True)  # Se foi conciliado com transação existente
     categoria_sugerida_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=True)
 
     # Score de matching (0-100)
@@ -232,6 +1062,33 @@ class ItemConciliacao(db.Model):
     transacao = db.relationship('Transacao', backref='itens_conciliacao')
     categoria_sugerida = db.relationship('Categoria', backref='itens_conciliacao_sugeridos')
 
+    @classmethod
+    def inserir_em_lote(cls, linhas, retornar_ids=False):
+        """
+        Insere os itens de uma conciliação de uma vez
+
+        Args:
+            linhas: lista de dicts com as colunas dos itens (mesmas chaves em todos)
+            retornar_ids: se os ids gerados são necessários
+
+        Returns:
+            list: ids dos itens criados, na ordem das linhas (vazia se retornar_ids=False)
+        """
+        return _inserir_em_lote(cls, linhas, retornar_ids)
+
+    @classmethod
+    def atualizar_em_lote(cls, alteracoes):
+        """
+        Grava o resultado da revisão de vários itens em poucos UPDATEs
+
+        Args:
+            alteracoes: dict {item_id: {'status': ..., 'transacao_id': ...}}
+
+        Returns:
+            int: quantidade de itens atualizados
+        """
+        return _atualizar_por_id(cls, alteracoes)
+
     def __repr__(self):
         return f'<ItemConciliacao {self.descricao} - R$ {self.valor}>'
 
@@ -261,19 +1118,75 @@ class Orcamento(db.Model):
     usuario = db.relationship('User', backref='orcamentos')
     categoria = db.relationship('Categoria')
 
-    def valor_gasto(self):
-        """Calcula quanto já foi gasto nesta categoria no período"""
-        from sqlalchemy import extract, func
+    __table_args__ = (
+        db.Index('ix_orcamentos_user_periodo', 'user_id', 'ano', 'mes'),
+    )
+
+    @staticmethod
+    def consulta_gastos(user_id, mes, ano):
+        """
+        Consulta agrupada (categoria_id, total) das despesas do usuário no mês
+
+        Usa um intervalo de datas em vez de extract() para aproveitar índices
+        sobre Transacao.data.
+        """
+        from datetime import date
+        from dateutil.relativedelta import relativedelta
+        from sqlalchemy import func
+
+        inicio = date(ano, mes, 1)
+        fim = inicio + relativedelta(months=1)
 
-        total = db.session.query(func.sum(Transacao.valor)).join(Conta).filter(
-            Transacao.categoria_id == self.categoria_id,
-            Conta.user_id == self.user_id,
+        return db.session.query(
+            Transacao.categoria_id.label('categoria_id'),
+            func.sum(Transacao.valor).label('total')
+        ).filter(
+            Transacao.user_id == user_id,
             Transacao.tipo == 'despesa',
-            extract('month', Transacao.data) == self.mes,
-            extract('year', Transacao.data) == self.ano
-        ).scalar()
+            Transacao.data >= inicio,
+            Transacao.data < fim
+        ).group_by(Transacao.categoria_id)
 
-        return total or 0
+    @classmethod
+    def carregar_gastos(cls, orcamentos):
+        """
+        Pré-calcula o valor gasto de vários orçamentos de uma vez
+
+        Executa uma única consulta agrupada por período (usuário/mês/ano) e
+        guarda o resultado em cada orçamento, de modo que valor_gasto(),
+        percentual_gasto(), esta_no_limite() e saldo_restante() não voltem
+        ao banco.
+
+        Args:
+            orcamentos: lista de objetos Orcamento
+
+        Returns:
+            A mesma lista de orçamentos
+        """
+        from collections import defaultdict
+
+        por_periodo = defaultdict(list)
+        for orcamento in orcamentos:
+            por_periodo[(orcamento.user_id, orcamento.mes, orcamento.ano)].append(orcamento)
+
+        for (user_id, mes, ano), lista in por_periodo.items():
+            gastos = dict(cls.consulta_gastos(user_id, mes, ano).all())
+            for orcamento in lista:
+                orcamento._valor_gasto = gastos.get(orcamento.categoria_id) or 0
+
+        return orcamentos
+
+    def valor_gasto(self):
+        """Calcula quanto já foi gasto nesta categoria no período"""
+        gasto = getattr(self, '_valor_gasto', None)
+        if gasto is None:
+            gasto = self.consulta_gastos(self.user_id, self.mes, self.ano).filter(
+                Transacao.categoria_id == self.categoria_id
+            ).first()
+            gasto = (gasto.total if gasto else None) or 0
+            self._valor_gasto = gasto
+
+        return gasto
 
     def percentual_gasto(self):
         """Retorna percentual gasto do orçamento (0-100)"""
@@ -365,7 +1278,7 @@ class DepositoMeta(db.Model):
     __tablename__ = 'depositos_meta'
 
     id = db.Column(db.Integer, primary_key=True)
-    meta_id = db.Column(db.Integer, db.ForeignKey('metas.id'), nullable=False)
+    meta_id = db.Column(db.Integer, db.ForeignKey('metas.id'), nullable=False, index=True)
 
     valor = db.Column(db.Numeric(10, 2), nullable=False)
     data = db.Column(db.Date, nullable=False, default=datetime.utcnow)
@@ -452,15 +1365,211 @@ class Ativo(db.Model):
 
     def precisa_atualizar(self):
         """Verifica se precisa atualizar cotação (cache > 15 min)"""
-        from datetime import timedelta
         if not self.ultima_atualizacao:
             return True
-        return datetime.utcnow() - self.ultima_atualizacao > timedelta(minutes=15)
+        return datetime.utcnow() - self.ultima_atualizacao > Cotacao.TTL
 
     def __repr__(self):
         return f'<Ativo {self.ticker} - {self.quantidade}>'
 
 
+class Cotacao(db.Model):
+    """
+    Cache global de cotações, compartilhado entre todos os usuários
+
+    Uma linha por ticker: cada ticker é buscado na API no máximo uma vez por
+    janela de TTL, independente de quantos usuários o possuem. As colunas de
+    reserva garantem que só um processo busque o ticker por vez (single-flight).
+    """
+    __tablename__ = 'cotacoes'
+
+    TTL = timedelta(minutes=15)
+    RESERVA_MAXIMA = timedelta(minutes=1)  # Reserva abandonada (processo caiu) expira
+
+    ticker = db.Column(db.String(20), primary_key=True)
+    nome = db.Column(db.String(200))
+    preco = db.Column(db.Numeric(10, 2))
+    variacao_dia = db.Column(db.Numeric(10, 2))
+    atualizado_em = db.Column(db.DateTime)
+
+    # Reserva para atualização (quem está buscando e desde quando)
+    atualizando_desde = db.Column(db.DateTime)
+    atualizando_token = db.Column(db.String(32))
+
+    def esta_valida(self):
+        """Verifica se a cotação está dentro do TTL"""
+        if self.preco is None or not self.atualizado_em:
+            return False
+        return datetime.utcnow() - self.atualizado_em <= self.TTL
+
+    def como_dict(self):
+        """Dados no mesmo formato retornado pelo BrapiService"""
+        return {
+            'ticker': self.ticker,
+            'nome': self.nome,
+            'preco': self.preco,
+            'variacao_dia': self.variacao_dia,
+            'data_atualizacao': self.atualizado_em,
+        }
+
+    @classmethod
+    def buscar(cls, tickers):
+        """Retorna as cotações em cache, por ticker"""
+        if not tickers:
+            return {}
+        return {c.ticker: c for c in cls.query.filter(cls.ticker.in_(tickers)).all()}
+
+    @classmethod
+    def reservar(cls, tickers):
+        """
+        Reserva os tickers vencidos para atualização (single-flight)
+
+        Roda em uma transação própria, já confirmada ao retornar, para que os
+        outros processos enxerguem a reserva imediatamente. Tickers que outro
+        processo já está atualizando (ou que acabaram de ser atualizados) ficam de fora.
+
+        Args:
+            tickers (list): tickers a atualizar
+
+        Returns:
+            tuple: (token da reserva, set de tickers reservados)
+        """
+        token = uuid4().hex
+        agora = datetime.utcnow()
+        tabela = cls.__table__
+
+        with db.engine.begin() as conexao:
+            insert = _insert_com_conflito(conexao)
+            if insert is not None:
+                conexao.execute(
+                    insert(tabela).values([{'ticker': t} for t in tickers]).on_conflict_do_nothing()
+                )
+            else:
+                existentes = set(conexao.scalars(select(cls.ticker).where(cls.ticker.in_(tickers))))
+                novos = [{'ticker': t} for t in tickers if t not in existentes]
+                if novos:
+                    conexao.execute(tabela.insert(), novos)
+
+            conexao.execute(
+                update(tabela).where(
+                    cls.ticker.in_(tickers),
+                    or_(cls.atualizando_desde.is_(None), cls.atualizando_desde < agora - cls.RESERVA_MAXIMA),
+                    or_(cls.atualizado_em.is_(None), cls.atualizado_em < agora - cls.TTL)
+                ).values(atualizando_desde=agora, atualizando_token=token)
+            )
+            reservados = set(conexao.scalars(select(cls.ticker).where(cls.atualizando_token == token)))
+
+        return token, reservados
+
+    @classmethod
+    def registrar(cls, cotacoes, token):
+        """
+        Grava as cotações buscadas e libera a reserva (sem commit)
+
+        Args:
+            cotacoes (dict): cotações por ticker, no formato do BrapiService
+            token (str): token retornado por reservar()
+
+        Returns:
+            datetime: horário (UTC) gravado em atualizado_em
+        """
+        agora = datetime.utcnow()
+        tabela = cls.__table__
+
+        for ticker, cotacao in cotacoes.items():
+            db.session.execute(
+                update(tabela).where(cls.ticker == ticker, cls.atualizando_token == token).values(
+                    nome=cotacao['nome'],
+                    preco=cotacao['preco'],
+                    variacao_dia=cotacao['variacao_dia'],
+                    atualizado_em=agora,
+                    atualizando_desde=None,
+                    atualizando_token=None
+                )
+            )
+
+        # Tickers que falharam e nunca tiveram preço (provavelmente inexistentes):
+        # marca a tentativa para não consultar a API de novo antes do TTL
+        db.session.execute(
+            update(tabela).where(cls.atualizando_token == token, cls.preco.is_(None)).values(
+                atualizado_em=agora, atualizando_desde=None, atualizando_token=None
+            )
+        )
+
+        # Demais falhas: apenas libera a reserva
+        db.session.execute(
+            update(tabela).where(cls.atualizando_token == token).values(
+                atualizando_desde=None, atualizando_token=None
+            )
+        )
+        return agora
+
+    @classmethod
+    def aguardar(cls, tickers, limite_segundos, intervalo=0.2):
+        """
+        Aguarda outro processo concluir a atualização dos tickers reservados
+
+        Args:
+            tickers (list): tickers reservados por outro processo
+            limite_segundos (float): tempo máximo de espera
+            intervalo (float): intervalo entre consultas
+
+        Returns:
+            dict: cotações disponíveis ao fim da espera, por ticker
+        """
+        import time
+
+        limite = time.monotonic() + limite_segundos
+        while True:
+            linhas = db.session.execute(
+                select(cls.ticker, cls.nome, cls.preco, cls.variacao_dia, cls.atualizado_em, cls.atualizando_token)
+                .where(cls.ticker.in_(tickers))
+            ).all()
+            if all(linha.atualizando_token is None for linha in linhas) or time.monotonic() >= limite:
+                break
+            time.sleep(intervalo)
+
+        return {
+            linha.ticker: {
+                'ticker': linha.ticker,
+                'nome': linha.nome,
+                'preco': linha.preco,
+                'variacao_dia': linha.variacao_dia,
+                'data_atualizacao': linha.atualizado_em,
+            }
+            for linha in linhas if linha.preco is not None
+        }
+
+    @classmethod
+    def propagar_para_ativos(cls):
+        """
+        Copia as cotações do cache para todos os ativos com preço mais antigo (sem commit)
+
+        Returns:
+            int: quantidade de ativos atualizados
+        """
+        ativos = Ativo.__table__
+        do_ticker = cls.ticker == ativos.c.ticker
+
+        stmt = update(ativos).where(
+            ativos.c.ativo == True,
+            select(cls.ticker).where(
+                do_ticker,
+                cls.preco.isnot(None),
+                or_(ativos.c.ultima_atualizacao.is_(None), cls.atualizado_em > ativos.c.ultima_atualizacao)
+            ).exists()
+        ).values(
+            ultimo_preco=select(cls.preco).where(do_ticker).scalar_subquery(),
+            variacao_dia=select(cls.variacao_dia).where(do_ticker).scalar_subquery(),
+            ultima_atualizacao=select(cls.atualizado_em).where(do_ticker).scalar_subquery(),
+            nome=func.coalesce(ativos.c.nome, select(cls.nome).where(do_ticker).scalar_subquery())
+        )
+        return db.session.execute(stmt).rowcount
+
+    def __repr__(self):
+        return f'<Cotacao {self.ticker} - R$ {self.preco}>'
+
+
 class TransacaoAtivo(db.Model):
     """Modelo para transações de compra/venda de ativos"""
     __tablename__ = 'transacoes_ativos'
@@ -525,3 +1634,21 @@ class Dividendo(db.Model):
 
     def __repr__(self):
         return f'<Dividendo {self.ativo.ticker} - R$ {self.valor_total}>'
+
+
+class ContadorSeguranca(db.Model):
+    """
+    Contadores com expiração compartilhados entre os workers (app/contadores.py)
+
+    Guarda as falhas de login por janela e os bloqueios de IP quando
+    SEGURANCA_STORAGE_URL=database://. Linhas vencidas são removidas a cada
+    incremento.
+    """
+    __tablename__ = 'contadores_seguranca'
+
+    chave = db.Column(db.String(200), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ContadorSeguranca {self.chave}={self.valor}>'
@@ -3,9 +3,10 @@ Módulo para parsear arquivos de extratos bancários (OFX, CSV)
 """
 from datetime import datetime
 from decimal import Decimal
+import numpy as np
 import pandas as pd
 import ofxparse
-from io import StringIO, BytesIO
+from io import StringIO, BytesIO, TextIOBase, TextIOWrapper
 
 
 def parse_ofx(file_content):
@@ -74,6 +75,128 @@ def parse_ofx(file_content):
         raise Exception(f"Erro ao processar arquivo OFX: {str(e)}")
 
 
+# Linhas lidas por vez no modo streaming
+CSV_CHUNKSIZE = 5000
+
+CSV_CONFIG_PADRAO = {
+    'delimiter': ',',
+    'date_column': 'data',
+    'description_column': 'descricao',
+    'amount_column': 'valor',
+    'date_format': '%d/%m/%Y',
+    'has_header': True,
+    'encoding': 'utf-8'
+}
+
+
+def _abrir_csv(file_content, encoding):
+    """
+    Prepara o conteúdo para leitura incremental pelo pandas
+
+    Bytes e arquivos binários são decodificados sob demanda (sem criar uma
+    cópia decodificada do arquivo inteiro).
+    """
+    if isinstance(file_content, bytes):
+        return TextIOWrapper(BytesIO(file_content), encoding=encoding)
+    if isinstance(file_content, str):
+        return StringIO(file_content)
+    if isinstance(file_content, TextIOBase):
+        return file_content
+    return TextIOWrapper(file_content, encoding=encoding)
+
+
+def _converter_lote_csv(df, config):
+    """
+    Converte um bloco do CSV em transações, coluna a coluna
+
+    Datas são interpretadas de uma vez com o formato configurado e valores no
+    formato brasileiro (1.234,56) são normalizados como texto e convertidos
+    direto para Decimal. Linhas com data ou valor inválidos são descartadas.
+
+    Returns:
+        list: dicts com as transações do bloco
+    """
+    datas = pd.to_datetime(
+        df[config['date_column']].astype('string'),
+        format=config['date_format'],
+        errors='coerce'
+    )
+
+    valores = (
+        df[config['amount_column']].astype('string').str.strip()
+        .str.replace('.', '', regex=False)
+        .str.replace(',', '.', regex=False)
+    )
+    numericos = pd.to_numeric(valores, errors='coerce')
+
+    validas = (datas.notna() & numericos.notna() & np.isfinite(numericos.astype('float64').fillna(0))).to_numpy()
+    if not validas.any():
+        return []
+
+    descricoes = df[config['description_column']].astype('string').fillna('Sem descrição')
+
+    transactions = []
+    for data, descricao, valor_str in zip(
+        datas.dt.date.to_numpy()[validas],
+        descricoes.to_numpy()[validas],
+        valores.to_numpy()[validas]
+    ):
+        valor = Decimal(valor_str)
+        transactions.append({
+            'data': data,
+            'descricao': descricao,
+            'valor': abs(valor),
+            'tipo': 'receita' if valor > 0 else 'despesa',
+            'numero_documento': None,
+            'saldo_apos': None
+        })
+
+    return transactions
+
+
+def iter_csv_chunks(file_content, config=None, chunksize=CSV_CHUNKSIZE):
+    """
+    Lê um arquivo CSV em blocos, com memória limitada
+
+    Indicado para extratos grandes (vários anos): em vez de montar a lista
+    completa, devolve as transações bloco a bloco.
+
+    Args:
+        file_content: conteúdo do arquivo (string, bytes ou arquivo aberto)
+        config: dict com configurações do CSV (ver parse_csv)
+        chunksize: linhas do CSV por bloco
+
+    Yields:
+        list: dicts com as transações de cada bloco (no formato de parse_csv)
+    """
+    config = {**CSV_CONFIG_PADRAO, **(config or {})}
+
+    # Se não tem header, assumir formato: data, descricao, valor
+    if not config['has_header']:
+        config.update(date_column='data', description_column='descricao', amount_column='valor')
+
+    try:
+        leitor = pd.read_csv(
+            _abrir_csv(file_content, config['encoding']),
+            delimiter=config['delimiter'],
+            header=0 if config['has_header'] else None,
+            dtype=str,
+            chunksize=chunksize
+        )
+
+        with leitor:
+            for df in leitor:
+                if not config['has_header']:
+                    df.columns = ['data', 'descricao', 'valor']
+
+                transactions = _converter_lote_csv(df, config)
+                if transactions:
+                    yield transactions
+
+    except Exception as e:
+        raise Exception(f"Erro ao processar arquivo CSV: {str(e)}")
+
+
 def parse_csv(file_content, config=None):
     """
     Parseia arquivo CSV e retorna lista de transações
@@ -87,95 +210,27 @@ def parse_csv(file_content, config=None):
             - amount_column: nome da coluna de valor (padrão: 'valor')
             - date_format: formato da data (padrão: '%d/%m/%Y')
             - has_header: se tem cabeçalho (padrão: True)
+            - encoding: codificação do arquivo (padrão: 'utf-8')
 
     Returns:
         dict com:
             - transactions: lista de dicts com as transações
             - date_range: tuple com (data_inicio, data_fim)
     """
-    try:
-        # Configurações padrão
-        default_config = {
-            'delimiter': ',',
-            'date_column': 'data',
-            'description_column': 'descricao',
-            'amount_column': 'valor',
-            'date_format': '%d/%m/%Y',
-            'has_header': True,
-            'encoding': 'utf-8'
-        }
-
-        if config:
-            default_config.update(config)
-
-        config = default_config
-
-        # Se for bytes, decodificar
-        if isinstance(file_content, bytes):
-            file_content = file_content.decode(config['encoding'])
+    transactions = []
+    for lote in iter_csv_chunks(file_content, config):
+        transactions.extend(lote)
 
-        # Ler CSV com pandas
-        df = pd.read_csv(
-            StringIO(file_content),
-            delimiter=config['delimiter'],
-            header=0 if config['has_header'] else None
-        )
-
-        # Se não tem header, usar índices de coluna
-        if not config['has_header']:
-            # Assumir formato: data, descricao, valor
-            df.columns = ['data', 'descricao', 'valor']
-            config['date_column'] = 'data'
-            config['description_column'] = 'descricao'
-            config['amount_column'] = 'valor'
+    # Range de datas
+    dates = [t['data'] for t in transactions]
+    date_range = (min(dates), max(dates)) if dates else (None, None)
 
-        transactions = []
-        dates = []
-
-        for _, row in df.iterrows():
-            try:
-                # Parsear data
-                date_str = str(row[config['date_column']])
-                data = pd.to_datetime(date_str, format=config['date_format']).date()
-
-                # Parsear valor
-                valor_str = str(row[config['amount_column']]).replace('.', '').replace(',', '.')
-                valor = float(valor_str)
-
-                # Determinar tipo
-                tipo = 'receita' if valor > 0 else 'despesa'
-
-                # Descrição
-                descricao = str(row[config['description_column']])
-
-                trans_dict = {
-                    'data': data,
-                    'descricao': descricao,
-                    'valor': abs(Decimal(str(valor))),
-                    'tipo': tipo,
-                    'numero_documento': None,
-                    'saldo_apos': None
-                }
-
-                transactions.append(trans_dict)
-                dates.append(data)
-
-            except Exception as e:
-                # Pular linhas com erro
-                continue
-
-        # Range de datas
-        date_range = (min(dates), max(dates)) if dates else (None, None)
-
-        return {
-            'transactions': transactions,
-            'account_info': {},
-            'date_range': date_range,
-            'total': len(transactions)
-        }
-
-    except Exception as e:
-        raise Exception(f"Erro ao processar arquivo CSV: {str(e)}")
+    return {
+        'transactions': transactions,
+        'account_info': {},
+        'date_range': date_range,
+        'total': len(transactions)
+    }
 
 
 def detect_format(file_content):
@@ -233,3 +288,32 @@ def parse_file(file_content, file_format=None, csv_config=None):
         return parse_csv(file_content, csv_config)
     else:
         raise Exception("Formato de arquivo não suportado. Use OFX ou CSV.")
+
+
+def iter_file_chunks(file_content, file_format=None, csv_config=None, chunksize=CSV_CHUNKSIZE):
+    """
+    Lê um arquivo bancário em blocos de transações
+
+    CSV é lido incrementalmente (iter_csv_chunks); OFX não tem leitura
+    incremental e vem em um único bloco.
+
+    Args:
+        file_content: conteúdo do arquivo
+        file_format: formato do arquivo ('OFX' ou 'CSV'), se None detecta automaticamente
+        csv_config: configurações para CSV (se aplicável)
+        chunksize: linhas do CSV por bloco
+
+    Yields:
+        list: dicts com as transações de cada bloco
+    """
+    if not file_format:
+        file_format = detect_format(file_content)
+
+    if file_format == 'CSV':
+        yield from iter_csv_chunks(file_content, csv_config, chunksize)
+    elif file_format == 'OFX':
+        transactions = parse_ofx(file_content)['transactions']
+        if transactions:
+            yield transactions
+    else:
+        raise Exception("Formato de arquivo não suportado. Use OFX ou CSV.")
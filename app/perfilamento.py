@@ -0,0 +1,210 @@
+"""
+Perfil de desempenho por requisição
+
+Para cada requisição são medidos, via eventos do engine do SQLAlchemy e
+sinais de renderização do Flask:
+- quantidade de consultas SQL e tempo total no banco
+- consulta mais lenta
+- tempo de renderização de templates e tempo total
+
+Os valores vão no cabeçalho Server-Timing da resposta apenas em debug ou
+para usuários de ADMIN_EMAILS (expõem tempos internos); consultas acima de
+CONSULTA_LENTA_MS são registradas no logger 'consultas_lentas'
+(logs/consultas_lentas.log) e as últimas AMOSTRAS_POR_ENDPOINT requisições de
+cada endpoint alimentam os percentis de estatisticas() — por processo.
+"""
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import before_render_template, template_rendered, current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+AMOSTRAS_POR_ENDPOINT = 500
+
+# Tamanho máximo do SQL guardado nas estatísticas e no log
+TAMANHO_MAXIMO_SQL = 1000
+
+logger_consultas_lentas = logging.getLogger('consultas_lentas')
+
+_amostras = defaultdict(lambda: deque(maxlen=AMOSTRAS_POR_ENDPOINT))
+_amostras_lock = threading.Lock()
+
+
+def _resumir_sql(statement):
+    """SQL em uma linha, limitado a TAMANHO_MAXIMO_SQL caracteres"""
+    return re.sub(r'\s+', ' ', statement).strip()[:TAMANHO_MAXIMO_SQL]
+
+
+def _antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'perfil_requisicao' in g:
+        conn.info.setdefault('inicio_consultas', []).append(time.perf_counter())
+
+
+def _depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'perfil_requisicao' not in g or not conn.info.get('inicio_consultas'):
+        return
+
+    duracao = time.perf_counter() - conn.info['inicio_consultas'].pop()
+    perfil = g.perfil_requisicao
+    perfil['consultas'] += 1
+    perfil['tempo_db'] += duracao
+    if duracao > perfil['mais_lenta'][0]:
+        perfil['mais_lenta'] = (duracao, statement)
+
+    if duracao * 1000 >= current_app.config.get('CONSULTA_LENTA_MS', 200):
+        logger_consultas_lentas.warning(
+            f'{duracao * 1000:.1f}ms {request.method} {request.endpoint}: {_resumir_sql(statement)}'
+        )
+
+
+def _erro_na_consulta(contexto_excecao):
+    # A consulta falhou: descarta o início registrado em _antes_da_consulta
+    inicios = contexto_excecao.connection.info.get('inicio_consultas') if contexto_excecao.connection else None
+    if inicios:
+        inicios.pop()
+
+
+def _inicio_renderizacao(sender, template, context, **extra):
+    if 'perfil_requisicao' in g:
+        g.perfil_requisicao['renderizacoes'].append(time.perf_counter())
+
+
+def _fim_renderizacao(sender, template, context, **extra):
+    if 'perfil_requisicao' in g and g.perfil_requisicao['renderizacoes']:
+        inicio = g.perfil_requisicao['renderizacoes'].pop()
+        # Renderizações aninhadas já estão contidas na externa
+        if not g.perfil_requisicao['renderizacoes']:
+            g.perfil_requisicao['tempo_templates'] += time.perf_counter() - inicio
+
+
+def _iniciar_perfil():
+    g.perfil_requisicao = {
+        'inicio': time.perf_counter(),
+        'consultas': 0,
+        'tempo_db': 0.0,
+        'tempo_templates': 0.0,
+        'renderizacoes': [],
+        'mais_lenta': (0.0, None)
+    }
+
+
+def _exibir_server_timing():
+    """Server-Timing só em debug ou para administradores (ADMIN_EMAILS)"""
+    if current_app.debug:
+        return True
+    admins = current_app.config.get('ADMIN_EMAILS')
+    return bool(admins) and current_user.is_authenticated and current_user.email.lower() in admins
+
+
+def _finalizar_perfil(response):
+    perfil = g.pop('perfil_requisicao', None)
+    if perfil is None:
+        return response
+
+    total = time.perf_counter() - perfil['inicio']
+    if _exibir_server_timing():
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={perfil["tempo_db"] * 1000:.1f};desc="{perfil["consultas"]} consultas"',
+            f'tpl;dur={perfil["tempo_templates"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}'
+        ])
+
+    if request.endpoint and request.endpoint != 'static':
+        registrar_amostra(request.endpoint, total, perfil['tempo_db'], perfil['consultas'],
+                          perfil['tempo_templates'], perfil['mais_lenta'])
+
+    return response
+
+
+def registrar_amostra(endpoint, total, tempo_db, consultas, tempo_templates, mais_lenta):
+    """
+    Guarda a medição de uma requisição nas amostras do endpoint
+
+    Args:
+        endpoint: nome do endpoint (ex.: 'main.listar_transacoes')
+        total: tempo total da requisição, em segundos
+        tempo_db: tempo gasto nas consultas SQL, em segundos
+        consultas: quantidade de consultas SQL
+        tempo_templates: tempo de renderização de templates, em segundos
+        mais_lenta: tupla (duração em segundos, SQL) da consulta mais lenta
+    """
+    with _amostras_lock:
+        _amostras[endpoint].append((total, tempo_db, consultas, tempo_templates, mais_lenta))
+
+
+def _percentil(valores_ordenados, percentil):
+    """Percentil pelo método nearest-rank (valores já ordenados)"""
+    posicao = max(0, -(-len(valores_ordenados) * percentil // 100) - 1)
+    return valores_ordenados[int(posicao)]
+
+
+def _percentis(valores, escala=1000, casas=1):
+    ordenados = sorted(valores)
+    return {
+        'p50': round(_percentil(ordenados, 50) * escala, casas),
+        'p95': round(_percentil(ordenados, 95) * escala, casas),
+        'p99': round(_percentil(ordenados, 99) * escala, casas),
+        'max': round(ordenados[-1] * escala, casas)
+    }
+
+
+def estatisticas():
+    """
+    Percentis por endpoint das requisições medidas neste processo
+
+    Returns:
+        list: um dict por endpoint ('endpoint', 'requisicoes', 'total_ms',
+            'db_ms', 'templates_ms', 'consultas', 'consulta_mais_lenta'),
+            do maior para o menor p95 do tempo total
+    """
+    with _amostras_lock:
+        copia = {endpoint: list(amostras) for endpoint, amostras in _amostras.items() if amostras}
+
+    resultado = []
+    for endpoint, amostras in copia.items():
+        totais, tempos_db, consultas, tempos_templates, mais_lentas = zip(*amostras)
+        duracao, sql = max(mais_lentas, key=lambda consulta: consulta[0])
+        resultado.append({
+            'endpoint': endpoint,
+            'requisicoes': len(amostras),
+            'total_ms': _percentis(totais),
+            'db_ms': _percentis(tempos_db),
+            'templates_ms': _percentis(tempos_templates),
+            'consultas': _percentis(consultas, escala=1, casas=0),
+            'consulta_mais_lenta': {
+                'ms': round(duracao * 1000, 1),
+                'sql': _resumir_sql(sql) if sql else None
+            }
+        })
+
+    resultado.sort(key=lambda item: item['total_ms']['p95'], reverse=True)
+    return resultado
+
+
+def registrar_perfilamento(app):
+    """
+    Ativa o perfil por requisição na aplicação
+
+    Deve ser chamado no início de create_app, antes dos demais before_request,
+    para que o tempo total inclua todos os hooks.
+
+    Args:
+        app: aplicação Flask
+    """
+    app.before_request(_iniciar_perfil)
+    app.after_request(_finalizar_perfil)
+    before_render_template.connect(_inicio_renderizacao, app)
+    template_rendered.connect(_fim_renderizacao, app)
+
+    # Eventos registrados uma única vez na classe Engine (valem para todas as aplicações)
+    for nome, listener in (('before_cursor_execute', _antes_da_consulta),
+                           ('after_cursor_execute', _depois_da_consulta),
+                           ('handle_error', _erro_na_consulta)):
+        if not event.contains(Engine, nome, listener):
+            event.listen(Engine, nome, listener)
@@ -1,16 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, abort
 from flask_login import login_required, current_user
-from app.models import db, Conta, Categoria, Transacao, CartaoCredito, Fatura, ConciliacaoBancaria, ItemConciliacao, Orcamento, Meta, DepositoMeta
+from app.models import db, Conta, Categoria, Transacao, CartaoCredito, Fatura, ConciliacaoBancaria, ItemConciliacao, Orcamento, Meta, DepositoMeta, ResumoMensal, SaldoDiario
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import func, extract
+from sqlalchemy import func
 from dateutil.relativedelta import relativedelta
 from werkzeug.utils import secure_filename
-from app.parsers import parse_file, detect_format
-from app.matching import processar_matching, estatisticas_matching
+from app.parsers import detect_format
+from app.matching import estatisticas_matching
+from app.services.dashboard_service import montar_dashboard
+from app.services import conciliacao_jobs
+from app.services.lancamentos import gerar_parcelas_cartao, gerar_recorrencias
+from app.services.recorrencias_virtuais import buscar_ocorrencias, ocorrencia_para_gravar, excluir_ocorrencia
+from app.carregamento import perfil
+from app.services.listagem_transacoes import buscar_pagina, decodificar_cursor, totais_mes
 from calendar import monthrange
 from collections import defaultdict
-import calendar
+import os
 
 bp = Blueprint('main', __name__)
 
@@ -24,262 +30,19 @@ def index():
     mes_filtro = request.args.get('mes', type=int) or datetime.now().month
     ano_filtro = request.args.get('ano', type=int) or datetime.now().year
 
-    # Calcular saldo total de todas as contas do usuário logado
-    contas = Conta.query.filter_by(ativa=True, user_id=current_user.id).all()
-    saldo_total = sum(conta.saldo_atual for conta in contas)
-
-    # Determinar primeiro e último dia do mês
-    primeiro_dia = date(ano_filtro, mes_filtro, 1)
-    ultimo_dia = date(ano_filtro, mes_filtro, calendar.monthrange(ano_filtro, mes_filtro)[1])
-    hoje = date.today()
-
-    # Buscar todas as transações do mês (realizadas e futuras) do usuário logado
-    transacoes_mes = Transacao.query.join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.data >= primeiro_dia,
-        Transacao.data <= ultimo_dia
-    ).order_by(Transacao.data).all()
-
-    # Buscar faturas com vencimento no mês do usuário logado
-    faturas_mes = Fatura.query.join(CartaoCredito).filter(
-        CartaoCredito.user_id == current_user.id,
-        Fatura.data_vencimento >= primeiro_dia,
-        Fatura.data_vencimento <= ultimo_dia,
-        Fatura.status.in_(['aberta', 'fechada'])
-    ).all()
-
-    # Organizar transações por dia
-    transacoes_por_dia = defaultdict(lambda: {'receitas': Decimal('0.00'), 'despesas': Decimal('0.00')})
-
-    for transacao in transacoes_mes:
-        dia_key = transacao.data
-        if transacao.tipo == 'receita':
-            transacoes_por_dia[dia_key]['receitas'] += transacao.valor
-        else:
-            transacoes_por_dia[dia_key]['despesas'] += transacao.valor
-
-    # Adicionar faturas como despesas futuras
-    for fatura in faturas_mes:
-        dia_key = fatura.data_vencimento
-        valor_pendente = fatura.valor_total - fatura.valor_pago
-        if valor_pendente > 0:
-            transacoes_por_dia[dia_key]['despesas'] += valor_pendente
-
-    # Calcular projeção dia a dia do saldo
-    projecao_fluxo = []
-    saldo_acumulado = float(saldo_total)
-
-    # Gerar dados para cada dia do mês
-    dia_atual = primeiro_dia
-    while dia_atual <= ultimo_dia:
-        receitas_dia = 0.0
-        despesas_dia = 0.0
-
-        if dia_atual in transacoes_por_dia:
-            receitas_dia = float(transacoes_por_dia[dia_atual]['receitas'])
-            despesas_dia = float(transacoes_por_dia[dia_atual]['despesas'])
-            saldo_acumulado += receitas_dia - despesas_dia
-
-        projecao_fluxo.append({
-            'data': dia_atual.strftime('%Y-%m-%d'),
-            'dia': dia_atual.day,
-            'saldo': round(saldo_acumulado, 2),
-            'receitas': round(receitas_dia, 2),
-            'despesas': round(despesas_dia, 2),
-            'is_hoje': dia_atual == hoje,
-            'is_futuro': dia_atual > hoje
-        })
-
-        dia_atual += relativedelta(days=1)
-
-    # Calcular totais do mês
-    total_receitas_mes = sum(float(d['receitas']) for d in transacoes_por_dia.values())
-    total_despesas_mes = sum(float(d['despesas']) for d in transacoes_por_dia.values())
-    saldo_previsto_fim_mes = float(saldo_total) + total_receitas_mes - total_despesas_mes
-
-    # Separar receitas e despesas realizadas vs futuras
-    receitas_realizadas = sum(
-        float(t.valor) for t in transacoes_mes
-        if t.tipo == 'receita' and t.data <= hoje
-    )
-    despesas_realizadas = sum(
-        float(t.valor) for t in transacoes_mes
-        if t.tipo == 'despesa' and t.data <= hoje
-    )
-
-    # Próximos pagamentos (despesas futuras + faturas)
-    proximos_pagamentos = []
-
-    # Despesas futuras
-    despesas_futuras = [t for t in transacoes_mes if t.tipo == 'despesa' and t.data > hoje]
-    for despesa in despesas_futuras[:10]:
-        proximos_pagamentos.append({
-            'tipo': 'despesa',
-            'id': despesa.id,
-            'descricao': despesa.descricao,
-            'valor': float(despesa.valor),
-            'data': despesa.data,
-            'categoria': despesa.categoria.nome,
-            'pago': despesa.pago
-        })
-
-    # Faturas pendentes (incluindo as com vencimento futuro e atual)
-    faturas_pendentes = Fatura.query.filter(
-        Fatura.status.in_(['aberta', 'fechada']),
-        Fatura.data_vencimento >= hoje
-    ).join(CartaoCredito).filter(
-        CartaoCredito.user_id == current_user.id
-    ).all()
-
-    for fatura in faturas_pendentes:
-        valor_pendente = float(fatura.valor_total - fatura.valor_pago)
-        if valor_pendente > 0:
-            proximos_pagamentos.append({
-                'tipo': 'fatura',
-                'id': fatura.id,
-                'descricao': f'Fatura {fatura.cartao.nome}',
-                'valor': valor_pendente,
-                'data': fatura.data_vencimento,
-                'categoria': 'Cartão de Crédito',
-                'pago': False  # Faturas não têm campo 'pago' diretamente
-            })
-
-    # Ordenar por data
-    proximos_pagamentos.sort(key=lambda x: x['data'])
-    proximos_pagamentos = proximos_pagamentos[:5]
-
-    # Próximas receitas
-    proximas_receitas = []
-    receitas_futuras = [t for t in transacoes_mes if t.tipo == 'receita' and t.data > hoje]
-    for receita in receitas_futuras[:5]:
-        proximas_receitas.append({
-            'id': receita.id,
-            'descricao': receita.descricao,
-            'valor': float(receita.valor),
-            'data': receita.data,
-            'categoria': receita.categoria.nome,
-            'pago': receita.pago
-        })
-
-    proximas_receitas.sort(key=lambda x: x['data'])
-
-    # Faturas pendentes (todas) do usuário logado
-    faturas_abertas = Fatura.query.join(CartaoCredito).filter(
-        CartaoCredito.user_id == current_user.id,
-        Fatura.status.in_(['aberta', 'fechada'])
-    ).all()
-    total_faturas = sum(fatura.valor_total for fatura in faturas_abertas)
-
-    # LEMBRETES DE METAS - Metas ativas que precisam de aporte
-    metas_ativas = Meta.query.filter_by(
-        user_id=current_user.id,
-        status='ativa'
-    ).order_by(Meta.data_fim).limit(5).all()
-
-    # Processar metas para calcular status
-    lembretes_metas = []
-    for meta in metas_ativas:
-        acumulado = meta.valor_acumulado()
-        alvo = meta.valor_alvo
-        percentual = meta.percentual_concluido()
-
-        # Calcular se está no prazo
-        dias_totais = (meta.data_fim - meta.data_inicio).days
-        dias_passados = (date.today() - meta.data_inicio).days
-        percentual_tempo = (dias_passados / dias_totais * 100) if dias_totais > 0 else 0
-
-        # Determinar status e urgência
-        if percentual >= 100:
-            status = 'concluida'
-            urgencia = 'baixa'
-        elif percentual < percentual_tempo * 0.8:
-            status = 'atrasado'
-            urgencia = 'alta'
-        elif percentual < percentual_tempo * 0.9:
-            status = 'atencao'
-            urgencia = 'media'
-        else:
-            status = 'no_prazo'
-            urgencia = 'baixa'
-
-        # Calcular valor mensal sugerido
-        dias_restantes = (meta.data_fim - date.today()).days
-        if dias_restantes > 0:
-            faltante = float(alvo - acumulado)
-            meses_restantes = dias_restantes / 30
-            aporte_sugerido = faltante / meses_restantes if meses_restantes > 0 else faltante
-        else:
-            aporte_sugerido = 0
-
-        lembretes_metas.append({
-            'id': meta.id,
-            'titulo': meta.titulo,
-            'percentual': round(percentual, 1),
-            'acumulado': float(acumulado),
-            'alvo': float(alvo),
-            'faltante': float(alvo - acumulado),
-            'data_fim': meta.data_fim,
-            'status': status,
-            'urgencia': urgencia,
-            'aporte_sugerido': round(aporte_sugerido, 2),
-            'meses_restantes': meta.meses_restantes()
-        })
-
-    # ALERTAS DE ORÇAMENTOS - Orçamentos do mês atual
-    orcamentos_mes = Orcamento.query.filter_by(
-        user_id=current_user.id,
-        mes=datetime.now().month,
-        ano=datetime.now().year
-    ).all()
-
-    alertas_orcamentos = []
-    for orc in orcamentos_mes:
-        gasto = float(orc.valor_gasto())
-        limite = float(orc.valor_limite)
-        percentual = orc.percentual_gasto()
-
-        # Determinar status
-        if percentual >= 100:
-            status = 'excedido'
-            urgencia = 'alta'
-        elif percentual >= orc.alerta_em_percentual:
-            status = 'alerta'
-            urgencia = 'media'
-        else:
-            status = 'ok'
-            urgencia = 'baixa'
-
-        # Só adicionar se tiver alerta ou excedido
-        if status != 'ok':
-            alertas_orcamentos.append({
-                'id': orc.id,
-                'categoria': orc.categoria.nome,
-                'cor': orc.categoria.cor,
-                'gasto': gasto,
-                'limite': limite,
-                'disponivel': limite - gasto,
-                'percentual': round(percentual, 1),
-                'status': status,
-                'urgencia': urgencia
-            })
+    # Todo o payload é montado em um número fixo de consultas agregadas
+    dados = montar_dashboard(current_user.id, mes_filtro, ano_filtro)
 
     return render_template('index.html',
-                         contas=contas,
-                         saldo_total=saldo_total,
-                         receitas_mes=total_receitas_mes,
-                         despesas_mes=total_despesas_mes,
-                         receitas_realizadas=receitas_realizadas,
-                         despesas_realizadas=despesas_realizadas,
-                         saldo_previsto=saldo_previsto_fim_mes,
-                         faturas_abertas=faturas_abertas,
-                         total_faturas=total_faturas,
                          mes_filtro=mes_filtro,
                          ano_filtro=ano_filtro,
-                         projecao_fluxo=projecao_fluxo,
-                         proximos_pagamentos=proximos_pagamentos,
-                         proximas_receitas=proximas_receitas,
-                         lembretes_metas=lembretes_metas,
-                         alertas_orcamentos=alertas_orcamentos)
+                         **dados)
+
+
+@bp.route('/saude')
+def saude():
+    """Health check do balanceador/orquestrador (sem banco e sem verificações de segurança)"""
+    return jsonify({'status': 'ok'})
 
 
 # ==================== CONTAS ====================
@@ -289,7 +52,7 @@ def index():
 def listar_contas():
     """Lista todas as contas do usuário"""
     contas = Conta.query.filter_by(user_id=current_user.id).all()
-    return render_template('contas/listar.html', contas=contas)
+    return render_template('contas/listar.html', contas=contas, saldos_contas=Conta.saldos(contas))
 
 
 @bp.route('/contas/nova', methods=['GET', 'POST'])
@@ -302,6 +65,7 @@ def nova_conta():
             tipo=request.form['tipo'],
             saldo_inicial=Decimal(request.form['saldo_inicial']),
             saldo_atual=Decimal(request.form['saldo_inicial']),
+            data_saldo=date.today(),
             user_id=current_user.id
         )
         db.session.add(conta)
@@ -331,15 +95,55 @@ def editar_conta(id):
 
 # ==================== TRANSAÇÕES ====================
 
+def _parametros_listagem():
+    """
+    Período, filtros e cursor da listagem de transações (query string)
+
+    Returns:
+        dict: parâmetros da listagem; 'cursor' fica None na primeira página
+
+    Raises:
+        ValueError: se o cursor for inválido
+    """
+    mes = request.args.get('mes', datetime.now().month, type=int)
+    ano = request.args.get('ano', datetime.now().year, type=int)
+
+    return {
+        'mes': mes,
+        'ano': ano,
+        'primeiro_dia': date(ano, mes, 1),
+        'ultimo_dia': date(ano, mes, monthrange(ano, mes)[1]),
+        'tipo': request.args.get('tipo', ''),
+        'conta_id': request.args.get('conta_id', ''),
+        'categoria_id': request.args.get('categoria_id', ''),
+        'cursor': decodificar_cursor(request.args.get('cursor', ''))
+    }
+
+
+def _buscar_pagina_listagem(parametros):
+    """Página de transações do usuário logado para os parâmetros da listagem"""
+    return buscar_pagina(
+        current_user.id,
+        parametros['primeiro_dia'],
+        parametros['ultimo_dia'],
+        tipo=parametros['tipo'],
+        conta_id=int(parametros['conta_id']) if parametros['conta_id'] else None,
+        categoria_id=int(parametros['categoria_id']) if parametros['categoria_id'] else None,
+        cursor=parametros['cursor']
+    )
+
+
 @bp.route('/transacoes')
 @login_required
 def listar_transacoes():
     """Lista todas as transações com filtros e navegação por mês"""
-    page = request.args.get('page', 1, type=int)
+    try:
+        parametros = _parametros_listagem()
+    except ValueError:
+        abort(400)
 
-    # Obter mês e ano da query string ou usar mês/ano atual
-    mes_atual = request.args.get('mes', datetime.now().month, type=int)
-    ano_atual = request.args.get('ano', datetime.now().year, type=int)
+    mes_atual = parametros['mes']
+    ano_atual = parametros['ano']
 
     # Calcular mês anterior e próximo
     if mes_atual == 1:
@@ -356,50 +160,15 @@ def listar_transacoes():
         mes_proximo = mes_atual + 1
         ano_proximo = ano_atual
 
-    # Calcular primeiro e último dia do mês
-    primeiro_dia = date(ano_atual, mes_atual, 1)
-    ultimo_dia = date(ano_atual, mes_atual, monthrange(ano_atual, mes_atual)[1])
-
-    # Obter outros filtros da query string
-    filtro_tipo = request.args.get('tipo', '')
-    filtro_conta = request.args.get('conta_id', '')
-    filtro_categoria = request.args.get('categoria_id', '')
-
-    # Construir query com filtros - incluir apenas transações do usuário logado
-    query = Transacao.query.join(Conta).filter(Conta.user_id == current_user.id)
-
-    # Filtrar por mês/ano por padrão
-    query = query.filter(Transacao.data >= primeiro_dia, Transacao.data <= ultimo_dia)
+    filtro_tipo = parametros['tipo']
+    filtro_conta = parametros['conta_id']
+    filtro_categoria = parametros['categoria_id']
 
-    if filtro_tipo:
-        query = query.filter(Transacao.tipo == filtro_tipo)
-
-    if filtro_conta:
-        query = query.filter(Transacao.conta_id == int(filtro_conta))
-
-    if filtro_categoria:
-        query = query.filter(Transacao.categoria_id == int(filtro_categoria))
-
-    # Ordenar e paginar
-    transacoes = query.order_by(Transacao.data.desc()).paginate(
-        page=page, per_page=50, error_out=False
-    )
-
-    # Calcular totais do mês do usuário logado
-    total_receitas = db.session.query(func.sum(Transacao.valor)).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'receita',
-        Transacao.data >= primeiro_dia,
-        Transacao.data <= ultimo_dia
-    ).scalar() or Decimal('0.00')
-
-    total_despesas = db.session.query(func.sum(Transacao.valor)).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'despesa',
-        Transacao.data >= primeiro_dia,
-        Transacao.data <= ultimo_dia
-    ).scalar() or Decimal('0.00')
+    # Página a partir do cursor (data, id) da última transação exibida, sem COUNT/OFFSET
+    transacoes, proximo_cursor, ocorrencias = _buscar_pagina_listagem(parametros)
 
+    # Totais do mês do usuário logado (resumo mensal + ocorrências virtuais)
+    total_receitas, total_despesas = totais_mes(current_user.id, mes_atual, ano_atual, ocorrencias)
     saldo_mes = total_receitas - total_despesas
 
     # Dados para os filtros - apenas do usuário logado
@@ -415,6 +184,8 @@ def listar_transacoes():
 
     return render_template('transacoes/listar.html',
                          transacoes=transacoes,
+                         proximo_cursor=proximo_cursor,
+                         primeira_pagina=parametros['cursor'] is None,
                          contas_filtro=contas_filtro,
                          categorias_filtro=categorias_filtro,
                          filtro_tipo=filtro_tipo,
@@ -434,6 +205,38 @@ def listar_transacoes():
                          ano_sistema=datetime.now().year)
 
 
+@bp.route('/api/transacoes')
+@login_required
+def api_listar_transacoes():
+    """API: Página de transações do mês (rolagem infinita da listagem)"""
+    try:
+        parametros = _parametros_listagem()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Cursor inválido'}), 400
+
+    transacoes, proximo_cursor, _ = _buscar_pagina_listagem(parametros)
+
+    return jsonify({
+        'success': True,
+        'transacoes': [
+            {
+                'id': t.id,
+                'data': t.data.isoformat(),
+                'descricao': t.descricao,
+                'valor': float(t.valor),
+                'tipo': t.tipo,
+                'pago': bool(t.pago),
+                'conta': t.conta.nome,
+                'categoria': t.categoria.nome,
+                'virtual': t.virtual
+            }
+            for t in transacoes
+        ],
+        'html': render_template('transacoes/_linhas.html', transacoes=transacoes),
+        'proximo_cursor': proximo_cursor
+    })
+
+
 @bp.route('/transacoes/nova', methods=['GET', 'POST'])
 @login_required
 def nova_transacao():
@@ -456,7 +259,6 @@ def nova_transacao():
             cartao_id = request.form.get('cartao_credito_id')
             total_parcelas = int(request.form.get('total_parcelas', 1))
             valor_total = Decimal(request.form['valor'])
-            valor_parcela = valor_total / total_parcelas
             data_compra = datetime.strptime(request.form['data'], '%Y-%m-%d').date()
 
             cartao = CartaoCredito.query.filter_by(id=cartao_id, user_id=current_user.id).first()
@@ -488,41 +290,17 @@ def nova_transacao():
 
             # CORREÇÃO: Criar APENAS as parcelas, não a transação pai
             # A transação pai causava duplicação de valores
-            primeira_transacao_id = None  # Para vincular as parcelas entre si
-
-            for i in range(1, total_parcelas + 1):
-                # Calcular a data da parcela (mês seguinte)
-                data_parcela = data_compra + relativedelta(months=i-1)
-
-                # Obter ou criar fatura do mês
-                fatura = obter_ou_criar_fatura(cartao, data_parcela)
-
-                # Criar transação da parcela
-                descricao_parcela = f"{request.form['descricao']} ({i}/{total_parcelas})"
-                transacao_parcela = Transacao(
-                    descricao=descricao_parcela,
-                    valor=valor_parcela,
-                    tipo='despesa',
-                    data=data_parcela,
-                    forma_pagamento='cartao_credito',
-                    cartao_credito_id=cartao_id,
-                    parcelado=True,
-                    numero_parcela=i,
-                    total_parcelas=total_parcelas,
-                    transacao_pai_id=primeira_transacao_id,  # Vincula à primeira parcela
-                    conta_id=conta_id_form,
-                    categoria_id=request.form['categoria_id'],
-                    fatura_id=fatura.id
-                )
-                db.session.add(transacao_parcela)
-
-                # Guardar ID da primeira parcela para vincular as demais
-                if i == 1:
-                    db.session.flush()
-                    primeira_transacao_id = transacao_parcela.id
-
-                # Atualizar valor da fatura
-                fatura.valor_total += valor_parcela
+            # Parcelas e faturas do período gravadas em lote, vinculadas à primeira parcela
+            gerar_parcelas_cartao(
+                cartao,
+                request.form['descricao'],
+                valor_total,
+                total_parcelas,
+                data_compra,
+                conta_id_form,
+                current_user.id,
+                int(request.form['categoria_id'])
+            )
 
             # Atualizar limite utilizado do cartão
             cartao.limite_utilizado += valor_total
@@ -537,13 +315,20 @@ def nova_transacao():
             recorrente = 'recorrente' in request.form
             pago = 'pago' in request.form
 
+            # Verificar se a conta pertence ao usuário
+            conta_validacao = Conta.query.filter_by(id=request.form['conta_id'], user_id=current_user.id).first()
+            if not conta_validacao:
+                flash('Conta não encontrada ou acesso negado!', 'error')
+                return redirect(url_for('main.nova_transacao'))
+
             transacao = Transacao(
                 descricao=request.form['descricao'],
                 valor=Decimal(request.form['valor']),
                 tipo=request.form['tipo'],
                 data=datetime.strptime(request.form['data'], '%Y-%m-%d').date(),
                 forma_pagamento='dinheiro',
-                conta_id=request.form['conta_id'],
+                conta_id=conta_validacao.id,
+                user_id=current_user.id,
                 categoria_id=request.form['categoria_id'],
                 recorrente=recorrente,
                 pago=pago
@@ -558,44 +343,31 @@ def nova_transacao():
                 transacao.frequencia_recorrencia = frequencia
                 transacao.data_inicio_recorrencia = data_inicio
                 transacao.quantidade_recorrencias = quantidade
+                transacao.numero_ocorrencia = 1
+                # Recorrência virtual (opcional): apenas esta transação é gravada
+                transacao.recorrencia_virtual = current_app.config.get('RECORRENCIAS_VIRTUAIS', False)
 
-            # Atualizar saldo da conta apenas se a transação estiver marcada como paga
-            # e a data for hoje ou no passado
-            if pago and transacao.data <= date.today():
-                conta = Conta.query.get(transacao.conta_id)
-                if transacao.tipo == 'receita':
-                    conta.saldo_atual += transacao.valor
-                else:
-                    conta.saldo_atual -= transacao.valor
-
+            # O saldo da conta é recalculado a partir das transações pagas ao gravar
             db.session.add(transacao)
             db.session.flush()  # Para obter o ID da transação
 
             # Se for recorrente, gerar transações futuras
             if recorrente:
                 try:
-                    transacoes_geradas = gerar_transacoes_recorrentes(
+                    total_geradas = gerar_recorrencias(
                         transacao,
                         frequencia,
                         data_inicio,
                         quantidade,
-                        pago_inicial=pago
+                        pago_inicial=pago,
+                        virtual=transacao.recorrencia_virtual
                     )
 
-                    # Atualizar saldo para transações passadas que foram marcadas como pagas
-                    if pago:
-                        conta = Conta.query.get(transacao.conta_id)
-                        for trans in transacoes_geradas:
-                            if trans.pago and trans.data <= date.today():
-                                if trans.tipo == 'receita':
-                                    conta.saldo_atual += trans.valor
-                                else:
-                                    conta.saldo_atual -= trans.valor
-
                     db.session.commit()
-
-                    total_geradas = len(transacoes_geradas)
-                    flash(f'Transação recorrente criada com sucesso! {total_geradas} transações foram geradas.', 'success')
+                    if transacao.recorrencia_virtual:
+                        flash(f'Transação recorrente criada com sucesso! As {quantidade} ocorrências serão exibidas automaticamente.', 'success')
+                    else:
+                        flash(f'Transação recorrente criada com sucesso! {total_geradas} transações foram geradas.', 'success')
                 except Exception as e:
                     db.session.rollback()
                     flash(f'Erro ao gerar transações recorrentes: {str(e)}', 'error')
@@ -617,18 +389,37 @@ def nova_transacao():
 @login_required
 def editar_transacao(id):
     """Editar uma transação existente"""
-    transacao = Transacao.query.join(Conta).filter(
+    transacao = Transacao.query.filter(
         Transacao.id == id,
-        Conta.user_id == current_user.id
+        Transacao.user_id == current_user.id
     ).first_or_404()
 
+    return _formulario_edicao(transacao)
+
+
+@bp.route('/transacoes/recorrencia/<int:regra_id>/<int:numero>/editar', methods=['GET', 'POST'])
+@login_required
+def editar_ocorrencia(regra_id, numero):
+    """Editar uma ocorrência de recorrência virtual (gravada ao salvar)"""
+    transacao = ocorrencia_para_gravar(regra_id, numero, current_user.id)
+    if transacao is None:
+        abort(404)
+
+    return _formulario_edicao(transacao)
+
+
+def _formulario_edicao(transacao):
+    """Exibe e processa o formulário de edição de uma transação (gravada ou ocorrência virtual)"""
     if request.method == 'POST':
-        # Reverter o efeito da transação anterior no saldo
-        conta_anterior = Conta.query.get(transacao.conta_id)
-        if transacao.tipo == 'receita':
-            conta_anterior.saldo_atual -= transacao.valor
-        else:
-            conta_anterior.saldo_atual += transacao.valor
+        # Verificar se a conta escolhida pertence ao usuário
+        nova_conta_id = int(request.form['conta_id'])
+        if not Conta.query.filter_by(id=nova_conta_id, user_id=current_user.id).first():
+            flash('Conta não encontrada ou acesso negado!', 'error')
+            return redirect(request.path)
+
+        # Ocorrência virtual: passa a ser gravada com os dados editados
+        if transacao.id is None:
+            db.session.add(transacao)
 
         # Atualizar os dados da transação
         transacao.descricao = request.form['descricao']
@@ -649,17 +440,10 @@ def editar_transacao(id):
             transacao.pago = 'pago' in request.form
 
         # Atualizar conta se foi alterada
-        nova_conta_id = int(request.form['conta_id'])
         if nova_conta_id != transacao.conta_id:
             transacao.conta_id = nova_conta_id
 
-        # Aplicar o novo efeito no saldo
-        conta_nova = Conta.query.get(transacao.conta_id)
-        if transacao.tipo == 'receita':
-            conta_nova.saldo_atual += transacao.valor
-        else:
-            conta_nova.saldo_atual -= transacao.valor
-
+        # Os saldos das contas (anterior e nova) são recalculados ao gravar
         db.session.commit()
         flash('Transação atualizada com sucesso!', 'success')
         return redirect(url_for('main.listar_transacoes'))
@@ -670,6 +454,7 @@ def editar_transacao(id):
     return render_template('transacoes/editar.html',
                          transacao=transacao,
                          contas=contas,
+                         saldos_contas=Conta.saldos(contas),
                          categorias=categorias,
                          cartoes=cartoes)
 
@@ -678,19 +463,11 @@ def editar_transacao(id):
 @login_required
 def deletar_transacao(id):
     """Deletar uma transação"""
-    transacao = Transacao.query.join(Conta).filter(
+    transacao = Transacao.query.filter(
         Transacao.id == id,
-        Conta.user_id == current_user.id
+        Transacao.user_id == current_user.id
     ).first_or_404()
 
-    # Reverter o efeito da transação no saldo (apenas se estava marcada como paga)
-    if transacao.pago:
-        conta = Conta.query.get(transacao.conta_id)
-        if transacao.tipo == 'receita':
-            conta.saldo_atual -= transacao.valor
-        else:
-            conta.saldo_atual += transacao.valor
-
     # Se for transação de cartão de crédito, atualizar fatura e limite
     if transacao.forma_pagamento == 'cartao_credito':
         # Atualizar valor da fatura
@@ -714,13 +491,62 @@ def deletar_transacao(id):
                     if cartao.limite_utilizado < 0:
                         cartao.limite_utilizado = 0
 
+    # Ocorrência de recorrência virtual: a exclusão fica registrada na regra,
+    # para a ocorrência não voltar a ser calculada
+    excluida = transacao.recorrencia_virtual and excluir_ocorrencia(
+        transacao.transacao_recorrente_pai_id or transacao.id, transacao.numero_ocorrencia or 1, current_user.id
+    )
+
     # Deletar a transação
-    db.session.delete(transacao)
+    if not excluida:
+        db.session.delete(transacao)
     db.session.commit()
     flash('Transação deletada com sucesso!', 'success')
     return redirect(url_for('main.listar_transacoes'))
 
 
+@bp.route('/transacoes/recorrencia/<int:regra_id>/<int:numero>/deletar', methods=['POST'])
+@login_required
+def deletar_ocorrencia(regra_id, numero):
+    """Deletar uma ocorrência de recorrência virtual (as demais continuam)"""
+    if not excluir_ocorrencia(regra_id, numero, current_user.id):
+        abort(404)
+
+    db.session.commit()
+    flash('Transação deletada com sucesso!', 'success')
+    return redirect(url_for('main.listar_transacoes'))
+
+
+@bp.route('/transacoes/recorrencia/<int:regra_id>/<int:numero>/toggle-pago', methods=['POST'])
+@login_required
+def toggle_pago_ocorrencia(regra_id, numero):
+    """Marcar/desmarcar como paga uma ocorrência de recorrência virtual (gravada ao ser paga)"""
+    transacao = ocorrencia_para_gravar(regra_id, numero, current_user.id)
+    if transacao is None:
+        return jsonify({'success': False, 'message': 'Ocorrência não encontrada'}), 404
+
+    if not transacao.pode_marcar_pago():
+        return jsonify({'success': False, 'message': 'Transações de cartão de crédito não podem ser marcadas individualmente'}), 400
+
+    if transacao.id is None:
+        db.session.add(transacao)
+
+    transacao.pago = not transacao.pago
+    db.session.commit()
+
+    if transacao.pago:
+        status_text = 'pago' if transacao.tipo == 'despesa' else 'recebido'
+        message = f'Transação marcada como {status_text}!'
+    else:
+        message = 'Status de pagamento removido'
+
+    return jsonify({
+        'success': True,
+        'pago': transacao.pago,
+        'message': message
+    })
+
+
 @bp.route('/transacoes/<int:id>/toggle-pago', methods=['POST'])
 @login_required
 def toggle_pago_transacao(id):
@@ -728,35 +554,20 @@ def toggle_pago_transacao(id):
     transacao = Transacao.query.get_or_404(id)
 
     # Verificar se a transação pertence ao usuário logado
-    if transacao.conta.user_id != current_user.id:
+    if transacao.user_id != current_user.id:
         return jsonify({'success': False, 'message': 'Acesso negado'}), 403
 
     # Verificar se a transação pode ser marcada como paga
     if not transacao.pode_marcar_pago():
         return jsonify({'success': False, 'message': 'Transações de cartão de crédito não podem ser marcadas individualmente'}), 400
 
-    # Obter a conta
-    conta = Conta.query.get(transacao.conta_id)
-
-    # Se está marcando como pago agora
+    # Se está marcando como pago agora (o saldo da conta é recalculado ao gravar)
     if not transacao.pago:
-        # Atualizar saldo da conta
-        if transacao.tipo == 'receita':
-            conta.saldo_atual += transacao.valor
-        else:  # despesa
-            conta.saldo_atual -= transacao.valor
-
         transacao.pago = True
         status_text = 'pago' if transacao.tipo == 'despesa' else 'recebido'
         message = f'Transação marcada como {status_text}!'
     else:
         # Se está desmarcando como pago
-        # Reverter o efeito no saldo
-        if transacao.tipo == 'receita':
-            conta.saldo_atual -= transacao.valor
-        else:  # despesa
-            conta.saldo_atual += transacao.valor
-
         transacao.pago = False
         message = 'Status de pagamento removido'
 
@@ -792,17 +603,12 @@ def criar_transacao_inline():
             tipo=data['tipo'],
             data=datetime.strptime(data['data'], '%Y-%m-%d').date(),
             categoria_id=int(data['categoria_id']),
-            conta_id=int(data['conta_id']),
+            conta_id=conta.id,
+            user_id=current_user.id,
             forma_pagamento='dinheiro',
-            pago=data.get('pago', False)
+            pago=bool(data.get('pago', False))
         )
 
-        # Atualizar saldo da conta
-        if transacao.tipo == 'receita':
-            conta.saldo_atual += transacao.valor
-        else:
-            conta.saldo_atual -= transacao.valor
-
         db.session.add(transacao)
         db.session.commit()
 
@@ -817,60 +623,6 @@ def criar_transacao_inline():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-def obter_ou_criar_fatura(cartao, data_referencia):
-    """Obtém ou cria uma fatura para o cartão no mês de referência"""
-    mes = data_referencia.month
-    ano = data_referencia.year
-
-    # Tentar encontrar fatura existente
-    fatura = Fatura.query.filter_by(
-        cartao_id=cartao.id,
-        mes_referencia=mes,
-        ano_referencia=ano
-    ).first()
-
-    if fatura:
-        return fatura
-
-    # Criar nova fatura
-    # Calcular data de fechamento
-    ultimo_dia_mes = monthrange(ano, mes)[1]
-    if cartao.dia_fechamento > ultimo_dia_mes:
-        data_fechamento = date(ano, mes, ultimo_dia_mes)
-    else:
-        data_fechamento = date(ano, mes, cartao.dia_fechamento)
-
-    # Calcular data de vencimento (mês seguinte)
-    if mes == 12:
-        mes_vencimento = 1
-        ano_vencimento = ano + 1
-    else:
-        mes_vencimento = mes + 1
-        ano_vencimento = ano
-
-    ultimo_dia_vencimento = monthrange(ano_vencimento, mes_vencimento)[1]
-    if cartao.dia_vencimento > ultimo_dia_vencimento:
-        data_vencimento = date(ano_vencimento, mes_vencimento, ultimo_dia_vencimento)
-    else:
-        data_vencimento = date(ano_vencimento, mes_vencimento, cartao.dia_vencimento)
-
-    fatura = Fatura(
-        cartao_id=cartao.id,
-        mes_referencia=mes,
-        ano_referencia=ano,
-        data_fechamento=data_fechamento,
-        data_vencimento=data_vencimento,
-        valor_total=Decimal('0.00'),
-        valor_pago=Decimal('0.00'),
-        status='aberta'
-    )
-
-    db.session.add(fatura)
-    db.session.flush()
-
-    return fatura
-
-
 def recalcular_valor_fatura(fatura_id):
     """
     Recalcula o valor total de uma fatura baseado nas transações vinculadas.
@@ -895,76 +647,6 @@ def recalcular_valor_fatura(fatura_id):
     return valor_total
 
 
-def gerar_transacoes_recorrentes(transacao_base, frequencia, data_inicio, quantidade, pago_inicial=False):
-    """
-    Gera transações recorrentes baseadas em uma transação modelo.
-
-    Args:
-        transacao_base: Transação que servirá como modelo
-        frequencia: 'semanal', 'quinzenal', 'mensal', 'bimestral', 'trimestral', 'semestral', 'anual'
-        data_inicio: Data da primeira transação
-        quantidade: Número de vezes que a transação deve se repetir
-        pago_inicial: Se as transações devem ser marcadas como pagas
-
-    Returns:
-        Lista de transações criadas
-    """
-    transacoes_criadas = []
-
-    # Validar quantidade
-    if quantidade < 1 or quantidade > 100:
-        raise ValueError('A quantidade deve estar entre 1 e 100')
-
-    # Determinar o intervalo baseado na frequência
-    intervalos = {
-        'semanal': relativedelta(weeks=1),
-        'quinzenal': relativedelta(weeks=2),
-        'mensal': relativedelta(months=1),
-        'bimestral': relativedelta(months=2),
-        'trimestral': relativedelta(months=3),
-        'semestral': relativedelta(months=6),
-        'anual': relativedelta(years=1)
-    }
-
-    if frequencia not in intervalos:
-        raise ValueError(f'Frequência inválida: {frequencia}')
-
-    intervalo = intervalos[frequencia]
-    # Começar da segunda ocorrência, pois a primeira já é a transacao_base
-    data_atual = data_inicio + intervalo
-
-    # Gerar a quantidade especificada de transações (menos 1, pois a primeira já existe)
-    for i in range(quantidade - 1):
-        # Determinar se esta transação específica deve ser marcada como paga
-        # Apenas transações passadas devem ser marcadas como pagas
-        transacao_paga = pago_inicial and data_atual <= date.today()
-
-        # Criar nova transação
-        nova_transacao = Transacao(
-            descricao=transacao_base.descricao,
-            valor=transacao_base.valor,
-            tipo=transacao_base.tipo,
-            data=data_atual,
-            forma_pagamento=transacao_base.forma_pagamento,
-            conta_id=transacao_base.conta_id,
-            categoria_id=transacao_base.categoria_id,
-            recorrente=True,
-            frequencia_recorrencia=frequencia,
-            data_inicio_recorrencia=data_inicio,
-            quantidade_recorrencias=quantidade,
-            transacao_recorrente_pai_id=transacao_base.id,
-            pago=transacao_paga
-        )
-
-        db.session.add(nova_transacao)
-        transacoes_criadas.append(nova_transacao)
-
-        # Avançar para a próxima data
-        data_atual += intervalo
-
-    return transacoes_criadas
-
-
 # ==================== CATEGORIAS ====================
 
 @bp.route('/categorias')
@@ -1116,7 +798,7 @@ def editar_cartao(id):
 @login_required
 def listar_faturas():
     """Lista todas as faturas"""
-    faturas = Fatura.query.join(CartaoCredito).filter(
+    faturas = Fatura.query.options(*perfil('faturas')).join(CartaoCredito).filter(
         CartaoCredito.user_id == current_user.id
     ).order_by(Fatura.ano_referencia.desc(), Fatura.mes_referencia.desc()).all()
     return render_template('faturas/listar.html', faturas=faturas)
@@ -1153,13 +835,14 @@ def nova_fatura():
 @login_required
 def ver_fatura(id):
     """Ver detalhes de uma fatura"""
-    fatura = Fatura.query.join(CartaoCredito).filter(
+    fatura = Fatura.query.options(*perfil('faturas')).join(CartaoCredito).filter(
         Fatura.id == id,
         CartaoCredito.user_id == current_user.id
     ).first_or_404()
-    transacoes = Transacao.query.filter_by(fatura_id=id).all()
+    transacoes = Transacao.query.options(*perfil('transacoes')).filter_by(fatura_id=id).all()
     contas = Conta.query.filter_by(ativa=True, user_id=current_user.id).all()
-    return render_template('faturas/detalhes.html', fatura=fatura, transacoes=transacoes, contas=contas)
+    return render_template('faturas/detalhes.html', fatura=fatura, transacoes=transacoes, contas=contas,
+                           saldos_contas=Conta.saldos(contas))
 
 
 @bp.route('/faturas/<int:id>/pagar', methods=['POST'])
@@ -1181,6 +864,8 @@ def pagar_fatura(id):
 
     # Criar transação de pagamento na conta
     if 'conta_id' in request.form:
+        conta = Conta.query.filter_by(id=request.form['conta_id'], user_id=current_user.id).first_or_404()
+
         # Obter ou criar categoria para pagamento de fatura do usuário logado
         categoria_fatura = Categoria.query.filter_by(nome='Pagamento de Fatura', user_id=current_user.id).first()
         if not categoria_fatura:
@@ -1193,14 +878,12 @@ def pagar_fatura(id):
             valor=valor_pago,
             tipo='despesa',
             data=date.today(),
-            conta_id=request.form['conta_id'],
+            conta_id=conta.id,
+            user_id=current_user.id,
             categoria_id=categoria_fatura.id,
-            pago=True  # Marcar como pago automaticamente
+            pago=True  # Marcar como pago automaticamente (debita o saldo da conta)
         )
 
-        conta = Conta.query.get(request.form['conta_id'])
-        conta.saldo_atual -= valor_pago
-
         db.session.add(transacao)
 
     db.session.commit()
@@ -1226,13 +909,13 @@ def api_gastos_por_categoria():
 
     resultados = db.session.query(
         Categoria.nome,
-        func.sum(Transacao.valor).label('total')
-    ).join(Transacao).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'despesa',
-        extract('month', Transacao.data) == mes,
-        extract('year', Transacao.data) == ano
-    ).group_by(Categoria.nome).all()
+        func.sum(ResumoMensal.total).label('total')
+    ).join(ResumoMensal, ResumoMensal.categoria_id == Categoria.id).filter(
+        ResumoMensal.user_id == current_user.id,
+        ResumoMensal.tipo == 'despesa',
+        ResumoMensal.mes == mes,
+        ResumoMensal.ano == ano
+    ).group_by(Categoria.nome).having(func.sum(ResumoMensal.quantidade) > 0).all()
 
     return jsonify({
         'categorias': [r[0] for r in resultados],
@@ -1246,27 +929,18 @@ def api_fluxo_caixa():
     """API: Fluxo de caixa mensal (para gráficos)"""
     ano = request.args.get('ano', datetime.now().year, type=int)
 
-    receitas = db.session.query(
-        extract('month', Transacao.data).label('mes'),
-        func.sum(Transacao.valor).label('total')
-    ).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'receita',
-        extract('year', Transacao.data) == ano
-    ).group_by('mes').all()
-
-    despesas = db.session.query(
-        extract('month', Transacao.data).label('mes'),
-        func.sum(Transacao.valor).label('total')
-    ).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'despesa',
-        extract('year', Transacao.data) == ano
-    ).group_by('mes').all()
+    totais = db.session.query(
+        ResumoMensal.mes,
+        ResumoMensal.tipo,
+        func.sum(ResumoMensal.total).label('total')
+    ).filter(
+        ResumoMensal.user_id == current_user.id,
+        ResumoMensal.ano == ano
+    ).group_by(ResumoMensal.mes, ResumoMensal.tipo).having(func.sum(ResumoMensal.quantidade) > 0).all()
 
     # Converter para dicionários para facilitar o merge
-    receitas_dict = {int(r[0]): float(r[1]) for r in receitas}
-    despesas_dict = {int(d[0]): float(d[1]) for d in despesas}
+    receitas_dict = {r.mes: float(r.total) for r in totais if r.tipo == 'receita'}
+    despesas_dict = {r.mes: float(r.total) for r in totais if r.tipo == 'despesa'}
 
     meses = list(range(1, 13))
     dados_receitas = [receitas_dict.get(m, 0) for m in meses]
@@ -1284,68 +958,39 @@ def api_fluxo_caixa():
 def api_evolucao_patrimonial():
     """API: Evolução patrimonial ao longo do tempo"""
     periodo = request.args.get('periodo', 'ano')  # mes, ano, tudo
+    pontos = request.args.get('pontos', 400, type=int)  # máximo de pontos no gráfico
 
     # Buscar todas as contas do usuário
     contas = Conta.query.filter_by(user_id=current_user.id).all()
-    saldo_atual = sum(conta.saldo_atual for conta in contas)
+    saldo_atual = sum(Conta.saldos(contas).values())
+    saldo_inicial = sum(conta.saldo_inicial or 0 for conta in contas)
 
-    # Calcular evolução baseada nas transações
+    # Período: intervalo explícito (inicio/fim em AAAA-MM-DD) ou atalhos
+    fim = date.today()
     if periodo == 'mes':
         # Últimos 30 dias
-        inicio = date.today() - relativedelta(days=30)
-        agrupamento = extract('day', Transacao.data)
+        inicio = fim - relativedelta(days=30)
     elif periodo == 'ano':
         # Últimos 12 meses
-        inicio = date.today() - relativedelta(months=12)
-        agrupamento = extract('month', Transacao.data)
+        inicio = fim - relativedelta(months=12)
     else:
         # Todo o histórico
-        inicio = date(2020, 1, 1)
-        agrupamento = extract('month', Transacao.data)
-
-    # Buscar transações agrupadas
-    transacoes = db.session.query(
-        Transacao.data,
-        Transacao.tipo,
-        func.sum(Transacao.valor).label('total')
-    ).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.data >= inicio,
-        Transacao.pago == True
-    ).group_by(Transacao.data, Transacao.tipo).order_by(Transacao.data).all()
-
-    # Calcular patrimônio regressivamente
-    datas = []
-    valores = []
-    saldo_temp = float(saldo_atual)
-
-    # Criar dicionário de variações diárias
-    variacoes = defaultdict(float)
-    for t in reversed(transacoes):
-        data_str = t.data.strftime('%Y-%m-%d')
-        if t.tipo == 'receita':
-            variacoes[data_str] -= float(t.total)
-        else:
-            variacoes[data_str] += float(t.total)
-
-    # Gerar pontos do gráfico (do passado para o presente)
-    data_atual = inicio
-    while data_atual <= date.today():
-        data_str = data_atual.strftime('%Y-%m-%d')
-        if data_str in variacoes:
-            saldo_temp -= variacoes[data_str]
-        datas.append(data_str)
-        valores.append(round(saldo_temp, 2))
-        data_atual += relativedelta(days=1)
-        saldo_temp += variacoes.get(data_str, 0)
-
-    # Reverter para ordem correta
-    datas.reverse()
-    valores.reverse()
+        inicio = None
+
+    try:
+        if request.args.get('inicio'):
+            inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d').date()
+        if request.args.get('fim'):
+            fim = datetime.strptime(request.args['fim'], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Data inválida (use AAAA-MM-DD)'}), 400
+
+    # Saldos diários persistidos, já amostrados para a quantidade de pontos
+    serie = SaldoDiario.serie(current_user.id, inicio, fim, pontos)
 
     return jsonify({
-        'datas': datas,
-        'valores': valores,
+        'datas': [dia.strftime('%Y-%m-%d') for dia, _ in serie],
+        'valores': [round(float(saldo_inicial + acumulado), 2) for _, acumulado in serie],
         'saldo_atual': float(saldo_atual)
     })
 
@@ -1394,11 +1039,11 @@ def api_orcamentos_vs_realizado():
     mes = request.args.get('mes', datetime.now().month, type=int)
     ano = request.args.get('ano', datetime.now().year, type=int)
 
-    orcamentos = Orcamento.query.filter_by(
+    orcamentos = Orcamento.carregar_gastos(Orcamento.query.options(*perfil('orcamentos')).filter_by(
         user_id=current_user.id,
         mes=mes,
         ano=ano
-    ).all()
+    ).all())
 
     dados = []
     for orc in orcamentos:
@@ -1426,7 +1071,7 @@ def api_orcamentos_vs_realizado():
 @login_required
 def api_progresso_metas():
     """API: Progresso das metas de economia"""
-    metas = Meta.query.filter_by(
+    metas = Meta.query.options(*perfil('metas')).filter_by(
         user_id=current_user.id,
         status='ativa'
     ).all()
@@ -1476,6 +1121,8 @@ def api_comparacao_periodos():
 
     hoje = date.today()
 
+    # Limites de cada período (sempre meses completos)
+    intervalos = []
     for i in range(quantidade - 1, -1, -1):
         if tipo == 'mensal':
             data_ref = hoje - relativedelta(months=i)
@@ -1494,21 +1141,34 @@ def api_comparacao_periodos():
             fim_periodo = date(data_ref.year, 12, 31)
             label = str(data_ref.year)
 
-        # Buscar receitas do período
-        total_receitas = db.session.query(func.sum(Transacao.valor)).join(Conta).filter(
-            Conta.user_id == current_user.id,
-            Transacao.tipo == 'receita',
-            Transacao.data >= inicio_periodo,
-            Transacao.data <= fim_periodo
-        ).scalar() or 0
-
-        # Buscar despesas do período
-        total_despesas = db.session.query(func.sum(Transacao.valor)).join(Conta).filter(
-            Conta.user_id == current_user.id,
-            Transacao.tipo == 'despesa',
-            Transacao.data >= inicio_periodo,
-            Transacao.data <= fim_periodo
-        ).scalar() or 0
+        intervalos.append((label, inicio_periodo, fim_periodo))
+
+    # Totais mensais de todo o intervalo em uma única consulta
+    totais_mes = defaultdict(lambda: {'receita': 0, 'despesa': 0})
+    if intervalos:
+        inicio = min(inicio for _, inicio, _ in intervalos)
+        fim = max(fim for _, _, fim in intervalos)
+        totais = db.session.query(
+            ResumoMensal.ano,
+            ResumoMensal.mes,
+            ResumoMensal.tipo,
+            func.sum(ResumoMensal.total).label('total')
+        ).filter(
+            ResumoMensal.user_id == current_user.id,
+            ResumoMensal.ano.between(inicio.year, fim.year)
+        ).group_by(ResumoMensal.ano, ResumoMensal.mes, ResumoMensal.tipo).all()
+
+        for r in totais:
+            if r.tipo in ('receita', 'despesa'):
+                totais_mes[(r.ano, r.mes)][r.tipo] = r.total
+
+    for label, inicio_periodo, fim_periodo in intervalos:
+        meses_periodo = [
+            (ano, mes) for ano, mes in totais_mes
+            if inicio_periodo <= date(ano, mes, 1) <= fim_periodo
+        ]
+        total_receitas = sum(totais_mes[m]['receita'] for m in meses_periodo)
+        total_despesas = sum(totais_mes[m]['despesa'] for m in meses_periodo)
 
         periodos.append(label)
         receitas.append(float(total_receitas))
@@ -1534,14 +1194,16 @@ def api_top_categorias():
     resultados = db.session.query(
         Categoria.nome,
         Categoria.cor,
-        func.sum(Transacao.valor).label('total'),
-        func.count(Transacao.id).label('quantidade')
-    ).join(Transacao).join(Conta).filter(
-        Conta.user_id == current_user.id,
-        Transacao.tipo == 'despesa',
-        extract('month', Transacao.data) == mes,
-        extract('year', Transacao.data) == ano
-    ).group_by(Categoria.nome, Categoria.cor).order_by(func.sum(Transacao.valor).desc()).limit(limite).all()
+        func.sum(ResumoMensal.total).label('total'),
+        func.sum(ResumoMensal.quantidade).label('quantidade')
+    ).join(ResumoMensal, ResumoMensal.categoria_id == Categoria.id).filter(
+        ResumoMensal.user_id == current_user.id,
+        ResumoMensal.tipo == 'despesa',
+        ResumoMensal.mes == mes,
+        ResumoMensal.ano == ano
+    ).group_by(Categoria.nome, Categoria.cor).having(
+        func.sum(ResumoMensal.quantidade) > 0
+    ).order_by(func.sum(ResumoMensal.total).desc()).limit(limite).all()
 
     categorias = []
     valores = []
@@ -1578,8 +1240,8 @@ def api_analise_recorrentes():
         Transacao.frequencia_recorrencia,
         Categoria.nome.label('categoria'),
         func.min(Transacao.data).label('proxima_data')
-    ).join(Categoria).join(Conta).filter(
-        Conta.user_id == current_user.id,
+    ).join(Categoria).filter(
+        Transacao.user_id == current_user.id,
         Transacao.recorrente == True,
         Transacao.data >= hoje,
         Transacao.data <= proximo_mes
@@ -1590,6 +1252,15 @@ def api_analise_recorrentes():
         Categoria.nome
     ).all()
 
+    # Incluir as ocorrências de recorrências virtuais (mesmo agrupamento)
+    ocorrencias = buscar_ocorrencias(current_user.id, hoje, proximo_mes)
+    if ocorrencias:
+        proximas = {tuple(rec[:4]): rec[4] for rec in recorrentes}
+        for o in ocorrencias:
+            chave = (o.descricao, o.valor, o.frequencia_recorrencia, o.categoria.nome)
+            proximas[chave] = min(proximas.get(chave, o.data), o.data)
+        recorrentes = [chave + (proxima_data,) for chave, proxima_data in proximas.items()]
+
     dados = []
     total_mensal = 0
 
@@ -1633,7 +1304,7 @@ def api_analise_recorrentes():
 @login_required
 def conciliacao_lista():
     """Lista de conciliações bancárias"""
-    conciliacoes = ConciliacaoBancaria.query.filter_by(
+    conciliacoes = ConciliacaoBancaria.query.options(*perfil('conciliacoes')).filter_by(
         user_id=current_user.id
     ).order_by(ConciliacaoBancaria.data_upload.desc()).all()
 
@@ -1678,57 +1349,22 @@ def conciliacao_nova():
                 flash('Formato de arquivo não reconhecido. Use OFX ou CSV.', 'danger')
                 return redirect(request.url)
 
-            # Parsear arquivo
-            resultado = parse_file(arquivo_content, formato)
-
-            if resultado['total'] == 0:
-                flash('Nenhuma transação encontrada no arquivo', 'warning')
-                return redirect(request.url)
-
-            # Criar conciliação
+            # Criar conciliação; parse e matching rodam em segundo plano
             conciliacao = ConciliacaoBancaria(
                 user_id=current_user.id,
                 conta_id=conta_id,
                 arquivo_nome=arquivo_nome,
                 formato=formato,
                 status='processando',
-                total_linhas=resultado['total'],
-                data_inicio=resultado['date_range'][0],
-                data_fim=resultado['date_range'][1]
+                progresso=0,
+                arquivo_conteudo=arquivo_content
             )
             db.session.add(conciliacao)
-            db.session.flush()  # Para obter o ID
-
-            # Processar matching
-            itens_processados = processar_matching(
-                resultado['transactions'],
-                conta_id,
-                current_user.id
-            )
-
-            # Criar itens de conciliação
-            for item in itens_processados:
-                melhor_match = item.get('melhor_match')
-                item_conciliacao = ItemConciliacao(
-                    conciliacao_id=conciliacao.id,
-                    data=item['data'],
-                    descricao=item['descricao'],
-                    valor=item['valor'],
-                    tipo=item['tipo'],
-                    numero_documento=item.get('numero_documento'),
-                    saldo_apos=item.get('saldo_apos'),
-                    status='pendente',
-                    transacao_id=melhor_match[0].id if melhor_match else None,
-                    categoria_sugerida_id=item['categoria_sugerida'].id if item['categoria_sugerida'] else None,
-                    score_matching=item['score_matching']
-                )
-                db.session.add(item_conciliacao)
-
-            # Atualizar status
-            conciliacao.status = 'pendente_revisao'
             db.session.commit()
 
-            flash(f'Arquivo processado com sucesso! {resultado["total"]} transações encontradas.', 'success')
+            conciliacao_jobs.enfileirar(conciliacao.id)
+
+            flash('Arquivo recebido! As transações estão sendo processadas.', 'info')
             return redirect(url_for('main.conciliacao_revisar', id=conciliacao.id))
 
         except Exception as e:
@@ -1738,20 +1374,20 @@ def conciliacao_nova():
 
     # GET: Mostrar formulário
     contas = Conta.query.filter_by(user_id=current_user.id, ativa=True).all()
-    return render_template('conciliacao/nova.html', contas=contas)
+    return render_template('conciliacao/nova.html', contas=contas, saldos_contas=Conta.saldos(contas))
 
 
 @bp.route('/conciliacao/<int:id>/revisar')
 @login_required
 def conciliacao_revisar(id):
     """Revisar itens da conciliação e confirmar matches"""
-    conciliacao = ConciliacaoBancaria.query.filter_by(
+    conciliacao = ConciliacaoBancaria.query.options(*perfil('conciliacoes')).filter_by(
         id=id,
         user_id=current_user.id
     ).first_or_404()
 
     # Buscar itens
-    itens = ItemConciliacao.query.filter_by(
+    itens = ItemConciliacao.query.options(*perfil('itens_conciliacao')).filter_by(
         conciliacao_id=conciliacao.id
     ).order_by(ItemConciliacao.data.desc()).all()
 
@@ -1775,6 +1411,26 @@ def conciliacao_revisar(id):
     )
 
 
+@bp.route('/conciliacao/<int:id>/progresso')
+@login_required
+def conciliacao_progresso(id):
+    """API: Andamento do processamento da conciliação (consultado pela tela de revisão)"""
+    conciliacao = ConciliacaoBancaria.query.filter_by(
+        id=id,
+        user_id=current_user.id
+    ).first_or_404()
+
+    # Job perdido (ex.: processo reiniciado) volta para a fila
+    conciliacao_jobs.reenfileirar_se_parada(conciliacao)
+
+    return jsonify({
+        'status': conciliacao.status,
+        'progresso': conciliacao.progresso or 0,
+        'total_linhas': conciliacao.total_linhas or 0,
+        'mensagem_erro': conciliacao.mensagem_erro
+    })
+
+
 @bp.route('/conciliacao/<int:id>/processar', methods=['POST'])
 @login_required
 def conciliacao_processar(id):
@@ -1784,29 +1440,42 @@ def conciliacao_processar(id):
         user_id=current_user.id
     ).first_or_404()
 
+    if conciliacao.status != 'pendente_revisao':
+        flash('Esta conciliação não está disponível para revisão', 'warning')
+        return redirect(url_for('main.conciliacao_revisar', id=id))
+
     try:
         # Obter ações do formulário
         acoes = request.form.getlist('acao')  # Lista de ações no formato "item_id:acao:transacao_id"
 
-        linhas_conciliadas = 0
-        linhas_importadas = 0
-
+        acoes_por_item = {}
         for acao_str in acoes:
             partes = acao_str.split(':')
             if len(partes) < 2:
                 continue
+            acoes_por_item[int(partes[0])] = partes
+
+        # Carregar todos os itens das ações em uma única consulta
+        itens = {
+            item.id: item for item in db.session.query(
+                ItemConciliacao.id, ItemConciliacao.transacao_id, ItemConciliacao.categoria_sugerida_id,
+                ItemConciliacao.descricao, ItemConciliacao.valor, ItemConciliacao.tipo, ItemConciliacao.data
+            ).filter(
+                ItemConciliacao.conciliacao_id == conciliacao.id,
+                ItemConciliacao.id.in_(acoes_por_item)
+            ).all()
+        }
 
-            item_id = int(partes[0])
-            acao = partes[1]
-
-            item = ItemConciliacao.query.filter_by(
-                id=item_id,
-                conciliacao_id=conciliacao.id
-            ).first()
+        alteracoes = {}
+        importacoes = []  # (item_id, dados da nova transação)
 
+        for item_id, partes in acoes_por_item.items():
+            item = itens.get(item_id)
             if not item:
                 continue
 
+            acao = partes[1]
+
             if acao == 'conciliar':
                 # Conciliar com transação existente
                 if len(partes) >= 3:
@@ -1815,9 +1484,7 @@ def conciliacao_processar(id):
                     transacao_id = item.transacao_id
 
                 if transacao_id:
-                    item.transacao_id = transacao_id
-                    item.status = 'conciliado'
-                    linhas_conciliadas += 1
+                    alteracoes[item_id] = {'status': 'conciliado', 'transacao_id': transacao_id}
 
             elif acao == 'importar':
                 # Importar como nova transação
@@ -1825,26 +1492,31 @@ def conciliacao_processar(id):
                 if not categoria_id:
                     categoria_id = item.categoria_sugerida_id
 
-                nova_transacao = Transacao(
-                    descricao=item.descricao,
-                    valor=item.valor,
-                    tipo=item.tipo,
-                    data=item.data,
-                    conta_id=conciliacao.conta_id,
-                    categoria_id=categoria_id,
-                    pago=True,  # Transações do extrato já foram pagas
-                    forma_pagamento='dinheiro'
-                )
-                db.session.add(nova_transacao)
-                db.session.flush()
-
-                item.transacao_id = nova_transacao.id
-                item.status = 'importado'
-                linhas_importadas += 1
+                importacoes.append((item_id, {
+                    'descricao': item.descricao,
+                    'valor': item.valor,
+                    'tipo': item.tipo,
+                    'data': item.data,
+                    'conta_id': conciliacao.conta_id,
+                    'user_id': conciliacao.user_id,
+                    'categoria_id': categoria_id,
+                    'pago': True,  # Transações do extrato já foram pagas
+                    'forma_pagamento': 'dinheiro'
+                }))
 
             elif acao == 'ignorar':
                 # Ignorar item
-                item.status = 'ignorado'
+                alteracoes[item_id] = {'status': 'ignorado', 'transacao_id': item.transacao_id}
+
+        # Criar as transações importadas (INSERT em lote) e vincular aos itens
+        transacao_ids = Transacao.inserir_em_lote([dados for _, dados in importacoes])
+        for (item_id, _), transacao_id in zip(importacoes, transacao_ids):
+            alteracoes[item_id] = {'status': 'importado', 'transacao_id': transacao_id}
+
+        ItemConciliacao.atualizar_em_lote(alteracoes)
+
+        linhas_conciliadas = sum(1 for alteracao in alteracoes.values() if alteracao['status'] == 'conciliado')
+        linhas_importadas = len(transacao_ids)
 
         # Atualizar estatísticas da conciliação
         conciliacao.linhas_conciliadas = linhas_conciliadas
@@ -1907,11 +1579,11 @@ def listar_orcamentos():
         ano_proximo = ano
 
     # Buscar orçamentos do mês
-    orcamentos = Orcamento.query.filter_by(
+    orcamentos = Orcamento.carregar_gastos(Orcamento.query.options(*perfil('orcamentos')).filter_by(
         user_id=current_user.id,
         mes=mes,
         ano=ano
-    ).all()
+    ).all())
 
     # Buscar categorias de despesa sem orçamento neste mês
     categorias_com_orcamento = [o.categoria_id for o in orcamentos]
@@ -2048,13 +1720,13 @@ def deletar_orcamento(id):
 def listar_metas():
     """Lista todas as metas"""
     # Buscar metas ativas
-    metas_ativas = Meta.query.filter_by(
+    metas_ativas = Meta.query.options(*perfil('metas')).filter_by(
         user_id=current_user.id,
         status='ativa'
     ).order_by(Meta.data_fim).all()
 
     # Buscar metas concluídas (últimas 5)
-    metas_concluidas = Meta.query.filter_by(
+    metas_concluidas = Meta.query.options(*perfil('metas')).filter_by(
         user_id=current_user.id,
         status='concluida'
     ).order_by(Meta.data_conclusao.desc()).limit(5).all()
@@ -2121,7 +1793,7 @@ def nova_meta():
 @login_required
 def ver_meta(id):
     """Ver detalhes de uma meta"""
-    meta = Meta.query.filter_by(
+    meta = Meta.query.options(*perfil('metas')).filter_by(
         id=id,
         user_id=current_user.id
     ).first_or_404()
@@ -2276,3 +1948,22 @@ def cancelar_meta(id):
     db.session.commit()
     flash('Meta cancelada!', 'info')
     return redirect(url_for('main.listar_metas'))
+
+
+# ==================== ADMINISTRAÇÃO ====================
+
+@bp.route('/api/admin/desempenho')
+@login_required
+def api_admin_desempenho():
+    """API: Percentis de tempo e de consultas SQL por endpoint (ADMIN_EMAILS)"""
+    if current_user.email.lower() not in current_app.config.get('ADMIN_EMAILS', set()):
+        abort(403)
+
+    from app.perfilamento import estatisticas
+
+    # As amostras ficam na memória de cada processo (worker) do gunicorn
+    return jsonify({
+        'processo': os.getpid(),
+        'consulta_lenta_ms': current_app.config.get('CONSULTA_LENTA_MS'),
+        'endpoints': estatisticas()
+    })
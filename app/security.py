@@ -3,20 +3,30 @@ Módulo de segurança centralizado
 """
 import re
 import logging
-from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, abort, current_app, session
 from flask_login import current_user
 import bleach
-from collections import defaultdict
+
+from app.contadores import contar_na_janela
 
 # Configurar logging de segurança
 security_logger = logging.getLogger('security')
 security_logger.setLevel(logging.INFO)
 
-# Armazenamento de tentativas de login (em produção, usar Redis)
-login_attempts = defaultdict(list)
-blocked_ips = {}
+
+# Endpoints que não passam pelo middleware de segurança (arquivos estáticos e health check)
+ENDPOINTS_SEM_VERIFICACAO = frozenset({'static', 'main.saude'})
+
+
+def _contadores():
+    """Armazenamento compartilhado das tentativas de login e bloqueios (app/contadores.py)"""
+    return current_app.extensions['contadores_seguranca']
+
+
+def _bloqueios():
+    """Cache local das consultas de bloqueio de IP (app/contadores.CacheBloqueios)"""
+    return current_app.extensions['bloqueios_ip']
 
 
 def sanitize_input(text, strip=True):
@@ -125,15 +135,14 @@ def get_client_ip():
     """
     Obtém o IP real do cliente, considerando proxies
 
+    O X-Forwarded-For dos PROXIES_CONFIAVEIS já foi resolvido pelo ProxyFix
+    (create_app) uma vez por requisição, em request.remote_addr; entradas
+    acrescentadas pelo próprio cliente são ignoradas.
+
     Returns:
         IP do cliente
     """
-    if request.headers.get('X-Forwarded-For'):
-        return request.headers.get('X-Forwarded-For').split(',')[0].strip()
-    elif request.headers.get('X-Real-IP'):
-        return request.headers.get('X-Real-IP')
-    else:
-        return request.remote_addr
+    return request.remote_addr
 
 
 def is_ip_blocked(ip):
@@ -146,14 +155,8 @@ def is_ip_blocked(ip):
     Returns:
         True se bloqueado, False caso contrário
     """
-    if ip in blocked_ips:
-        block_time = blocked_ips[ip]
-        if datetime.now() < block_time:
-            return True
-        else:
-            # Desbloqueio automático
-            del blocked_ips[ip]
-    return False
+    # O bloqueio expira sozinho no armazenamento (desbloqueio automático)
+    return _bloqueios().bloqueado(ip)
 
 
 def block_ip(ip, duration_minutes=15):
@@ -164,44 +167,32 @@ def block_ip(ip, duration_minutes=15):
         ip: Endereço IP
         duration_minutes: Duração do bloqueio em minutos
     """
-    blocked_ips[ip] = datetime.now() + timedelta(minutes=duration_minutes)
-    security_logger.warning(f"IP bloqueado: {ip} até {blocked_ips[ip]}")
+    _bloqueios().bloquear(ip, duration_minutes * 60)
+    security_logger.warning(f"IP bloqueado: {ip} por {duration_minutes} minutos")
 
 
 def record_login_attempt(ip, success=False):
     """
     Registra tentativa de login
 
+    As falhas são contadas em uma janela deslizante de LOGIN_ATTEMPT_TIMEOUT
+    segundos, compartilhada entre os workers.
+
     Args:
         ip: Endereço IP
         success: Se o login foi bem-sucedido
 
     Returns:
-        Número de tentativas falhadas recentes
+        Número de tentativas falhadas recentes (0 em caso de sucesso)
     """
-    now = datetime.now()
-    timeout = timedelta(minutes=current_app.config.get('LOGIN_ATTEMPT_TIMEOUT', 900) / 60)
-
-    # Limpar tentativas antigas
-    login_attempts[ip] = [
-        attempt for attempt in login_attempts[ip]
-        if now - attempt['time'] < timeout
-    ]
-
-    # Registrar nova tentativa
-    login_attempts[ip].append({
-        'time': now,
-        'success': success
-    })
-
-    # Contar falhas
-    failed_attempts = sum(1 for a in login_attempts[ip] if not a['success'])
-
-    # Logar tentativa
     if success:
         security_logger.info(f"Login bem-sucedido de {ip}")
-    else:
-        security_logger.warning(f"Tentativa de login falhada de {ip} ({failed_attempts} falhas recentes)")
+        return 0
+
+    timeout = current_app.config.get('LOGIN_ATTEMPT_TIMEOUT', 900)
+    failed_attempts = contar_na_janela(_contadores(), f'login/{ip}', timeout)
+
+    security_logger.warning(f"Tentativa de login falhada de {ip} ({failed_attempts} falhas recentes)")
 
     # Bloquear se exceder limite
     max_attempts = current_app.config.get('MAX_LOGIN_ATTEMPTS', 5)
@@ -212,6 +203,40 @@ def record_login_attempt(ip, success=False):
     return failed_attempts
 
 
+def registrar_middleware(app):
+    """
+    Registra o middleware de segurança (before_request): IP bloqueado e
+    tamanho do conteúdo
+
+    O cache de bloqueios e o limite de tamanho são resolvidos aqui, uma vez;
+    arquivos estáticos e o health check (ENDPOINTS_SEM_VERIFICACAO) não são
+    verificados.
+
+    Args:
+        app: aplicação Flask
+    """
+    bloqueios = app.extensions['bloqueios_ip']
+    max_size = app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+
+    def verificar_requisicao():
+        if request.endpoint in ENDPOINTS_SEM_VERIFICACAO:
+            return
+
+        # Verificar IP bloqueado
+        client_ip = request.remote_addr
+        if bloqueios.bloqueado(client_ip):
+            log_suspicious_activity(f"Tentativa de acesso de IP bloqueado: {client_ip}", level='warning')
+            abort(403)
+
+        # Verificar tamanho do conteúdo
+        content_length = request.content_length
+        if content_length and content_length > max_size:
+            log_suspicious_activity(f"Requisição muito grande rejeitada: {content_length} bytes", level='warning')
+            abort(413)
+
+    app.before_request(verificar_requisicao)
+
+
 def require_ownership(model_class, id_param='id', user_field='user_id'):
     """
     Decorator para verificar se o usuário é dono do recurso
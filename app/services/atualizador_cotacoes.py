@@ -0,0 +1,148 @@
+"""
+Atualização de cotações em segundo plano
+
+Mantém o cache global de cotações (tabela cotacoes) aquecido para todos os
+tickers em carteira, fora do caminho das requisições. Cada processo roda uma
+thread, mas só o líder (quem obtiver o advisory lock no PostgreSQL) consulta
+a API; os demais ficam tentando assumir a liderança caso o líder caia.
+"""
+import threading
+from sqlalchemy import text
+
+
+# Chave fixa do advisory lock de liderança
+CHAVE_LOCK_LIDER = 730120261018
+
+_atualizador = None
+_atualizador_lock = threading.Lock()
+
+
+def executar_ciclo():
+    """
+    Atualiza as cotações vencidas de todos os tickers em carteira
+
+    Deve ser chamado dentro do contexto da aplicação.
+
+    Returns:
+        dict: Estatísticas da atualização
+    """
+    from app.models import db, Ativo, Cotacao
+    from app.services.brapi_service import brapi_service
+
+    tickers = [
+        ticker for (ticker,) in
+        db.session.query(Ativo.ticker).filter(Ativo.ativo == True).distinct().all()
+    ]
+    if not tickers:
+        return {'total': 0, 'atualizados': 0, 'cache': 0, 'erros': 0, 'latencias': {}, 'falhas': {}, 'ativos': 0}
+
+    stats = brapi_service.atualizar_cotacoes(tickers)
+    stats['ativos'] = Cotacao.propagar_para_ativos()
+    db.session.commit()
+    return stats
+
+
+class AtualizadorCotacoes(threading.Thread):
+    """Thread que executa executar_ciclo() periodicamente enquanto for o líder"""
+
+    def __init__(self, app, intervalo):
+        super().__init__(name='atualizador-cotacoes', daemon=True)
+        self.app = app
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._conexao_lider = None
+
+    def parar(self):
+        """Solicita o fim da thread (termina após o ciclo atual)"""
+        self._parar.set()
+
+    def _descartar_conexao(self):
+        if self._conexao_lider is not None:
+            try:
+                self._conexao_lider.close()
+            except Exception:
+                pass
+            self._conexao_lider = None
+
+    def eh_lider(self):
+        """
+        Verifica (ou tenta obter) a liderança
+
+        No PostgreSQL usa pg_try_advisory_lock em uma conexão dedicada: o lock
+        dura enquanto a conexão estiver aberta e é liberado automaticamente se o
+        processo morrer. Em outros bancos (desenvolvimento) o processo é sempre o líder.
+
+        Returns:
+            bool: True se este processo deve atualizar as cotações
+        """
+        from app.models import db
+
+        if db.engine.dialect.name != 'postgresql':
+            return True
+
+        try:
+            if self._conexao_lider is None:
+                conexao = db.engine.connect()
+                obtido = conexao.scalar(text('SELECT pg_try_advisory_lock(:chave)'), {'chave': CHAVE_LOCK_LIDER})
+                conexao.commit()
+                if not obtido:
+                    conexao.close()
+                    return False
+
+                self._conexao_lider = conexao
+                self.app.logger.info('Atualizador de cotações: este processo assumiu a liderança')
+                return True
+
+            # Confere se a conexão (e portanto o lock) continua viva
+            self._conexao_lider.scalar(text('SELECT 1'))
+            self._conexao_lider.commit()
+            return True
+
+        except Exception as e:
+            self.app.logger.warning(f'Atualizador de cotações: liderança perdida ({str(e)})')
+            self._descartar_conexao()
+            return False
+
+    def run(self):
+        while not self._parar.is_set():
+            with self.app.app_context():
+                from app.models import db
+
+                try:
+                    if self.eh_lider():
+                        stats = executar_ciclo()
+                        self.app.logger.info(
+                            f"Atualizador de cotações: {stats['atualizados']} tickers buscados, "
+                            f"{stats['cache']} em cache, {stats['erros']} erros, "
+                            f"{stats['ativos']} ativos atualizados"
+                        )
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f'Atualizador de cotações: erro no ciclo: {str(e)}')
+
+            self._parar.wait(self.intervalo)
+
+        self._descartar_conexao()
+
+
+def iniciar_atualizador(app):
+    """
+    Inicia o atualizador deste processo, se ainda não estiver rodando
+
+    Args:
+        app: aplicação Flask
+
+    Returns:
+        AtualizadorCotacoes: thread do atualizador
+    """
+    global _atualizador
+
+    if _atualizador is not None and _atualizador.is_alive():
+        return _atualizador
+
+    with _atualizador_lock:
+        if _atualizador is None or not _atualizador.is_alive():
+            _atualizador = AtualizadorCotacoes(app, app.config.get('COTACOES_INTERVALO_SEGUNDOS', 300))
+            _atualizador.start()
+
+    return _atualizador
@@ -2,21 +2,87 @@
 Serviço de integração com a API brapi.dev
 API gratuita de cotações da B3
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from datetime import datetime, timedelta
 from flask import current_app
 
+from app.metricas import registrar_cache, registrar_chamada_brapi
+
 
 class BrapiService:
     """Serviço para integração com brapi.dev"""
 
     BASE_URL = "https://brapi.dev/api"
+    HEADERS = {
+        'User-Agent': 'Gestao-Financeira-App/1.0'
+    }
 
     def __init__(self):
         self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Gestao-Financeira-App/1.0'
-        })
+        self.session.headers.update(self.HEADERS)
+
+        # requests.Session não é thread-safe: cada thread do pool usa a sua
+        self._local = threading.local()
+
+    @property
+    def base_url(self):
+        """URL da API (BRAPI_BASE_URL permite apontar para um servidor local)"""
+        return current_app.config.get('BRAPI_BASE_URL', self.BASE_URL).rstrip('/')
+
+    def _parametros(self, extras=None):
+        """Parâmetros comuns das requisições (token, se configurado)"""
+        params = dict(extras or {})
+        token = current_app.config.get('BRAPI_TOKEN')
+        if token:
+            params['token'] = token
+        return params
+
+    def _sessao_thread(self):
+        """Sessão HTTP da thread atual"""
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            sessao.headers.update(self.HEADERS)
+            self._local.sessao = sessao
+        return sessao
+
+    @staticmethod
+    def _converter_cotacao(result):
+        """Converte um item de 'results' da API para o formato interno"""
+        return {
+            'ticker': result.get('symbol'),
+            'nome': result.get('longName') or result.get('shortName'),
+            'preco': result.get('regularMarketPrice'),
+            'variacao_dia': result.get('regularMarketChangePercent'),
+            'volume': result.get('regularMarketVolume'),
+            'data_atualizacao': datetime.now(),
+            'moeda': result.get('currency', 'BRL'),
+            'tipo_mercado': result.get('market'),
+        }
+
+    @staticmethod
+    def _get_com_metricas(sessao, url, tickers, **kwargs):
+        """
+        GET na API registrando a latência e os erros por ticker (app/metricas.py)
+
+        Não usa current_app: também roda no pool de threads.
+
+        Returns:
+            requests.Response
+        """
+        inicio = time.perf_counter()
+        try:
+            response = sessao.get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            registrar_chamada_brapi(tickers, time.perf_counter() - inicio, 'rede')
+            raise
+
+        erro = None if response.status_code == 200 else f'status_{response.status_code}'
+        registrar_chamada_brapi(tickers, time.perf_counter() - inicio, erro)
+        return response
 
     def buscar_cotacao(self, ticker):
         """
@@ -29,25 +95,15 @@ class BrapiService:
             dict: Dados da cotação ou None em caso de erro
         """
         try:
-            url = f"{self.BASE_URL}/quote/{ticker}"
-            response = self.session.get(url, timeout=10)
+            url = f"{self.base_url}/quote/{ticker}"
+            response = self._get_com_metricas(self.session, url, [ticker], params=self._parametros(),
+                                              timeout=current_app.config.get('BRAPI_TIMEOUT', 10))
 
             if response.status_code == 200:
                 data = response.json()
 
                 if data.get('results') and len(data['results']) > 0:
-                    result = data['results'][0]
-
-                    return {
-                        'ticker': result.get('symbol'),
-                        'nome': result.get('longName') or result.get('shortName'),
-                        'preco': result.get('regularMarketPrice'),
-                        'variacao_dia': result.get('regularMarketChangePercent'),
-                        'volume': result.get('regularMarketVolume'),
-                        'data_atualizacao': datetime.now(),
-                        'moeda': result.get('currency', 'BRL'),
-                        'tipo_mercado': result.get('market'),
-                    }
+                    return self._converter_cotacao(data['results'][0])
 
             current_app.logger.warning(f"Erro ao buscar cotação de {ticker}: {response.status_code}")
             return None
@@ -59,12 +115,85 @@ class BrapiService:
             current_app.logger.error(f"Erro inesperado ao buscar {ticker}: {str(e)}")
             return None
 
+    def _requisitar_lote(self, tickers, url_base, params, timeout):
+        """
+        Busca um lote de tickers em uma única requisição (executa no pool de threads)
+
+        Não usa current_app: roda fora do contexto da aplicação.
+
+        Returns:
+            tuple: (cotações por ticker, latência em ms, mensagem de erro ou None)
+        """
+        inicio = time.perf_counter()
+        try:
+            response = self._get_com_metricas(
+                self._sessao_thread(), f"{url_base}/quote/{','.join(tickers)}", tickers,
+                params=params, timeout=timeout
+            )
+            latencia = (time.perf_counter() - inicio) * 1000
+
+            if response.status_code != 200:
+                return {}, latencia, f"status {response.status_code}"
+
+            cotacoes = {}
+            por_simbolo = {ticker.upper(): ticker for ticker in tickers}
+            for result in response.json().get('results') or []:
+                ticker = por_simbolo.get((result.get('symbol') or '').upper())
+                if ticker:
+                    cotacoes[ticker] = self._converter_cotacao(result)
+            return cotacoes, latencia, None
+
+        except Exception as e:
+            return {}, (time.perf_counter() - inicio) * 1000, str(e)
+
+    def _buscar_cotacoes_concorrente(self, tickers_list):
+        """
+        Busca cotações em lotes, com concorrência limitada
+
+        BRAPI_TICKERS_POR_REQUISICAO define quantos tickers vão em cada requisição
+        (o plano gratuito aceita apenas 1) e BRAPI_MAX_WORKERS quantas requisições
+        rodam em paralelo.
+
+        Returns:
+            tuple: (cotações por ticker, latência em ms por ticker, motivo da
+                falha por ticker sem cotação)
+        """
+        config = current_app.config
+        tickers = list(dict.fromkeys(tickers_list))
+        por_requisicao = max(1, config.get('BRAPI_TICKERS_POR_REQUISICAO', 1))
+        lotes = [tickers[i:i + por_requisicao] for i in range(0, len(tickers), por_requisicao)]
+        if not lotes:
+            return {}, {}, {}
+
+        args = (self.base_url, self._parametros(), config.get('BRAPI_TIMEOUT', 10))
+        max_workers = min(max(1, config.get('BRAPI_MAX_WORKERS', 4)), len(lotes))
+
+        if max_workers == 1:
+            respostas = [self._requisitar_lote(lote, *args) for lote in lotes]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                respostas = list(executor.map(lambda lote: self._requisitar_lote(lote, *args), lotes))
+
+        resultados = {}
+        latencias = {}
+        falhas = {}
+        for lote, (cotacoes, latencia, erro) in zip(lotes, respostas):
+            if erro:
+                current_app.logger.warning(f"Erro ao buscar cotações de {', '.join(lote)}: {erro}")
+            resultados.update(cotacoes)
+            for ticker in lote:
+                latencias[ticker] = round(latencia, 1)
+                if ticker not in cotacoes:
+                    falhas[ticker] = erro or 'ticker ausente na resposta'
+
+        return resultados, latencias, falhas
+
     def buscar_multiplas_cotacoes(self, tickers_list):
         """
         Busca cotações de múltiplos ativos
 
-        IMPORTANTE: No plano gratuito, só podemos buscar 1 ticker por request
-        Esta função faz múltiplas requisições sequencialmente
+        As requisições são feitas em paralelo (BRAPI_MAX_WORKERS) e, quando o
+        plano permite, com vários tickers por requisição (BRAPI_TICKERS_POR_REQUISICAO)
 
         Args:
             tickers_list (list): Lista de tickers
@@ -72,13 +201,7 @@ class BrapiService:
         Returns:
             dict: Dicionário com ticker como chave e dados como valor
         """
-        resultados = {}
-
-        for ticker in tickers_list:
-            cotacao = self.buscar_cotacao(ticker)
-            if cotacao:
-                resultados[ticker] = cotacao
-
+        resultados, _, _ = self._buscar_cotacoes_concorrente(tickers_list)
         return resultados
 
     def buscar_informacoes_ativo(self, ticker):
@@ -93,13 +216,14 @@ class BrapiService:
             dict: Informações do ativo ou None
         """
         try:
-            url = f"{self.BASE_URL}/quote/{ticker}"
-            params = {
+            url = f"{self.base_url}/quote/{ticker}"
+            params = self._parametros({
                 'fundamental': 'true',  # Apenas disponível em planos pagos
                 'dividends': 'true'     # Apenas disponível em planos pagos
-            }
+            })
 
-            response = self.session.get(url, params=params, timeout=10)
+            response = self._get_com_metricas(self.session, url, [ticker], params=params,
+                                              timeout=current_app.config.get('BRAPI_TIMEOUT', 10))
 
             if response.status_code == 200:
                 data = response.json()
@@ -139,8 +263,9 @@ class BrapiService:
             list: Lista de ativos encontrados
         """
         try:
-            url = f"{self.BASE_URL}/quote/list"
-            response = self.session.get(url, timeout=10)
+            url = f"{self.base_url}/quote/list"
+            response = self.session.get(url, params=self._parametros(),
+                                        timeout=current_app.config.get('BRAPI_TIMEOUT', 10))
 
             if response.status_code == 200:
                 data = response.json()
@@ -175,6 +300,16 @@ class BrapiService:
         cotacao = self.buscar_cotacao(ticker)
         return cotacao is not None
 
+    @staticmethod
+    def _aplicar_cotacao(ativo, cotacao):
+        """Copia os dados da cotação para o ativo (sem commit)"""
+        ativo.ultimo_preco = cotacao['preco']
+        ativo.variacao_dia = cotacao['variacao_dia']
+        ativo.ultima_atualizacao = cotacao['data_atualizacao']
+
+        if not ativo.nome and cotacao['nome']:
+            ativo.nome = cotacao['nome']
+
     def atualizar_ativo_se_necessario(self, ativo):
         """
         Atualiza cotação de um ativo apenas se necessário (cache > 15 min)
@@ -185,41 +320,123 @@ class BrapiService:
         Returns:
             bool: True se atualizou, False se usou cache
         """
-        from app.models import db
-
         # Verifica se precisa atualizar
         if not ativo.precisa_atualizar():
             current_app.logger.info(f"Usando cache para {ativo.ticker}")
+            registrar_cache('ativos', 1, 0)
             return False
 
-        # Busca nova cotação
-        cotacao = self.buscar_cotacao(ativo.ticker)
+        # Passa pelo cache global de cotações
+        self.atualizar_carteira([ativo])
+        return not ativo.precisa_atualizar()
+
+    def _obter_cotacoes(self, tickers):
+        """
+        Obtém cotações pelo cache global, buscando na API apenas os tickers vencidos
+
+        Só busca os tickers que conseguir reservar (single-flight); as cotações
+        buscadas são gravadas no cache sem commit.
+
+        Args:
+            tickers (list): tickers desejados (sem repetição)
+
+        Returns:
+            tuple: (cotações disponíveis por ticker, cotações buscadas na API,
+                latências, falhas da API por ticker)
+        """
+        from app.models import Cotacao
+
+        cache = Cotacao.buscar(tickers)
+        vencidos = [t for t in tickers if t not in cache or not cache[t].esta_valida()]
+        registrar_cache('cotacoes', len(tickers) - len(vencidos), len(vencidos))
+
+        # Cotações disponíveis no cache global (mesmo vencidas, caso outro
+        # processo esteja atualizando o ticker neste momento)
+        cotacoes = {t: c.como_dict() for t, c in cache.items() if c.preco is not None}
+        buscadas = {}
+        latencias = {}
+        falhas = {}
+
+        if vencidos:
+            token, reservados = Cotacao.reservar(vencidos)
+            if reservados:
+                buscadas, latencias, falhas = self._buscar_cotacoes_concorrente(
+                    [t for t in vencidos if t in reservados]
+                )
+                atualizado_em = Cotacao.registrar(buscadas, token)
+                for cotacao in buscadas.values():
+                    cotacao['data_atualizacao'] = atualizado_em
+                cotacoes.update(buscadas)
+
+            # Tickers sem nenhum preço em cache que outro processo está buscando:
+            # espera a busca dele em vez de repetir a requisição
+            em_espera = [t for t in vencidos if t not in reservados and t not in cotacoes]
+            if em_espera:
+                cotacoes.update(Cotacao.aguardar(em_espera, current_app.config.get('BRAPI_TIMEOUT', 10)))
+
+        return cotacoes, buscadas, latencias, falhas
+
+    def atualizar_cotacoes(self, tickers_list):
+        """
+        Atualiza o cache global de cotações (usado pelo atualizador em segundo plano)
+
+        Args:
+            tickers_list (list): tickers a manter atualizados
+
+        Returns:
+            dict: Estatísticas da atualização (inclui latência em ms e motivo
+                das falhas por ticker)
+        """
+        from app.models import db
+
+        tickers = list(dict.fromkeys(tickers_list))
+        cotacoes, buscadas, latencias, falhas = self._obter_cotacoes(tickers)
+        db.session.commit()
+
+        return {
+            'total': len(tickers),
+            'atualizados': len(buscadas),
+            'cache': len([t for t in tickers if t in cotacoes and t not in buscadas]),
+            'erros': len([t for t in tickers if t not in cotacoes]),
+            'latencias': latencias,
+            'falhas': {t: falhas.get(t, 'sem cotação disponível') for t in tickers if t not in cotacoes}
+        }
 
-        if cotacao:
-            ativo.ultimo_preco = cotacao['preco']
-            ativo.variacao_dia = cotacao['variacao_dia']
-            ativo.ultima_atualizacao = cotacao['data_atualizacao']
+    def aplicar_cache(self, ativos_list):
+        """
+        Copia para os ativos as cotações mais recentes do cache global
 
-            if not ativo.nome and cotacao['nome']:
-                ativo.nome = cotacao['nome']
+        Não consulta a API nem grava nada: usado pelas páginas e gráficos, que
+        apenas leem os preços mantidos pelo atualizador em segundo plano.
 
-            db.session.commit()
-            current_app.logger.info(f"Cotação de {ativo.ticker} atualizada: R$ {cotacao['preco']}")
-            return True
+        Args:
+            ativos_list (list): Lista de objetos Ativo
+        """
+        from app.models import Cotacao
 
-        current_app.logger.warning(f"Não foi possível atualizar {ativo.ticker}")
-        return False
+        cache = Cotacao.buscar(list({ativo.ticker for ativo in ativos_list}))
+        for ativo in ativos_list:
+            cotacao = cache.get(ativo.ticker)
+            if cotacao is None or cotacao.preco is None or not cotacao.atualizado_em:
+                continue
+            if not ativo.ultima_atualizacao or cotacao.atualizado_em > ativo.ultima_atualizacao:
+                self._aplicar_cotacao(ativo, cotacao.como_dict())
 
     def atualizar_carteira(self, ativos_list):
         """
         Atualiza cotações de uma carteira de ativos
-        Otimizado para minimizar requisições no plano gratuito
+
+        Os preços vêm do cache global (tabela cotacoes): só os tickers vencidos
+        no cache são buscados na API, uma vez cada e em paralelo, e apenas pelo
+        processo que conseguir reservá-los. Todos os ativos atualizados são
+        gravados em um único commit.
 
         Args:
             ativos_list (list): Lista de objetos Ativo
 
         Returns:
-            dict: Estatísticas da atualização
+            dict: Estatísticas da atualização (inclui latência em ms e motivo
+                das falhas por ticker)
         """
         from app.models import db
 
@@ -227,22 +444,42 @@ class BrapiService:
             'total': len(ativos_list),
             'atualizados': 0,
             'cache': 0,
-            'erros': 0
+            'erros': 0,
+            'latencias': {},
+            'falhas': {}
         }
 
-        for ativo in ativos_list:
-            try:
-                if ativo.precisa_atualizar():
-                    if self.atualizar_ativo_se_necessario(ativo):
-                        stats['atualizados'] += 1
-                    else:
-                        stats['erros'] += 1
+        pendentes = [ativo for ativo in ativos_list if ativo.precisa_atualizar()]
+        stats['cache'] = len(ativos_list) - len(pendentes)
+        registrar_cache('ativos', stats['cache'], len(pendentes))
+
+        if pendentes:
+            tickers = list(dict.fromkeys(ativo.ticker for ativo in pendentes))
+            cotacoes, buscadas, stats['latencias'], falhas = self._obter_cotacoes(tickers)
+
+            for ativo in pendentes:
+                cotacao = cotacoes.get(ativo.ticker)
+                if not cotacao:
+                    current_app.logger.warning(f"Não foi possível atualizar {ativo.ticker}")
+                    stats['erros'] += 1
+                    stats['falhas'][ativo.ticker] = falhas.get(ativo.ticker, 'sem cotação disponível')
+                    continue
+
+                if not ativo.ultima_atualizacao or cotacao['data_atualizacao'] > ativo.ultima_atualizacao:
+                    self._aplicar_cotacao(ativo, cotacao)
+
+                if ativo.ticker in buscadas:
+                    stats['atualizados'] += 1
                 else:
                     stats['cache'] += 1
 
+            try:
+                db.session.commit()
             except Exception as e:
-                current_app.logger.error(f"Erro ao atualizar {ativo.ticker}: {str(e)}")
-                stats['erros'] += 1
+                db.session.rollback()
+                current_app.logger.error(f"Erro ao gravar cotações da carteira: {str(e)}")
+                stats['erros'] += stats['atualizados']
+                stats['atualizados'] = 0
 
         current_app.logger.info(
             f"Carteira atualizada: {stats['atualizados']} ativos, "
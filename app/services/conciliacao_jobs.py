@@ -0,0 +1,296 @@
+"""
+Processamento de conciliações bancárias em segundo plano
+
+O upload apenas grava o arquivo e cria a conciliação com status 'processando'.
+O parse, o matching e a criação dos itens rodam em um pool de threads do
+próprio processo web (CONCILIACAO_WORKERS) ou em processos dedicados
+(`flask conciliacao-worker`), e a conciliação passa para 'pendente_revisao'
+(ou 'erro') ao final. O progresso é gravado na própria conciliação.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from app.models import db, ConciliacaoBancaria, ItemConciliacao
+from app.parsers import detect_format, iter_file_chunks
+from app.matching import ClassificadorCategorias, processar_matching
+from app.metricas import conciliacao_etapas, conciliacao_linhas, conciliacoes_processadas
+
+
+# Job sem atividade por mais tempo que isso é considerado abandonado
+TEMPO_MAXIMO_SEM_ATIVIDADE = timedelta(minutes=5)
+
+# Conciliação que nenhum pool pegou depois desse tempo volta para a fila
+TEMPO_MAXIMO_NA_FILA = timedelta(seconds=30)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obter_executor(app):
+    """Pool de threads deste processo (criado sob demanda, após o fork do gunicorn)"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('CONCILIACAO_WORKERS', 2),
+                thread_name_prefix='conciliacao'
+            )
+    return _executor
+
+
+def _executar(app, conciliacao_id):
+    """Executa um job dentro do contexto da aplicação"""
+    with app.app_context():
+        try:
+            processar_conciliacao(conciliacao_id)
+        except Exception as e:
+            app.logger.error(f'Erro inesperado no job da conciliação {conciliacao_id}: {str(e)}')
+
+
+def enfileirar(conciliacao_id):
+    """
+    Agenda o processamento de uma conciliação no pool deste processo
+
+    Args:
+        conciliacao_id: ID da conciliação (já gravada com status 'processando')
+
+    Returns:
+        bool: True se foi agendada; False se o processamento local está
+            desativado (CONCILIACAO_WORKERS = 0) e ficará com os workers dedicados
+    """
+    app = current_app._get_current_object()
+    if app.config.get('CONCILIACAO_WORKERS', 2) <= 0:
+        return False
+
+    _obter_executor(app).submit(_executar, app, conciliacao_id)
+    return True
+
+
+def _filtro_disponivel(agora):
+    """Conciliações aguardando processamento ou com job abandonado"""
+    return (
+        ConciliacaoBancaria.status == 'processando',
+        or_(
+            ConciliacaoBancaria.ultima_atividade.is_(None),
+            ConciliacaoBancaria.ultima_atividade < agora - TEMPO_MAXIMO_SEM_ATIVIDADE
+        )
+    )
+
+
+def reservar(conciliacao_id):
+    """
+    Reserva a conciliação para este job (evita processamento em dobro)
+
+    Roda em uma transação própria, confirmada ao retornar.
+
+    Returns:
+        bool: True se este job deve processar a conciliação
+    """
+    agora = datetime.utcnow()
+    with db.engine.begin() as conexao:
+        resultado = conexao.execute(
+            update(ConciliacaoBancaria.__table__)
+            .where(ConciliacaoBancaria.id == conciliacao_id, *_filtro_disponivel(agora))
+            .values(ultima_atividade=agora)
+        )
+    return resultado.rowcount == 1
+
+
+def registrar_progresso(conciliacao_id, **valores):
+    """
+    Grava progresso/status em uma transação própria
+
+    Fica visível imediatamente para o endpoint de progresso, sem depender do
+    commit final do job. Também renova o heartbeat (ultima_atividade).
+    """
+    with db.engine.begin() as conexao:
+        conexao.execute(
+            update(ConciliacaoBancaria.__table__)
+            .where(ConciliacaoBancaria.id == conciliacao_id)
+            .values(ultima_atividade=datetime.utcnow(), **valores)
+        )
+
+
+def _estimar_linhas(conteudo, formato):
+    """Quantidade aproximada de transações do arquivo, para o progresso (sem parsear)"""
+    if formato == 'OFX':
+        return conteudo.upper().count(b'<STMTTRN>')
+    return conteudo.rstrip(b'\r\n').count(b'\n')  # linhas menos o cabeçalho
+
+
+def _linha_item(conciliacao_id, item):
+    """Colunas do ItemConciliacao de um item processado pelo matching"""
+    return {
+        'conciliacao_id': conciliacao_id,
+        'data': item['data'],
+        'descricao': item['descricao'],
+        'valor': item['valor'],
+        'tipo': item['tipo'],
+        'numero_documento': item.get('numero_documento'),
+        'saldo_apos': item.get('saldo_apos'),
+        'status': 'pendente',
+        'transacao_id': item['melhor_match'][0].id if item.get('melhor_match') else None,
+        'categoria_sugerida_id': item['categoria_sugerida'].id if item['categoria_sugerida'] else None,
+        'score_matching': item['score_matching']
+    }
+
+
+def processar_conciliacao(conciliacao_id):
+    """
+    Faz o parse do arquivo, o matching e cria os itens da conciliação
+
+    O arquivo é processado em blocos (parsers.iter_file_chunks): cada bloco
+    passa pelo matching e tem seus itens gravados antes do próximo ser lido,
+    então a memória usada não cresce com o tamanho do extrato. Os itens
+    gravados ficam na transação do job, confirmada apenas no final.
+
+    Args:
+        conciliacao_id: ID da conciliação
+
+    Returns:
+        bool: True se processou (com sucesso ou erro), False se outro job já estava processando
+    """
+    if not reservar(conciliacao_id):
+        return False
+
+    conciliacao = db.session.get(ConciliacaoBancaria, conciliacao_id)
+    if conciliacao is None:
+        return False
+
+    try:
+        conteudo = conciliacao.arquivo_conteudo
+        if not conteudo:
+            raise ValueError('O arquivo desta conciliação não está mais disponível. Envie-o novamente.')
+
+        formato = conciliacao.formato or detect_format(conteudo)
+        estimativa = _estimar_linhas(conteudo, formato)
+        registrar_progresso(conciliacao_id, progresso=10, total_linhas=estimativa)
+
+        classificador = ClassificadorCategorias.carregar(conciliacao.user_id)
+        tempos = {'parse': 0.0, 'matching': 0.0, 'gravacao': 0.0}
+        total = 0
+        data_inicio = data_fim = None
+
+        # Progresso de 10% a 90%, pela estimativa de linhas
+        def progresso(processados):
+            registrar_progresso(conciliacao_id, progresso=10 + int(80 * min(processados / max(estimativa, 1), 1)))
+
+        blocos = iter_file_chunks(conteudo, formato)
+        while True:
+            inicio = time.perf_counter()
+            lote = next(blocos, None)
+            tempos['parse'] += time.perf_counter() - inicio
+            if lote is None:
+                break
+
+            inicio = time.perf_counter()
+            itens_processados = processar_matching(
+                lote,
+                conciliacao.conta_id,
+                conciliacao.user_id,
+                callback_progresso=lambda processados, anteriores=total: progresso(anteriores + processados),
+                classificador=classificador
+            )
+            tempos['matching'] += time.perf_counter() - inicio
+
+            # Itens do bloco (INSERT em lote); o próximo bloco já não os usa como candidatos
+            inicio = time.perf_counter()
+            ItemConciliacao.inserir_em_lote([_linha_item(conciliacao.id, item) for item in itens_processados])
+            tempos['gravacao'] += time.perf_counter() - inicio
+
+            total += len(lote)
+            primeira, ultima = min(item['data'] for item in lote), max(item['data'] for item in lote)
+            data_inicio = primeira if data_inicio is None else min(data_inicio, primeira)
+            data_fim = ultima if data_fim is None else max(data_fim, ultima)
+            progresso(total)
+
+        if total == 0:
+            raise ValueError('Nenhuma transação encontrada no arquivo')
+
+        # Atualizar status
+        inicio = time.perf_counter()
+        conciliacao.total_linhas = total
+        conciliacao.data_inicio = data_inicio
+        conciliacao.data_fim = data_fim
+        conciliacao.status = 'pendente_revisao'
+        conciliacao.progresso = 100
+        conciliacao.mensagem_erro = None
+        conciliacao.arquivo_conteudo = None
+        db.session.commit()
+        tempos['gravacao'] += time.perf_counter() - inicio
+
+        for etapa, segundos in tempos.items():
+            conciliacao_etapas.labels(etapa=etapa).observe(segundos)
+        conciliacao_linhas.observe(total)
+        conciliacoes_processadas.labels(resultado='sucesso').inc()
+
+        current_app.logger.info(f'Conciliação {conciliacao_id} processada: {total} itens')
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f'Erro ao processar conciliação {conciliacao_id}: {str(e)}')
+        registrar_progresso(conciliacao_id, status='erro', mensagem_erro=str(e), arquivo_conteudo=None)
+        conciliacoes_processadas.labels(resultado='erro').inc()
+
+    return True
+
+
+def reenfileirar_se_parada(conciliacao):
+    """
+    Agenda novamente uma conciliação que nenhum job está processando
+
+    Cobre jobs perdidos (processo reiniciado durante o processamento ou antes
+    de pegar o job da fila). Chamado pelo endpoint de progresso.
+
+    Returns:
+        bool: True se a conciliação foi agendada
+    """
+    if conciliacao.status != 'processando':
+        return False
+
+    agora = datetime.utcnow()
+    if conciliacao.ultima_atividade is None:
+        parada = conciliacao.data_upload and agora - conciliacao.data_upload > TEMPO_MAXIMO_NA_FILA
+    else:
+        parada = agora - conciliacao.ultima_atividade > TEMPO_MAXIMO_SEM_ATIVIDADE
+
+    return bool(parada) and enfileirar(conciliacao.id)
+
+
+def executar_pendentes(max_workers, limite=None):
+    """
+    Processa as conciliações aguardando na fila (usado por `flask conciliacao-worker`)
+
+    Args:
+        max_workers: jobs simultâneos
+        limite: máximo de conciliações nesta rodada (padrão: 4 × max_workers)
+
+    Returns:
+        int: quantidade de conciliações processadas
+    """
+    app = current_app._get_current_object()
+    ids = [
+        conciliacao_id for (conciliacao_id,) in
+        db.session.query(ConciliacaoBancaria.id)
+        .filter(*_filtro_disponivel(datetime.utcnow()))
+        .order_by(ConciliacaoBancaria.data_upload)
+        .limit(limite or max_workers * 4)
+        .all()
+    ]
+    db.session.commit()
+
+    if not ids:
+        return 0
+
+    def executar(conciliacao_id):
+        with app.app_context():
+            return processar_conciliacao(conciliacao_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conciliacao') as executor:
+        return sum(1 for processou in executor.map(executar, ids) if processou)
@@ -0,0 +1,364 @@
+"""
+Serviço de agregação do dashboard principal
+Monta todos os dados de main.index com um número fixo de consultas SQL
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+
+from app.models import db, Conta, Categoria, Transacao, CartaoCredito, Fatura, Orcamento, Meta, DepositoMeta
+from app.services.recorrencias_virtuais import buscar_ocorrencias
+
+
+STATUS_FATURA_PENDENTE = ('aberta', 'fechada')
+
+
+def _buscar_contas(user_id):
+    """Consulta 1: contas ativas do usuário"""
+    return Conta.query.filter_by(ativa=True, user_id=user_id).all()
+
+
+def _buscar_transacoes_mes(user_id, primeiro_dia, ultimo_dia):
+    """Consulta 2: transações do mês já com o nome da categoria (sem lazy load)"""
+    return db.session.query(
+        Transacao.id,
+        Transacao.descricao,
+        Transacao.valor,
+        Transacao.tipo,
+        Transacao.data,
+        Transacao.pago,
+        Categoria.nome.label('categoria')
+    ).join(Categoria, Transacao.categoria_id == Categoria.id).filter(
+        Transacao.user_id == user_id,
+        Transacao.data >= primeiro_dia,
+        Transacao.data <= ultimo_dia
+    ).order_by(Transacao.data).all()
+
+
+def _buscar_ocorrencias_virtuais(user_id, primeiro_dia, ultimo_dia):
+    """Consulta 2b: ocorrências de recorrências virtuais do mês, no formato da consulta 2"""
+    return [
+        SimpleNamespace(
+            id=ocorrencia.id,
+            descricao=ocorrencia.descricao,
+            valor=ocorrencia.valor,
+            tipo=ocorrencia.tipo,
+            data=ocorrencia.data,
+            pago=False,
+            categoria=ocorrencia.categoria.nome
+        )
+        for ocorrencia in buscar_ocorrencias(user_id, primeiro_dia, ultimo_dia)
+    ]
+
+
+def _buscar_faturas_pendentes(user_id):
+    """
+    Consulta 3: todas as faturas abertas/fechadas com o cartão carregado
+
+    Faturas do mês, faturas a vencer e faturas em aberto são subconjuntos
+    deste resultado e são separadas em memória.
+    """
+    return Fatura.query.join(Fatura.cartao).options(
+        contains_eager(Fatura.cartao)
+    ).filter(
+        CartaoCredito.user_id == user_id,
+        Fatura.status.in_(STATUS_FATURA_PENDENTE)
+    ).order_by(Fatura.data_vencimento).all()
+
+
+def _buscar_metas_ativas(user_id, limite=5):
+    """Consulta 4: metas ativas com o total de depósitos agregado em uma CTE"""
+    depositos = db.session.query(
+        DepositoMeta.meta_id.label('meta_id'),
+        func.sum(DepositoMeta.valor).label('total')
+    ).join(Meta, DepositoMeta.meta_id == Meta.id).filter(
+        Meta.user_id == user_id,
+        Meta.status == 'ativa'
+    ).group_by(DepositoMeta.meta_id).cte('depositos_por_meta')
+
+    return db.session.query(
+        Meta,
+        func.coalesce(depositos.c.total, 0).label('total_depositos')
+    ).outerjoin(depositos, depositos.c.meta_id == Meta.id).filter(
+        Meta.user_id == user_id,
+        Meta.status == 'ativa'
+    ).order_by(Meta.data_fim).limit(limite).all()
+
+
+def _buscar_orcamentos(user_id, mes, ano):
+    """Consulta 5: orçamentos do mês com o gasto por categoria agregado em uma CTE"""
+    gastos = Orcamento.consulta_gastos(user_id, mes, ano).cte('gastos_por_categoria')
+
+    return db.session.query(
+        Orcamento,
+        Categoria.nome,
+        Categoria.cor,
+        func.coalesce(gastos.c.total, 0).label('gasto')
+    ).join(Categoria, Orcamento.categoria_id == Categoria.id).outerjoin(
+        gastos, gastos.c.categoria_id == Orcamento.categoria_id
+    ).filter(
+        Orcamento.user_id == user_id,
+        Orcamento.mes == mes,
+        Orcamento.ano == ano
+    ).all()
+
+
+def _montar_projecao(saldo_total, transacoes_por_dia, primeiro_dia, ultimo_dia, hoje):
+    """Projeção dia a dia do saldo ao longo do mês"""
+    projecao_fluxo = []
+    saldo_acumulado = float(saldo_total)
+
+    dia_atual = primeiro_dia
+    while dia_atual <= ultimo_dia:
+        receitas_dia = 0.0
+        despesas_dia = 0.0
+
+        if dia_atual in transacoes_por_dia:
+            receitas_dia = float(transacoes_por_dia[dia_atual]['receitas'])
+            despesas_dia = float(transacoes_por_dia[dia_atual]['despesas'])
+            saldo_acumulado += receitas_dia - despesas_dia
+
+        projecao_fluxo.append({
+            'data': dia_atual.strftime('%Y-%m-%d'),
+            'dia': dia_atual.day,
+            'saldo': round(saldo_acumulado, 2),
+            'receitas': round(receitas_dia, 2),
+            'despesas': round(despesas_dia, 2),
+            'is_hoje': dia_atual == hoje,
+            'is_futuro': dia_atual > hoje
+        })
+
+        dia_atual += relativedelta(days=1)
+
+    return projecao_fluxo
+
+
+def _montar_lembretes_metas(metas, hoje):
+    """Calcula status e aporte sugerido das metas ativas"""
+    lembretes_metas = []
+    for meta, total_depositos in metas:
+        acumulado = Decimal(str(meta.valor_inicial or 0)) + Decimal(str(total_depositos))
+        alvo = meta.valor_alvo
+        percentual = float((acumulado / alvo) * 100) if alvo else 0
+
+        # Calcular se está no prazo
+        dias_totais = (meta.data_fim - meta.data_inicio).days
+        dias_passados = (hoje - meta.data_inicio).days
+        percentual_tempo = (dias_passados / dias_totais * 100) if dias_totais > 0 else 0
+
+        # Determinar status e urgência
+        if percentual >= 100:
+            status = 'concluida'
+            urgencia = 'baixa'
+        elif percentual < percentual_tempo * 0.8:
+            status = 'atrasado'
+            urgencia = 'alta'
+        elif percentual < percentual_tempo * 0.9:
+            status = 'atencao'
+            urgencia = 'media'
+        else:
+            status = 'no_prazo'
+            urgencia = 'baixa'
+
+        # Calcular valor mensal sugerido
+        dias_restantes = (meta.data_fim - hoje).days
+        if dias_restantes > 0:
+            faltante = float(alvo - acumulado)
+            meses_restantes = dias_restantes / 30
+            aporte_sugerido = faltante / meses_restantes if meses_restantes > 0 else faltante
+        else:
+            aporte_sugerido = 0
+
+        lembretes_metas.append({
+            'id': meta.id,
+            'titulo': meta.titulo,
+            'percentual': round(percentual, 1),
+            'acumulado': float(acumulado),
+            'alvo': float(alvo),
+            'faltante': float(alvo - acumulado),
+            'data_fim': meta.data_fim,
+            'status': status,
+            'urgencia': urgencia,
+            'aporte_sugerido': round(aporte_sugerido, 2),
+            'meses_restantes': meta.meses_restantes()
+        })
+
+    return lembretes_metas
+
+
+def _montar_alertas_orcamentos(orcamentos):
+    """Orçamentos em alerta ou excedidos"""
+    alertas_orcamentos = []
+    for orc, categoria_nome, categoria_cor, gasto in orcamentos:
+        gasto = float(gasto)
+        limite = float(orc.valor_limite)
+        percentual = (gasto / limite) * 100 if limite else 0
+
+        # Determinar status
+        if percentual >= 100:
+            status = 'excedido'
+            urgencia = 'alta'
+        elif percentual >= orc.alerta_em_percentual:
+            status = 'alerta'
+            urgencia = 'media'
+        else:
+            status = 'ok'
+            urgencia = 'baixa'
+
+        # Só adicionar se tiver alerta ou excedido
+        if status != 'ok':
+            alertas_orcamentos.append({
+                'id': orc.id,
+                'categoria': categoria_nome,
+                'cor': categoria_cor,
+                'gasto': gasto,
+                'limite': limite,
+                'disponivel': limite - gasto,
+                'percentual': round(percentual, 1),
+                'status': status,
+                'urgencia': urgencia
+            })
+
+    return alertas_orcamentos
+
+
+def montar_dashboard(user_id, mes, ano):
+    """
+    Monta todos os dados do dashboard em um número fixo de consultas
+
+    São sempre 5 consultas (contas, transações do mês, faturas pendentes,
+    metas ativas e orçamentos do mês corrente), independentemente da
+    quantidade de transações, faturas, metas ou orçamentos do usuário.
+
+    Args:
+        user_id: ID do usuário
+        mes: mês filtrado (1-12)
+        ano: ano filtrado
+
+    Returns:
+        dict: variáveis de contexto do template index.html
+    """
+    primeiro_dia = date(ano, mes, 1)
+    ultimo_dia = date(ano, mes, calendar.monthrange(ano, mes)[1])
+    hoje = date.today()
+
+    contas = _buscar_contas(user_id)
+    saldos_contas = Conta.saldos(contas, hoje)
+    saldo_total = sum(saldos_contas.values())
+
+    transacoes_mes = _buscar_transacoes_mes(user_id, primeiro_dia, ultimo_dia)
+    ocorrencias_virtuais = _buscar_ocorrencias_virtuais(user_id, primeiro_dia, ultimo_dia)
+    if ocorrencias_virtuais:
+        transacoes_mes = sorted(transacoes_mes + ocorrencias_virtuais, key=lambda t: t.data)
+    faturas_abertas = _buscar_faturas_pendentes(user_id)
+    faturas_mes = [f for f in faturas_abertas if primeiro_dia <= f.data_vencimento <= ultimo_dia]
+    faturas_pendentes = [f for f in faturas_abertas if f.data_vencimento >= hoje]
+
+    # Organizar transações por dia
+    transacoes_por_dia = defaultdict(lambda: {'receitas': Decimal('0.00'), 'despesas': Decimal('0.00')})
+
+    for transacao in transacoes_mes:
+        if transacao.tipo == 'receita':
+            transacoes_por_dia[transacao.data]['receitas'] += transacao.valor
+        else:
+            transacoes_por_dia[transacao.data]['despesas'] += transacao.valor
+
+    # Adicionar faturas como despesas futuras
+    for fatura in faturas_mes:
+        valor_pendente = fatura.valor_total - fatura.valor_pago
+        if valor_pendente > 0:
+            transacoes_por_dia[fatura.data_vencimento]['despesas'] += valor_pendente
+
+    projecao_fluxo = _montar_projecao(saldo_total, transacoes_por_dia, primeiro_dia, ultimo_dia, hoje)
+
+    # Calcular totais do mês
+    total_receitas_mes = sum(float(d['receitas']) for d in transacoes_por_dia.values())
+    total_despesas_mes = sum(float(d['despesas']) for d in transacoes_por_dia.values())
+    saldo_previsto_fim_mes = float(saldo_total) + total_receitas_mes - total_despesas_mes
+
+    # Separar receitas e despesas realizadas vs futuras
+    receitas_realizadas = sum(
+        float(t.valor) for t in transacoes_mes
+        if t.tipo == 'receita' and t.data <= hoje
+    )
+    despesas_realizadas = sum(
+        float(t.valor) for t in transacoes_mes
+        if t.tipo == 'despesa' and t.data <= hoje
+    )
+
+    # Próximos pagamentos (despesas futuras + faturas)
+    proximos_pagamentos = []
+
+    despesas_futuras = [t for t in transacoes_mes if t.tipo == 'despesa' and t.data > hoje]
+    for despesa in despesas_futuras[:10]:
+        proximos_pagamentos.append({
+            'tipo': 'despesa',
+            'id': despesa.id,
+            'descricao': despesa.descricao,
+            'valor': float(despesa.valor),
+            'data': despesa.data,
+            'categoria': despesa.categoria,
+            'pago': despesa.pago
+        })
+
+    for fatura in faturas_pendentes:
+        valor_pendente = float(fatura.valor_total - fatura.valor_pago)
+        if valor_pendente > 0:
+            proximos_pagamentos.append({
+                'tipo': 'fatura',
+                'id': fatura.id,
+                'descricao': f'Fatura {fatura.cartao.nome}',
+                'valor': valor_pendente,
+                'data': fatura.data_vencimento,
+                'categoria': 'Cartão de Crédito',
+                'pago': False  # Faturas não têm campo 'pago' diretamente
+            })
+
+    proximos_pagamentos.sort(key=lambda x: x['data'])
+    proximos_pagamentos = proximos_pagamentos[:5]
+
+    # Próximas receitas
+    proximas_receitas = []
+    receitas_futuras = [t for t in transacoes_mes if t.tipo == 'receita' and t.data > hoje]
+    for receita in receitas_futuras[:5]:
+        proximas_receitas.append({
+            'id': receita.id,
+            'descricao': receita.descricao,
+            'valor': float(receita.valor),
+            'data': receita.data,
+            'categoria': receita.categoria,
+            'pago': receita.pago
+        })
+
+    proximas_receitas.sort(key=lambda x: x['data'])
+
+    total_faturas = sum(fatura.valor_total for fatura in faturas_abertas)
+
+    # Lembretes de metas e alertas de orçamentos (orçamentos sempre do mês corrente)
+    lembretes_metas = _montar_lembretes_metas(_buscar_metas_ativas(user_id), hoje)
+    agora = datetime.now()
+    alertas_orcamentos = _montar_alertas_orcamentos(_buscar_orcamentos(user_id, agora.month, agora.year))
+
+    return {
+        'contas': contas,
+        'saldos_contas': saldos_contas,
+        'saldo_total': saldo_total,
+        'receitas_mes': total_receitas_mes,
+        'despesas_mes': total_despesas_mes,
+        'receitas_realizadas': receitas_realizadas,
+        'despesas_realizadas': despesas_realizadas,
+        'saldo_previsto': saldo_previsto_fim_mes,
+        'faturas_abertas': faturas_abertas,
+        'total_faturas': total_faturas,
+        'projecao_fluxo': projecao_fluxo,
+        'proximos_pagamentos': proximos_pagamentos,
+        'proximas_receitas': proximas_receitas,
+        'lembretes_metas': lembretes_metas,
+        'alertas_orcamentos': alertas_orcamentos
+    }
@@ -0,0 +1,255 @@
+"""
+Geração em lote de parcelas de cartão e de transações recorrentes
+
+Todas as datas são calculadas de antemão a partir da data inicial; as faturas
+necessárias são buscadas/criadas de uma vez e as transações gravadas com
+INSERT em lote. O custo em comandos SQL não depende da quantidade de parcelas
+ou ocorrências.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import case, select, tuple_, update
+
+from app.models import db, Transacao, Fatura
+
+
+INTERVALOS_RECORRENCIA = {
+    'semanal': relativedelta(weeks=1),
+    'quinzenal': relativedelta(weeks=2),
+    'mensal': relativedelta(months=1),
+    'bimestral': relativedelta(months=2),
+    'trimestral': relativedelta(months=3),
+    'semestral': relativedelta(months=6),
+    'anual': relativedelta(years=1)
+}
+
+QUANTIDADE_MAXIMA_RECORRENCIAS = 100
+
+
+def expandir_datas(data_inicio, intervalo, quantidade):
+    """
+    Datas de todas as ocorrências de uma agenda
+
+    Cada data é calculada a partir da data inicial (e não da anterior), então
+    uma agenda mensal iniciada no dia 31 volta ao dia 31 depois de fevereiro.
+
+    Args:
+        data_inicio: data da primeira ocorrência
+        intervalo: relativedelta entre ocorrências
+        quantidade: número de ocorrências
+
+    Returns:
+        list: datas em ordem cronológica
+    """
+    return [data_inicio + intervalo * i for i in range(quantidade)]
+
+
+def _dia_limitado(ano, mes, dia):
+    """Data com o dia limitado ao último dia do mês"""
+    return date(ano, mes, min(dia, monthrange(ano, mes)[1]))
+
+
+def _nova_fatura(cartao, mes, ano):
+    """Colunas de uma nova fatura do cartão para o mês de referência"""
+    vencimento = date(ano, mes, 1) + relativedelta(months=1)
+    return {
+        'cartao_id': cartao.id,
+        'mes_referencia': mes,
+        'ano_referencia': ano,
+        'data_fechamento': _dia_limitado(ano, mes, cartao.dia_fechamento),
+        'data_vencimento': _dia_limitado(vencimento.year, vencimento.month, cartao.dia_vencimento),
+        'valor_total': Decimal('0.00'),
+        'valor_pago': Decimal('0.00'),
+        'status': 'aberta'
+    }
+
+
+def obter_ou_criar_faturas(cartao, datas):
+    """
+    Obtém ou cria as faturas do cartão para os meses das datas informadas
+
+    Um SELECT para as faturas existentes, um INSERT em lote para as que
+    faltam e um novo SELECT para obter os ids criados (faturas não têm chave
+    única por mês, então não há upsert).
+
+    Args:
+        cartao: CartaoCredito
+        datas: datas de referência (apenas mês/ano são considerados)
+
+    Returns:
+        dict: {(ano, mes): fatura_id}
+    """
+    meses = sorted({(data.year, data.month) for data in datas})
+    if not meses:
+        return {}
+
+    def buscar(periodos):
+        faturas = {}
+        for fatura_id, ano, mes in db.session.execute(
+            select(Fatura.id, Fatura.ano_referencia, Fatura.mes_referencia).where(
+                Fatura.cartao_id == cartao.id,
+                tuple_(Fatura.ano_referencia, Fatura.mes_referencia).in_(periodos)
+            ).order_by(Fatura.id)
+        ):
+            faturas.setdefault((ano, mes), fatura_id)
+        return faturas
+
+    faturas = buscar(meses)
+    faltantes = [(ano, mes) for ano, mes in meses if (ano, mes) not in faturas]
+    if faltantes:
+        Fatura.inserir_em_lote([_nova_fatura(cartao, mes, ano) for ano, mes in faltantes])
+        faturas.update(buscar(faltantes))
+
+    return faturas
+
+
+def somar_em_faturas(valores_por_fatura):
+    """
+    Soma valores no total de várias faturas com um único UPDATE
+
+    Args:
+        valores_por_fatura: dict {fatura_id: valor a somar}
+    """
+    if not valores_por_fatura:
+        return
+
+    db.session.execute(
+        update(Fatura)
+        .where(Fatura.id.in_(list(valores_por_fatura)))
+        .values(valor_total=Fatura.valor_total + case(valores_por_fatura, value=Fatura.id))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def gerar_parcelas_cartao(cartao, descricao, valor_total, total_parcelas, data_compra, conta_id, user_id, categoria_id):
+    """
+    Cria as parcelas de uma compra no cartão, já vinculadas às faturas
+
+    A primeira parcela é gravada antes para que as demais apontem para ela
+    (transacao_pai_id); as outras vão em um único INSERT em lote.
+
+    Args:
+        cartao: CartaoCredito
+        descricao: descrição da compra (o número da parcela é acrescentado)
+        valor_total: valor total da compra
+        total_parcelas: quantidade de parcelas
+        data_compra: data da compra (primeira parcela)
+        conta_id: conta vinculada às parcelas
+        user_id: ID do usuário
+        categoria_id: categoria da compra
+
+    Returns:
+        int: ID da primeira parcela
+    """
+    valor_parcela = (valor_total / total_parcelas).quantize(Decimal('0.01'))
+    datas = expandir_datas(data_compra, relativedelta(months=1), total_parcelas)
+    faturas = obter_ou_criar_faturas(cartao, datas)
+
+    linhas = [
+        {
+            'descricao': f'{descricao} ({numero}/{total_parcelas})',
+            'valor': valor_parcela,
+            'tipo': 'despesa',
+            'data': data_parcela,
+            'forma_pagamento': 'cartao_credito',
+            'cartao_credito_id': cartao.id,
+            'parcelado': True,
+            'numero_parcela': numero,
+            'total_parcelas': total_parcelas,
+            'transacao_pai_id': None,
+            'conta_id': conta_id,
+            'user_id': user_id,
+            'categoria_id': categoria_id,
+            'fatura_id': faturas[(data_parcela.year, data_parcela.month)]
+        }
+        for numero, data_parcela in enumerate(datas, start=1)
+    ]
+
+    primeira_id, = Transacao.inserir_em_lote(linhas[:1])
+    for linha in linhas[1:]:
+        linha['transacao_pai_id'] = primeira_id
+    Transacao.inserir_em_lote(linhas[1:], retornar_ids=False)
+
+    por_fatura = defaultdict(Decimal)
+    for linha in linhas:
+        por_fatura[linha['fatura_id']] += valor_parcela
+    somar_em_faturas(por_fatura)
+
+    return primeira_id
+
+
+def linha_ocorrencia(regra, numero, data, pago=False):
+    """
+    Colunas da ocorrência de uma recorrência (para INSERT em lote ou Transacao(**linha))
+
+    Args:
+        regra: transação original da recorrência (com id e campos de recorrência)
+        numero: posição da ocorrência (a regra é a 1)
+        data: data da ocorrência
+        pago: se a ocorrência já foi paga/recebida
+
+    Returns:
+        dict: colunas da transação
+    """
+    return {
+        'descricao': regra.descricao,
+        'valor': regra.valor,
+        'tipo': regra.tipo,
+        'data': data,
+        'forma_pagamento': regra.forma_pagamento,
+        'conta_id': regra.conta_id,
+        'user_id': regra.user_id,
+        'categoria_id': regra.categoria_id,
+        'recorrente': True,
+        'frequencia_recorrencia': regra.frequencia_recorrencia,
+        'data_inicio_recorrencia': regra.data_inicio_recorrencia,
+        'quantidade_recorrencias': regra.quantidade_recorrencias,
+        'transacao_recorrente_pai_id': regra.id,
+        'numero_ocorrencia': numero,
+        'recorrencia_virtual': regra.recorrencia_virtual,
+        'pago': pago
+    }
+
+
+def gerar_recorrencias(transacao_base, frequencia, data_inicio, quantidade, pago_inicial=False, virtual=False):
+    """
+    Cria as ocorrências seguintes de uma transação recorrente (já gravada)
+
+    Args:
+        transacao_base: transação que servirá como modelo (com id e os
+            campos de recorrência preenchidos)
+        frequencia: 'semanal', 'quinzenal', 'mensal', 'bimestral', 'trimestral', 'semestral', 'anual'
+        data_inicio: data da primeira ocorrência (a própria transacao_base)
+        quantidade: número total de ocorrências, incluindo a transacao_base
+        pago_inicial: se as ocorrências até hoje devem ser marcadas como pagas
+        virtual: grava apenas as ocorrências pagas; as demais ficam virtuais
+            (ver app/services/recorrencias_virtuais.py)
+
+    Returns:
+        int: quantidade de transações criadas
+    """
+    if quantidade < 1 or quantidade > QUANTIDADE_MAXIMA_RECORRENCIAS:
+        raise ValueError(f'A quantidade deve estar entre 1 e {QUANTIDADE_MAXIMA_RECORRENCIAS}')
+
+    if frequencia not in INTERVALOS_RECORRENCIA:
+        raise ValueError(f'Frequência inválida: {frequencia}')
+
+    hoje = date.today()
+    datas = expandir_datas(data_inicio, INTERVALOS_RECORRENCIA[frequencia], quantidade)
+
+    # A primeira ocorrência já é a transacao_base; apenas ocorrências passadas são marcadas como pagas
+    linhas = [
+        linha_ocorrencia(transacao_base, numero, data, pago_inicial and data <= hoje)
+        for numero, data in enumerate(datas, start=1)
+        if numero > 1
+    ]
+    if virtual:
+        linhas = [linha for linha in linhas if linha['pago']]
+
+    Transacao.inserir_em_lote(linhas, retornar_ids=False)
+
+    return len(linhas)
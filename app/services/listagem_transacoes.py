@@ -0,0 +1,139 @@
+"""
+Listagem de transações do mês com paginação por chave (keyset)
+
+Cada página é buscada a partir da última transação exibida na anterior, pela
+chave (data, id) em ordem decrescente: não há COUNT nem OFFSET, então
+qualquer página custa o mesmo que a primeira. Os totais do mês vêm do resumo
+mensal (uma consulta agrupada por tipo).
+"""
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import func, tuple_
+
+from app.carregamento import perfil
+from app.models import db, Transacao, ResumoMensal
+from app.services.recorrencias_virtuais import buscar_ocorrencias
+
+
+POR_PAGINA = 50
+
+
+def codificar_cursor(transacao):
+    """Cursor da página seguinte a partir da última transação exibida"""
+    return f'{transacao.data.isoformat()}_{transacao.id}'
+
+
+def decodificar_cursor(cursor):
+    """
+    Converte o cursor recebido na query string
+
+    Returns:
+        tuple: (data, id) ou None se o cursor estiver vazio
+
+    Raises:
+        ValueError: se o cursor for inválido
+    """
+    if not cursor:
+        return None
+
+    data, _, transacao_id = cursor.partition('_')
+    return date.fromisoformat(data), int(transacao_id)
+
+
+def buscar_pagina(user_id, primeiro_dia, ultimo_dia, tipo=None, conta_id=None, categoria_id=None,
+                  cursor=None, por_pagina=POR_PAGINA):
+    """
+    Uma página das transações do período, das mais recentes para as mais antigas
+
+    Ocorrências de recorrências virtuais entram na página que cobre a sua data
+    (dentro do mesmo dia, antes das transações gravadas).
+
+    Args:
+        user_id: ID do usuário
+        primeiro_dia: início do período
+        ultimo_dia: fim do período
+        tipo: filtro opcional por tipo ('receita'/'despesa')
+        conta_id: filtro opcional por conta
+        categoria_id: filtro opcional por categoria
+        cursor: (data, id) da última transação da página anterior (None na primeira)
+        por_pagina: quantidade de transações gravadas por página
+
+    Returns:
+        tuple: (itens, proximo_cursor, ocorrencias) — proximo_cursor é None na
+            última página; ocorrencias são todas as ocorrências virtuais do
+            período (sem filtros), usadas nos totais
+    """
+    query = Transacao.query.options(*perfil('transacoes')).filter(
+        Transacao.user_id == user_id,
+        Transacao.data >= primeiro_dia,
+        Transacao.data <= ultimo_dia
+    )
+
+    if tipo:
+        query = query.filter(Transacao.tipo == tipo)
+
+    if conta_id:
+        query = query.filter(Transacao.conta_id == conta_id)
+
+    if categoria_id:
+        query = query.filter(Transacao.categoria_id == categoria_id)
+
+    if cursor:
+        query = query.filter(tuple_(Transacao.data, Transacao.id) < tuple_(*cursor))
+
+    # Uma linha a mais indica se existe página seguinte
+    itens = query.order_by(Transacao.data.desc(), Transacao.id.desc()).limit(por_pagina + 1).all()
+    proximo_cursor = None
+    if len(itens) > por_pagina:
+        itens = itens[:por_pagina]
+        proximo_cursor = codificar_cursor(itens[-1])
+
+    ocorrencias = buscar_ocorrencias(user_id, primeiro_dia, ultimo_dia)
+    ocorrencias_pagina = [
+        o for o in ocorrencias
+        if (not tipo or o.tipo == tipo)
+        and (not conta_id or o.conta_id == conta_id)
+        and (not categoria_id or o.categoria_id == categoria_id)
+        and (not cursor or o.data < cursor[0])
+        and (not proximo_cursor or o.data >= itens[-1].data)
+    ]
+    if ocorrencias_pagina:
+        itens = sorted(
+            itens + ocorrencias_pagina,
+            key=lambda t: (t.data, t.virtual, 0 if t.virtual else t.id),
+            reverse=True
+        )
+
+    return itens, proximo_cursor, ocorrencias
+
+
+def totais_mes(user_id, mes, ano, ocorrencias=()):
+    """
+    Receitas e despesas do mês (pelo resumo mensal)
+
+    Args:
+        user_id: ID do usuário
+        mes: mês (1-12)
+        ano: ano
+        ocorrencias: ocorrências virtuais do mês, somadas aos totais
+
+    Returns:
+        tuple: (total_receitas, total_despesas) em Decimal
+    """
+    totais = dict(db.session.query(
+        ResumoMensal.tipo,
+        func.sum(ResumoMensal.total)
+    ).filter(
+        ResumoMensal.user_id == user_id,
+        ResumoMensal.ano == ano,
+        ResumoMensal.mes == mes
+    ).group_by(ResumoMensal.tipo).all())
+
+    total_receitas = totais.get('receita') or Decimal('0.00')
+    total_despesas = totais.get('despesa') or Decimal('0.00')
+
+    total_receitas += sum(o.valor for o in ocorrencias if o.tipo == 'receita')
+    total_despesas += sum(o.valor for o in ocorrencias if o.tipo == 'despesa')
+
+    return total_receitas, total_despesas
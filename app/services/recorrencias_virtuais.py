@@ -0,0 +1,222 @@
+"""
+Recorrências virtuais
+
+Com RECORRENCIAS_VIRTUAIS ativo, uma transação recorrente grava apenas a
+transação original, que guarda a regra (frequência, data inicial e
+quantidade). As demais ocorrências são calculadas para o período consultado e
+só viram linhas em transacoes quando são pagas ou editadas (materializadas),
+ligadas à regra por transacao_recorrente_pai_id/numero_ocorrencia.
+
+Ocorrências excluídas ficam registradas na regra (ocorrencias_excluidas) e não
+voltam a ser calculadas. A regra é ela própria uma ocorrência (a 1, enquanto
+não for excluída); ao excluí-la, a regra passa a representar a próxima
+ocorrência ainda não gravada, sem mudar a agenda.
+
+Relatórios baseados no resumo mensal e nos saldos diários consideram apenas
+as ocorrências gravadas.
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app.models import db, Transacao
+from app.services.lancamentos import INTERVALOS_RECORRENCIA, linha_ocorrencia
+
+
+class OcorrenciaVirtual:
+    """
+    Ocorrência calculada de uma recorrência virtual (somente leitura)
+
+    Expõe os atributos de Transacao usados nas listagens; os dados vêm da
+    regra. O id é o caminho usado nas rotas de materialização
+    (/transacoes/recorrencia/<regra>/<numero>/...).
+    """
+    virtual = True
+    pago = False
+    parcelado = False
+    numero_parcela = None
+    total_parcelas = None
+    recorrente = True
+
+    ATRIBUTOS_DA_REGRA = (
+        'descricao', 'valor', 'tipo', 'forma_pagamento', 'conta_id', 'categoria_id', 'user_id',
+        'conta', 'categoria', 'frequencia_recorrencia', 'quantidade_recorrencias'
+    )
+
+    def __init__(self, regra, numero, data):
+        self.regra = regra
+        self.numero_ocorrencia = numero
+        self.data = data
+        self.id = f'recorrencia/{regra.id}/{numero}'
+
+    def __getattr__(self, nome):
+        if nome in self.ATRIBUTOS_DA_REGRA:
+            return getattr(self.regra, nome)
+        raise AttributeError(nome)
+
+    def pode_marcar_pago(self):
+        """Ocorrências virtuais podem ser pagas (o que as materializa)"""
+        return self.regra.pode_marcar_pago()
+
+
+def numeros_excluidos(regra):
+    """Números das ocorrências excluídas da regra"""
+    return {int(numero) for numero in (regra.ocorrencias_excluidas or '').split(',') if numero}
+
+
+def datas_da_regra(regra, inicio, fim):
+    """
+    Ocorrências da regra dentro do período (exceto a própria regra e as excluídas)
+
+    Returns:
+        list: tuplas (numero, data)
+    """
+    intervalo = INTERVALOS_RECORRENCIA.get(regra.frequencia_recorrencia)
+    if intervalo is None or not regra.data_inicio_recorrencia:
+        return []
+
+    ignorar = numeros_excluidos(regra) | {regra.numero_ocorrencia}
+    ocorrencias = []
+    for numero in range(1, (regra.quantidade_recorrencias or 1) + 1):
+        data = regra.data_inicio_recorrencia + intervalo * (numero - 1)
+        if data > fim:
+            break
+        if data >= inicio and numero not in ignorar:
+            ocorrencias.append((numero, data))
+    return ocorrencias
+
+
+def _buscar_regra(regra_id, user_id):
+    """Regra de recorrência virtual do usuário (a transação sem transação pai)"""
+    return Transacao.query.filter_by(
+        id=regra_id, user_id=user_id, recorrencia_virtual=True, transacao_recorrente_pai_id=None
+    ).first()
+
+
+def buscar_ocorrencias(user_id, inicio, fim):
+    """
+    Ocorrências virtuais (ainda não gravadas) do usuário no período
+
+    Duas consultas: as regras que começam até o fim do período (com conta e
+    categoria) e as ocorrências já materializadas dessas regras.
+
+    Args:
+        user_id: ID do usuário
+        inicio: primeiro dia do período
+        fim: último dia do período
+
+    Returns:
+        list: objetos OcorrenciaVirtual em ordem de data
+    """
+    regras = Transacao.query.options(
+        joinedload(Transacao.conta),
+        joinedload(Transacao.categoria)
+    ).filter(
+        Transacao.user_id == user_id,
+        Transacao.recorrencia_virtual == True,
+        Transacao.transacao_recorrente_pai_id.is_(None),
+        Transacao.data_inicio_recorrencia <= fim
+    ).all()
+    if not regras:
+        return []
+
+    materializadas = set(db.session.execute(
+        select(Transacao.transacao_recorrente_pai_id, Transacao.numero_ocorrencia).where(
+            Transacao.transacao_recorrente_pai_id.in_([regra.id for regra in regras]),
+            Transacao.numero_ocorrencia.isnot(None)
+        )
+    ).all())
+
+    ocorrencias = [
+        OcorrenciaVirtual(regra, numero, data)
+        for regra in regras
+        for numero, data in datas_da_regra(regra, inicio, fim)
+        if (regra.id, numero) not in materializadas
+    ]
+    ocorrencias.sort(key=lambda ocorrencia: ocorrencia.data)
+    return ocorrencias
+
+
+def ocorrencia_para_gravar(regra_id, numero, user_id):
+    """
+    Transação correspondente a uma ocorrência da regra
+
+    Retorna a ocorrência já materializada, se houver; senão, uma nova
+    Transacao com os dados da regra, ainda fora da sessão (o chamador decide
+    se a grava com db.session.add).
+
+    Args:
+        regra_id: ID da transação original (regra)
+        numero: posição da ocorrência
+        user_id: ID do usuário (dono da regra)
+
+    Returns:
+        Transacao ou None se a regra/ocorrência não existir ou tiver sido excluída
+    """
+    regra = _buscar_regra(regra_id, user_id)
+    if regra is None or not 1 <= numero <= (regra.quantidade_recorrencias or 1):
+        return None
+    if numero == regra.numero_ocorrencia:
+        return regra
+    if numero in numeros_excluidos(regra):
+        return None
+
+    existente = Transacao.query.filter_by(
+        transacao_recorrente_pai_id=regra.id, numero_ocorrencia=numero
+    ).first()
+    if existente is not None:
+        return existente
+
+    intervalo = INTERVALOS_RECORRENCIA.get(regra.frequencia_recorrencia)
+    if intervalo is None:
+        return None
+
+    data = regra.data_inicio_recorrencia + intervalo * (numero - 1)
+    return Transacao(**linha_ocorrencia(regra, numero, data))
+
+
+def excluir_ocorrencia(regra_id, numero, user_id):
+    """
+    Exclui uma ocorrência da recorrência, mantendo as demais
+
+    Registra a exclusão na regra e remove a linha da ocorrência, se gravada.
+    Se a ocorrência excluída é a própria regra, a regra passa a ser a próxima
+    ocorrência ainda não gravada nem excluída (mesma agenda; a transação só
+    é removida quando não resta nenhuma). Não faz commit.
+
+    Args:
+        regra_id: ID da transação original (regra)
+        numero: posição da ocorrência
+        user_id: ID do usuário (dono da regra)
+
+    Returns:
+        bool: False se a regra/ocorrência não existir
+    """
+    regra = _buscar_regra(regra_id, user_id)
+    if regra is None or not 1 <= numero <= (regra.quantidade_recorrencias or 1):
+        return False
+
+    excluidas = numeros_excluidos(regra) | {numero}
+    regra.ocorrencias_excluidas = ','.join(str(n) for n in sorted(excluidas))
+
+    if numero != regra.numero_ocorrencia:
+        gravada = Transacao.query.filter_by(transacao_recorrente_pai_id=regra.id, numero_ocorrencia=numero).first()
+        if gravada is not None:
+            db.session.delete(gravada)
+        return True
+
+    gravadas = set(db.session.scalars(
+        select(Transacao.numero_ocorrencia).where(Transacao.transacao_recorrente_pai_id == regra.id)
+    ))
+    intervalo = INTERVALOS_RECORRENCIA.get(regra.frequencia_recorrencia)
+    proximo = next(
+        (n for n in range(1, (regra.quantidade_recorrencias or 1) + 1) if n not in excluidas and n not in gravadas),
+        None
+    )
+    if intervalo is None or proximo is None:
+        db.session.delete(regra)
+        return True
+
+    regra.numero_ocorrencia = proximo
+    regra.data = regra.data_inicio_recorrencia + intervalo * (proximo - 1)
+    regra.pago = False
+    return True
@@ -46,6 +46,57 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max
     ALLOWED_EXTENSIONS = {'ofx', 'csv', 'txt'}
 
+    # Cotações (brapi.dev)
+    BRAPI_BASE_URL = os.environ.get('BRAPI_BASE_URL', 'https://brapi.dev/api')
+    BRAPI_TOKEN = os.environ.get('BRAPI_TOKEN')
+    BRAPI_TIMEOUT = int(os.environ.get('BRAPI_TIMEOUT', 10))
+    BRAPI_MAX_WORKERS = int(os.environ.get('BRAPI_MAX_WORKERS', 4))  # requisições em paralelo
+    BRAPI_TICKERS_POR_REQUISICAO = int(os.environ.get('BRAPI_TICKERS_POR_REQUISICAO', 1))  # plano gratuito: 1
+
+    # Atualização de cotações em segundo plano (desative se usar `flask cotacoes-worker`)
+    COTACOES_ATUALIZADOR_AUTOMATICO = os.environ.get('COTACOES_ATUALIZADOR_AUTOMATICO', 'true').lower() == 'true'
+    COTACOES_INTERVALO_SEGUNDOS = int(os.environ.get('COTACOES_INTERVALO_SEGUNDOS', 300))
+
+    # Conciliação bancária: jobs simultâneos por processo web
+    # (0 = não processa no servidor web; use `flask conciliacao-worker`)
+    CONCILIACAO_WORKERS = int(os.environ.get('CONCILIACAO_WORKERS', 2))
+
+    # Recorrências virtuais: grava só a transação original e calcula as demais
+    # ocorrências nas consultas (gravadas apenas ao serem pagas ou editadas)
+    RECORRENCIAS_VIRTUAIS = os.environ.get('RECORRENCIAS_VIRTUAIS', 'false').lower() == 'true'
+
+    # Relacionamento carregado sob demanda durante a renderização de um template
+    # (apenas em debug): 'log' registra um aviso, 'raise' falha, 'off' desativa
+    CARGA_SOB_DEMANDA_EM_TEMPLATES = os.environ.get('CARGA_SOB_DEMANDA_EM_TEMPLATES', 'log').lower()
+
+    # Perfil por requisição: log de consultas lentas (logs/consultas_lentas.log),
+    # percentis em /api/admin/desempenho e cabeçalho Server-Timing (este só em
+    # debug ou para usuários de ADMIN_EMAILS)
+    PERFIL_REQUISICOES = os.environ.get('PERFIL_REQUISICOES', 'true').lower() == 'true'
+    CONSULTA_LENTA_MS = int(os.environ.get('CONSULTA_LENTA_MS', 200))
+
+    # Token do Prometheus para GET /metrics (Authorization: Bearer <token>);
+    # sem token o endpoint fica desativado
+    METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+    # E-mails (separados por vírgula) com acesso às rotas de administração
+    ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
     # Login Security
     MAX_LOGIN_ATTEMPTS = 5
     LOGIN_ATTEMPT_TIMEOUT = 900  # 15 minutos
+
+    # Tentativas de login e bloqueios de IP, compartilhados entre os workers:
+    # database:// (tabela contadores_seguranca), memory:// (por processo) ou
+    # uma URL de storage da biblioteca limits (ex.: redis://)
+    SEGURANCA_STORAGE_URL = os.environ.get('SEGURANCA_STORAGE_URL') or os.environ.get('REDIS_URL', 'database://')
+
+    # Segundos que cada worker reaproveita a consulta de bloqueio de um IP
+    # (um bloqueio feito em outro worker vale em até esse tempo; 0 desativa)
+    BLOQUEIO_CACHE_SEGUNDOS = int(os.environ.get('BLOQUEIO_CACHE_SEGUNDOS', 5))
+
+    # Proxies reversos à frente da aplicação (nginx, traefik) cujo
+    # X-Forwarded-For é confiável para obter o IP do cliente. O padrão 0 usa o
+    # IP da conexão; só configure > 0 se a porta do gunicorn não for
+    # alcançável sem passar pelo proxy, senão o cliente forja o próprio IP
+    PROXIES_CONFIAVEIS = int(os.environ.get('PROXIES_CONFIAVEIS', 0))
@@ -0,0 +1,23 @@
+"""
+Configuração do gunicorn (carregada automaticamente a partir do diretório atual)
+
+Com PROMETHEUS_MULTIPROC_DIR definido, cada worker grava suas métricas em
+arquivos nesse diretório (ver app/metricas.py). O diretório é limpo quando o
+servidor inicia e os arquivos de workers encerrados são descartados.
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    diretorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+        for arquivo in glob.glob(os.path.join(diretorio, '*.db')):
+            os.remove(arquivo)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,53 @@
+"""Adiciona índices compostos para os filtros mais usados em transações
+
+Revision ID: 3f7a2c91d4e8
+Revises: 5b19b8709657
+Create Date: 2026-10-18 09:12:41.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7a2c91d4e8'
+down_revision = '5b19b8709657'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Transações: extrato por conta/período, matching por conta/tipo/período,
+    # orçamentos por categoria/período, gastos por cartão, faturas e recorrências
+    op.create_index('ix_transacoes_conta_data', 'transacoes', ['conta_id', 'data'], unique=False)
+    op.create_index('ix_transacoes_conta_tipo_data', 'transacoes', ['conta_id', 'tipo', 'data'], unique=False)
+    op.create_index('ix_transacoes_categoria_data', 'transacoes', ['categoria_id', 'data'], unique=False)
+    op.create_index('ix_transacoes_cartao_data', 'transacoes', ['cartao_credito_id', 'data'], unique=False)
+    op.create_index('ix_transacoes_fatura_id', 'transacoes', ['fatura_id'], unique=False)
+    op.create_index('ix_transacoes_recorrente_pai_id', 'transacoes', ['transacao_recorrente_pai_id'], unique=False)
+
+    # Chaves estrangeiras usadas como filtro
+    op.create_index('ix_contas_user_id', 'contas', ['user_id'], unique=False)
+    op.create_index('ix_cartoes_credito_user_id', 'cartoes_credito', ['user_id'], unique=False)
+    op.create_index('ix_faturas_cartao_id', 'faturas', ['cartao_id'], unique=False)
+    op.create_index('ix_itens_conciliacao_conciliacao_id', 'itens_conciliacao', ['conciliacao_id'], unique=False)
+    op.create_index('ix_itens_conciliacao_transacao_id', 'itens_conciliacao', ['transacao_id'], unique=False)
+    op.create_index('ix_depositos_meta_meta_id', 'depositos_meta', ['meta_id'], unique=False)
+    op.create_index('ix_orcamentos_user_periodo', 'orcamentos', ['user_id', 'ano', 'mes'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orcamentos_user_periodo', table_name='orcamentos')
+    op.drop_index('ix_depositos_meta_meta_id', table_name='depositos_meta')
+    op.drop_index('ix_itens_conciliacao_transacao_id', table_name='itens_conciliacao')
+    op.drop_index('ix_itens_conciliacao_conciliacao_id', table_name='itens_conciliacao')
+    op.drop_index('ix_faturas_cartao_id', table_name='faturas')
+    op.drop_index('ix_cartoes_credito_user_id', table_name='cartoes_credito')
+    op.drop_index('ix_contas_user_id', table_name='contas')
+
+    op.drop_index('ix_transacoes_recorrente_pai_id', table_name='transacoes')
+    op.drop_index('ix_transacoes_fatura_id', table_name='transacoes')
+    op.drop_index('ix_transacoes_cartao_data', table_name='transacoes')
+    op.drop_index('ix_transacoes_categoria_data', table_name='transacoes')
+    op.drop_index('ix_transacoes_conta_tipo_data', table_name='transacoes')
+    op.drop_index('ix_transacoes_conta_data', table_name='transacoes')
@@ -0,0 +1,39 @@
+"""Adiciona user_id em transacoes (desnormalizado de contas)
+
+Revision ID: a41c7e5b9d02
+Revises: 3f7a2c91d4e8
+Create Date: 2026-10-18 11:40:07.263511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c7e5b9d02'
+down_revision = '3f7a2c91d4e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_id', sa.Integer(), nullable=True))
+
+    # Preencher com o dono da conta de cada transação
+    op.execute(
+        'UPDATE transacoes SET user_id = '
+        '(SELECT contas.user_id FROM contas WHERE contas.id = transacoes.conta_id)'
+    )
+
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('transacoes_user_id_fkey', 'users', ['user_id'], ['id'])
+        batch_op.create_index('ix_transacoes_user_data', ['user_id', 'data'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.drop_index('ix_transacoes_user_data')
+        batch_op.drop_constraint('transacoes_user_id_fkey', type_='foreignkey')
+        batch_op.drop_column('user_id')
@@ -0,0 +1,34 @@
+"""Tabela de contadores de segurança (tentativas de login e bloqueios de IP)
+
+Revision ID: a8c4f2d6b913
+Revises: d7e1a3c5f982
+Create Date: 2026-10-18 23:58:02.114907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4f2d6b913'
+down_revision = 'd7e1a3c5f982'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('contadores_seguranca',
+    sa.Column('chave', sa.String(length=200), nullable=False),
+    sa.Column('valor', sa.Integer(), nullable=False),
+    sa.Column('expira_em', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('chave')
+    )
+    with op.batch_alter_table('contadores_seguranca', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_contadores_seguranca_expira_em'), ['expira_em'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('contadores_seguranca', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_contadores_seguranca_expira_em'))
+
+    op.drop_table('contadores_seguranca')
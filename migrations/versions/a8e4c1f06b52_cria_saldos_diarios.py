@@ -0,0 +1,73 @@
+"""Cria a tabela saldos_diarios (snapshots diários de saldo por conta)
+
+Revision ID: a8e4c1f06b52
+Revises: f1c6b2d84e37
+Create Date: 2026-10-18 19:05:44.613027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e4c1f06b52'
+down_revision = 'f1c6b2d84e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    saldos_diarios = op.create_table('saldos_diarios',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('conta_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.Date(), nullable=False),
+    sa.Column('movimento', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('acumulado', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['conta_id'], ['contas.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('conta_id', 'data', name='uq_saldos_diarios_conta_data')
+    )
+    with op.batch_alter_table('saldos_diarios', schema=None) as batch_op:
+        batch_op.create_index('ix_saldos_diarios_user_data', ['user_id', 'data'], unique=False)
+
+    # Backfill a partir das transações pagas existentes
+    transacoes = sa.table('transacoes',
+        sa.column('conta_id', sa.Integer),
+        sa.column('data', sa.Date),
+        sa.column('tipo', sa.String),
+        sa.column('pago', sa.Boolean),
+        sa.column('valor', sa.Numeric),
+    )
+    contas = sa.table('contas',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+    )
+    movimento = sa.func.sum(
+        sa.case((transacoes.c.tipo == 'receita', transacoes.c.valor), else_=-transacoes.c.valor)
+    )
+    diario = sa.select(
+        transacoes.c.conta_id, contas.c.user_id, transacoes.c.data, movimento.label('movimento')
+    ).select_from(
+        transacoes.join(contas, contas.c.id == transacoes.c.conta_id)
+    ).where(
+        transacoes.c.pago == sa.true()
+    ).group_by(transacoes.c.conta_id, contas.c.user_id, transacoes.c.data).subquery()
+
+    op.execute(
+        saldos_diarios.insert().from_select(
+            ['conta_id', 'user_id', 'data', 'movimento', 'acumulado'],
+            sa.select(
+                diario.c.conta_id, diario.c.user_id, diario.c.data, diario.c.movimento,
+                sa.func.sum(diario.c.movimento).over(partition_by=diario.c.conta_id, order_by=diario.c.data)
+            )
+        )
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('saldos_diarios', schema=None) as batch_op:
+        batch_op.drop_index('ix_saldos_diarios_user_data')
+
+    op.drop_table('saldos_diarios')
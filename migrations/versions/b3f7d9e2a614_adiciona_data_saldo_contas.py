@@ -0,0 +1,28 @@
+"""Adiciona data_saldo às contas (checkpoint do saldo derivado do extrato)
+
+Revision ID: b3f7d9e2a614
+Revises: a8e4c1f06b52
+Create Date: 2026-10-18 20:31:07.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7d9e2a614'
+down_revision = 'a8e4c1f06b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sem data_saldo o saldo é calculado pelos saldos diários até o próximo
+    # checkpoint (gravação na conta ou `flask saldos-verificar --corrigir`)
+    with op.batch_alter_table('contas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_saldo', sa.Date(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('contas', schema=None) as batch_op:
+        batch_op.drop_column('data_saldo')
@@ -0,0 +1,26 @@
+"""Ocorrências excluídas das recorrências virtuais
+
+Revision ID: b6d2f8a4c917
+Revises: a8c4f2d6b913
+Create Date: 2026-10-19 00:41:17.306528
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8a4c917'
+down_revision = 'a8c4f2d6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ocorrencias_excluidas', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.drop_column('ocorrencias_excluidas')
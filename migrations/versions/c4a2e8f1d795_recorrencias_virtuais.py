@@ -0,0 +1,37 @@
+"""Adiciona recorrências virtuais às transações
+
+Revision ID: c4a2e8f1d795
+Revises: b3f7d9e2a614
+Create Date: 2026-10-18 21:47:52.306118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a2e8f1d795'
+down_revision = 'b3f7d9e2a614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('numero_ocorrencia', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('recorrencia_virtual', sa.Boolean(), nullable=True))
+        batch_op.create_index('ix_transacoes_user_recorrencia_virtual', ['user_id', 'recorrencia_virtual'], unique=False)
+
+    # Recorrências existentes continuam com todas as ocorrências gravadas
+    op.execute('UPDATE transacoes SET recorrencia_virtual = false')
+    op.execute(
+        'UPDATE transacoes SET numero_ocorrencia = 1 '
+        'WHERE recorrente = true AND transacao_recorrente_pai_id IS NULL'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.drop_index('ix_transacoes_user_recorrencia_virtual')
+        batch_op.drop_column('recorrencia_virtual')
+        batch_op.drop_column('numero_ocorrencia')
@@ -0,0 +1,62 @@
+"""Cria a tabela resumo_mensal (agregados mensais para os relatórios)
+
+Revision ID: c7d3e18f5a60
+Revises: a41c7e5b9d02
+Create Date: 2026-10-18 14:05:52.917340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3e18f5a60'
+down_revision = 'a41c7e5b9d02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    resumo_mensal = op.create_table('resumo_mensal',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('ano', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Integer(), nullable=False),
+    sa.Column('categoria_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('pago', sa.Boolean(), nullable=False),
+    sa.Column('total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('quantidade', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['categoria_id'], ['categorias.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'ano', 'mes', 'categoria_id', 'tipo', 'pago', name='uq_resumo_mensal_chave')
+    )
+
+    # Backfill a partir das transações existentes
+    transacoes = sa.table('transacoes',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('data', sa.Date),
+        sa.column('categoria_id', sa.Integer),
+        sa.column('tipo', sa.String),
+        sa.column('pago', sa.Boolean),
+        sa.column('valor', sa.Numeric),
+    )
+    ano = sa.cast(sa.extract('year', transacoes.c.data), sa.Integer)
+    mes = sa.cast(sa.extract('month', transacoes.c.data), sa.Integer)
+    pago = sa.func.coalesce(transacoes.c.pago, sa.false())
+
+    op.execute(
+        resumo_mensal.insert().from_select(
+            ['user_id', 'ano', 'mes', 'categoria_id', 'tipo', 'pago', 'total', 'quantidade'],
+            sa.select(
+                transacoes.c.user_id, ano, mes, transacoes.c.categoria_id, transacoes.c.tipo, pago,
+                sa.func.sum(transacoes.c.valor), sa.func.count(transacoes.c.id)
+            ).group_by(transacoes.c.user_id, ano, mes, transacoes.c.categoria_id, transacoes.c.tipo, pago)
+        )
+    )
+
+
+def downgrade():
+    op.drop_table('resumo_mensal')
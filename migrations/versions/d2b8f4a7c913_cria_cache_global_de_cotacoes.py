@@ -0,0 +1,33 @@
+"""Cria a tabela cotacoes (cache global de cotações por ticker)
+
+Revision ID: d2b8f4a7c913
+Revises: c7d3e18f5a60
+Create Date: 2026-10-18 15:31:08.402716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b8f4a7c913'
+down_revision = 'c7d3e18f5a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cotacoes',
+    sa.Column('ticker', sa.String(length=20), nullable=False),
+    sa.Column('nome', sa.String(length=200), nullable=True),
+    sa.Column('preco', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('variacao_dia', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=True),
+    sa.Column('atualizando_desde', sa.DateTime(), nullable=True),
+    sa.Column('atualizando_token', sa.String(length=32), nullable=True),
+    sa.PrimaryKeyConstraint('ticker')
+    )
+
+
+def downgrade():
+    op.drop_table('cotacoes')
@@ -0,0 +1,29 @@
+"""Índice (user_id, data, id) para a paginação por chave das transações
+
+Revision ID: d7e1a3c5f982
+Revises: c4a2e8f1d795
+Create Date: 2026-10-18 23:12:40.518274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e1a3c5f982'
+down_revision = 'c4a2e8f1d795'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Substitui (user_id, data): a listagem ordena e pagina por (data, id)
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.create_index('ix_transacoes_user_data_id', ['user_id', 'data', 'id'], unique=False)
+        batch_op.drop_index('ix_transacoes_user_data')
+
+
+def downgrade():
+    with op.batch_alter_table('transacoes', schema=None) as batch_op:
+        batch_op.create_index('ix_transacoes_user_data', ['user_id', 'data'], unique=False)
+        batch_op.drop_index('ix_transacoes_user_data_id')
@@ -0,0 +1,69 @@
+"""Cria a tabela indice_categorias (índice de sugestão de categorias)
+
+Revision ID: e5a9c3d71b28
+Revises: d2b8f4a7c913
+Create Date: 2026-10-18 17:20:44.105982
+
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c3d71b28'
+down_revision = 'd2b8f4a7c913'
+branch_labels = None
+depends_on = None
+
+
+def _termos(descricao):
+    """Cópia de IndiceCategoria.termos no momento desta migração"""
+    texto = unicodedata.normalize('NFKD', descricao or '').encode('ascii', 'ignore').decode().lower()
+    palavras = [p for p in re.findall(r'[a-z]+', texto) if len(p) >= 3]
+    if not palavras:
+        return []
+
+    termos = [('descricao', ' '.join(palavras)[:200])]
+    termos += [('token', p[:200]) for p in set(palavras)]
+    termos += [('trigrama', t) for t in {f' {p} '[i:i + 3] for p in palavras for i in range(len(p))}]
+    return termos
+
+
+def upgrade():
+    indice_categorias = op.create_table('indice_categorias',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('nivel', sa.String(length=10), nullable=False),
+    sa.Column('termo', sa.String(length=200), nullable=False),
+    sa.Column('categoria_id', sa.Integer(), nullable=False),
+    sa.Column('frequencia', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['categoria_id'], ['categorias.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'tipo', 'nivel', 'termo', 'categoria_id', name='uq_indice_categorias_chave')
+    )
+
+    # Backfill a partir das transações existentes
+    contagem = defaultdict(int)
+    resultado = op.get_bind().execute(
+        sa.text('SELECT user_id, tipo, categoria_id, descricao FROM transacoes WHERE categoria_id IS NOT NULL')
+    )
+    for user_id, tipo, categoria_id, descricao in resultado:
+        for nivel, termo in _termos(descricao):
+            contagem[(user_id, tipo, nivel, termo, categoria_id)] += 1
+
+    linhas = [
+        {'user_id': u, 'tipo': t, 'nivel': n, 'termo': termo, 'categoria_id': c, 'frequencia': f}
+        for (u, t, n, termo, c), f in contagem.items()
+    ]
+    for inicio in range(0, len(linhas), 1000):
+        op.bulk_insert(indice_categorias, linhas[inicio:inicio + 1000])
+
+
+def downgrade():
+    op.drop_table('indice_categorias')
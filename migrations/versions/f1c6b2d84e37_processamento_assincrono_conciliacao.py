@@ -0,0 +1,37 @@
+"""Adiciona campos de processamento em segundo plano à conciliação bancária
+
+Revision ID: f1c6b2d84e37
+Revises: e5a9c3d71b28
+Create Date: 2026-10-18 17:42:19.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c6b2d84e37'
+down_revision = 'e5a9c3d71b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conciliacoes_bancarias', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('arquivo_conteudo', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('progresso', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('mensagem_erro', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('ultima_atividade', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_conciliacoes_bancarias_status', ['status'], unique=False)
+
+    # Conciliações já existentes foram processadas de forma síncrona
+    op.execute("UPDATE conciliacoes_bancarias SET progresso = 100 WHERE status <> 'processando'")
+
+
+def downgrade():
+    with op.batch_alter_table('conciliacoes_bancarias', schema=None) as batch_op:
+        batch_op.drop_index('ix_conciliacoes_bancarias_status')
+        batch_op.drop_column('ultima_atividade')
+        batch_op.drop_column('mensagem_erro')
+        batch_op.drop_column('progresso')
+        batch_op.drop_column('arquivo_conteudo')
@@ -0,0 +1,74 @@
+"""
+Fixtures dos testes: aplicação com SQLite em memória e um usuário com dados
+"""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'chave-de-teste')
+os.environ.setdefault('COTACOES_ATUALIZADOR_AUTOMATICO', 'false')
+
+import pytest
+
+from config import Config
+from app import create_app
+from app.models import db, User, Conta, Categoria
+
+
+class ConfigTeste(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    PERFIL_REQUISICOES = False
+    SEGURANCA_STORAGE_URL = 'memory://'
+    COTACOES_ATUALIZADOR_AUTOMATICO = False
+
+
+@pytest.fixture
+def app():
+    """
+    Aplicação com o banco criado
+
+    Nenhum contexto fica ativo: cada requisição do cliente de teste abre o
+    seu (como em produção) e os testes usam `with app.app_context()`.
+    """
+    app = create_app(ConfigTeste)
+    with app.app_context():
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def user_id(app):
+    """ID de um usuário com uma conta corrente e categorias de receita e despesa"""
+    with app.app_context():
+        return _criar_usuario()
+
+
+def _criar_usuario():
+    user = User(nome='Teste', email='teste@exemplo.com')
+    user.set_password('senha-de-teste')
+    db.session.add(user)
+    db.session.flush()
+
+    db.session.add_all([
+        Conta(nome='Corrente', tipo='corrente', saldo_inicial=1000, saldo_atual=1000, user_id=user.id),
+        Categoria(nome='Mercado', tipo='despesa', cor='#dc3545', user_id=user.id),
+        Categoria(nome='Salário', tipo='receita', cor='#198754', user_id=user.id),
+    ])
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def cliente(app, user_id):
+    """Cliente HTTP autenticado como o usuário de `user_id`"""
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao['_user_id'] = str(user_id)
+        sessao['_fresh'] = True
+    return cliente
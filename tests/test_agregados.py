@@ -0,0 +1,173 @@
+"""
+Agregados mantidos pelos eventos do flush (resumo mensal, saldos diários e
+checkpoint das contas) conferem com a reconstrução a partir das transações
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Conta, Categoria, Transacao, ResumoMensal, SaldoDiario
+
+
+def _resumo(user_id):
+    """Linhas do resumo mensal com movimento, por chave"""
+    return {
+        tuple(getattr(linha, coluna) for coluna in ResumoMensal.CHAVE): (linha.total, linha.quantidade)
+        for linha in db.session.execute(select(ResumoMensal.__table__).where(ResumoMensal.user_id == user_id))
+        if linha.total or linha.quantidade
+    }
+
+
+def _saldos(user_id):
+    """Acumulado por (conta, dia) dos dias com movimento"""
+    return {
+        (linha.conta_id, linha.data): linha.acumulado
+        for linha in db.session.execute(select(SaldoDiario.__table__).where(SaldoDiario.user_id == user_id))
+        if linha.movimento
+    }
+
+
+def _conferir(user_id):
+    """Compara os agregados incrementais com reconstruir() e o checkpoint com verificar_saldos()"""
+    assert Conta.verificar_saldos(user_id) == []
+
+    resumo, saldos = _resumo(user_id), _saldos(user_id)
+    ResumoMensal.reconstruir(user_id)
+    SaldoDiario.reconstruir(user_id)
+
+    assert resumo == _resumo(user_id)
+    assert saldos == _saldos(user_id)
+    db.session.rollback()
+
+
+def test_snapshot_de_flush_com_erro_nao_vaza_para_o_proximo_commit(app, user_id):
+    with app.app_context():
+        conta = Conta.query.filter_by(user_id=user_id).first()
+        despesa = Categoria.query.filter_by(user_id=user_id, tipo='despesa').first()
+        transacao = Transacao(descricao='Mercado', valor=Decimal('100'), tipo='despesa', data=date.today(),
+                              conta_id=conta.id, categoria_id=despesa.id, pago=True)
+        db.session.add(transacao)
+        db.session.commit()
+
+        # Edição no mesmo flush de uma categoria duplicada: o flush falha
+        duplicada = Categoria(nome=despesa.nome, tipo='despesa', user_id=user_id)
+        transacao.valor = Decimal('200')
+        db.session.add(duplicada)
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # Commit sem transações não pode aplicar o estado capturado no flush desfeito
+        db.session.add(Categoria(nome='Lazer', tipo='despesa', user_id=user_id))
+        db.session.commit()
+
+        assert conta.saldo() == Decimal('900.00')
+        _conferir(user_id)
+
+
+def _operacoes_aleatorias(aleatorio, user_id, contas, categorias, passos):
+    """
+    Inclusões, edições, exclusões e pagamentos aleatórios, com commits de tamanhos variados
+
+    Args:
+        contas: ids das contas do usuário
+        categorias: tuplas (id, nome, tipo) das categorias do usuário
+    """
+    hoje = date.today()
+
+    def dia():
+        return hoje + timedelta(days=aleatorio.randint(-90, 30))
+
+    def valor():
+        return Decimal(aleatorio.randint(1, 50000)) / 100
+
+    def nova():
+        categoria_id, _, tipo = aleatorio.choice(categorias)
+        return dict(descricao=f'Lançamento {aleatorio.randint(1, 999)}', valor=valor(), tipo=tipo,
+                    data=dia(), conta_id=aleatorio.choice(contas), categoria_id=categoria_id, user_id=user_id,
+                    pago=aleatorio.random() < 0.7)
+
+    for _ in range(passos):
+        ids = list(db.session.scalars(select(Transacao.id).where(Transacao.user_id == user_id)))
+        sorteio = aleatorio.random()
+
+        if sorteio < 0.1:
+            # Lote em uma conta com mais dias que LIMITE_INCREMENTAL: reconstrói a conta
+            conta_id = aleatorio.choice(contas)
+            Transacao.inserir_em_lote(
+                [{**nova(), 'conta_id': conta_id, 'data': hoje - timedelta(days=i), 'pago': True}
+                 for i in range(SaldoDiario.LIMITE_INCREMENTAL + 5)],
+                retornar_ids=False
+            )
+        elif sorteio < 0.2:
+            Transacao.inserir_em_lote([nova() for _ in range(aleatorio.randint(1, 10))], retornar_ids=False)
+        else:
+            # Sem autoflush, todas as alterações do passo vão para o mesmo flush
+            with db.session.no_autoflush:
+                _alterar(aleatorio, ids, nova, aleatorio.randint(1, 5))
+
+            if aleatorio.random() < 0.15:
+                # Flush que falha (categoria duplicada) junto com as alterações: nada pode sobrar dele
+                db.session.add(Categoria(nome=categorias[0][1], tipo='despesa', user_id=user_id))
+                with pytest.raises(IntegrityError):
+                    db.session.commit()
+                db.session.rollback()
+
+        db.session.commit()
+        _conferir(user_id)
+
+
+def _alterar(aleatorio, ids, nova, quantidade):
+    """Aplica `quantidade` operações aleatórias na sessão, sem gravar"""
+    for _ in range(quantidade):
+        operacao = aleatorio.choice(['incluir', 'editar', 'excluir', 'pagar']) if ids else 'incluir'
+        if operacao == 'incluir':
+            db.session.add(Transacao(**nova()))
+            continue
+
+        transacao = db.session.get(Transacao, aleatorio.choice(ids))
+        if transacao is None or transacao in db.session.deleted:
+            continue
+        if operacao == 'editar':
+            for campo, novo_valor in nova().items():
+                if campo != 'user_id' and aleatorio.random() < 0.5:
+                    setattr(transacao, campo, novo_valor)
+        elif operacao == 'excluir':
+            db.session.delete(transacao)
+        else:
+            transacao.pago = not transacao.pago
+
+
+def _serie_esperada(user_id, datas):
+    """Acumulado esperado (sem saldo_inicial) de todas as contas em cada data"""
+    transacoes = Transacao.query.filter_by(user_id=user_id, pago=True).all()
+    return [
+        (dia, sum((SaldoDiario.efeito(t.tipo, t.valor) for t in transacoes if t.data <= dia), Decimal('0')))
+        for dia in datas
+    ]
+
+
+@pytest.mark.parametrize('semente', range(6))
+def test_agregados_conferem_com_a_reconstrucao(app, user_id, semente):
+    aleatorio = random.Random(semente)
+    hoje = date.today()
+
+    with app.app_context():
+        poupanca = Conta(nome='Poupança', tipo='poupanca', saldo_inicial=250, saldo_atual=250, user_id=user_id)
+        db.session.add(poupanca)
+        db.session.commit()
+
+        contas = [conta.id for conta in Conta.query.filter_by(user_id=user_id)]
+        categorias = [(c.id, c.nome, c.tipo) for c in Categoria.query.filter_by(user_id=user_id)]
+
+        _operacoes_aleatorias(aleatorio, user_id, contas, categorias, passos=25)
+
+        # Série do gráfico de evolução: diária e amostrada
+        for inicio, pontos in ((hoje - timedelta(days=20), 60), (hoje - timedelta(days=120), 10), (None, 15)):
+            serie = SaldoDiario.serie(user_id, inicio, hoje + timedelta(days=30), pontos)
+            assert serie
+            assert serie == _serie_esperada(user_id, [dia for dia, _ in serie])
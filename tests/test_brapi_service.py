@@ -0,0 +1,145 @@
+"""
+Atualização de cotações contra um servidor HTTP local no lugar da brapi.dev
+"""
+import json
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import db, Ativo, TipoAtivo
+from app.services.brapi_service import brapi_service
+
+
+# Tickers com comportamento especial no servidor de teste
+TICKER_COM_ERRO = 'ERRO3'       # o lote inteiro responde 500
+TICKER_AUSENTE = 'SUMI3'        # o lote responde 200, mas sem este ticker
+
+TICKERS = ['PETR4', 'VALE3', 'ITUB4', TICKER_AUSENTE, TICKER_COM_ERRO]
+
+
+class ServidorBrapi(BaseHTTPRequestHandler):
+    """Responde GET /quote/<tickers separados por vírgula> como a brapi.dev"""
+
+    def do_GET(self):
+        caminho = self.path.split('?', 1)[0]
+        tickers = caminho[len('/quote/'):].split(',')
+        self.server.lotes.append(tickers)
+
+        if TICKER_COM_ERRO in tickers:
+            self._responder(500, {'error': True})
+            return
+
+        self._responder(200, {'results': [
+            {'symbol': ticker, 'longName': f'Empresa {ticker}', 'regularMarketPrice': 10 + i,
+             'regularMarketChangePercent': 1.5}
+            for i, ticker in enumerate(tickers) if ticker != TICKER_AUSENTE
+        ]})
+
+    def _responder(self, status, corpo):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def servidor_brapi(app):
+    """Servidor local em porta livre, com BRAPI_BASE_URL apontando para ele"""
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServidorBrapi)
+    servidor.lotes = []
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+
+    app.config.update(
+        BRAPI_BASE_URL=f'http://127.0.0.1:{servidor.server_address[1]}',
+        BRAPI_TOKEN=None,
+        BRAPI_TICKERS_POR_REQUISICAO=2,
+        BRAPI_MAX_WORKERS=2,
+        BRAPI_TIMEOUT=5
+    )
+    yield servidor
+
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def carteira(app, user_id):
+    """Um ativo por ticker de TICKERS, sem cotação"""
+    with app.app_context():
+        tipo = TipoAtivo(nome='Ação')
+        db.session.add(tipo)
+        db.session.flush()
+        db.session.add_all([
+            Ativo(user_id=user_id, tipo_ativo_id=tipo.id, ticker=ticker, quantidade=10, preco_medio=20)
+            for ticker in TICKERS
+        ])
+        db.session.commit()
+
+
+def test_lotes_respeitam_tickers_por_requisicao(app, servidor_brapi):
+    with app.app_context():
+        cotacoes, latencias, falhas = brapi_service._buscar_cotacoes_concorrente(TICKERS)
+
+    assert all(len(lote) <= 2 for lote in servidor_brapi.lotes)
+    assert len(servidor_brapi.lotes) == 3
+    assert sorted(t for lote in servidor_brapi.lotes for t in lote) == sorted(TICKERS)
+    assert set(cotacoes) == {'PETR4', 'VALE3', 'ITUB4'}
+
+
+def test_atualizar_carteira_grava_tudo_em_um_commit(app, user_id, carteira, servidor_brapi):
+    ativos_por_commit = []
+    ativos_no_flush = set()
+
+    def ao_flush(session, contexto):
+        # Em after_flush, session.dirty ainda mostra o que foi gravado
+        ativos_no_flush.update(obj.ticker for obj in session.dirty if isinstance(obj, Ativo))
+
+    def ao_commit(session):
+        ativos_por_commit.append(set(ativos_no_flush))
+        ativos_no_flush.clear()
+
+    with app.app_context():
+        ativos = Ativo.query.filter_by(user_id=user_id).all()
+
+        event.listen(Session, 'after_flush', ao_flush)
+        event.listen(Session, 'after_commit', ao_commit)
+        try:
+            stats = brapi_service.atualizar_carteira(ativos)
+        finally:
+            event.remove(Session, 'after_flush', ao_flush)
+            event.remove(Session, 'after_commit', ao_commit)
+
+        precos = {ativo.ticker: ativo.ultimo_preco for ativo in Ativo.query.filter_by(user_id=user_id)}
+
+    assert all(len(lote) <= 2 for lote in servidor_brapi.lotes)
+
+    # Latência e falha por ticker nas estatísticas
+    assert set(stats['latencias']) == set(TICKERS)
+    assert all(latencia >= 0 for latencia in stats['latencias'].values())
+    assert stats['falhas'] == {TICKER_AUSENTE: 'ticker ausente na resposta', TICKER_COM_ERRO: 'status 500'}
+    assert stats['atualizados'] == 3
+    assert stats['erros'] == 2
+
+    # Todos os ativos atualizados em um único commit
+    assert ativos_por_commit == [{'PETR4', 'VALE3', 'ITUB4'}]
+    assert precos['PETR4'] == Decimal('10.00')
+    assert precos[TICKER_COM_ERRO] is None
+
+
+def test_atualizar_cotacoes_informa_falhas(app, servidor_brapi):
+    with app.app_context():
+        stats = brapi_service.atualizar_cotacoes(TICKERS)
+
+    assert stats['atualizados'] == 3
+    assert set(stats['latencias']) == set(TICKERS)
+    assert stats['falhas'] == {TICKER_AUSENTE: 'ticker ausente na resposta', TICKER_COM_ERRO: 'status 500'}
@@ -0,0 +1,58 @@
+"""
+Guarda de cargas sob demanda nos templates: vale quando o debug é ativado
+depois de create_app (como em app.run(debug=True))
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from flask import render_template_string
+from sqlalchemy import update
+
+from app.carregamento import CargaSobDemandaError, perfil
+from app.models import db, Conta, Categoria, Transacao
+
+
+TEMPLATE = '{% for t in transacoes %}{{ t.categoria.nome }}{% endfor %}'
+
+
+@pytest.fixture
+def transacao_id(app, user_id):
+    app.config['CARGA_SOB_DEMANDA_EM_TEMPLATES'] = 'raise'
+    with app.app_context():
+        conta = Conta.query.filter_by(user_id=user_id).first()
+        categoria = Categoria.query.filter_by(user_id=user_id).first()
+        transacao = Transacao(descricao='Padaria', valor=Decimal('12'), tipo='despesa', data=date.today(),
+                              conta_id=conta.id, categoria_id=categoria.id)
+        db.session.add(transacao)
+        db.session.commit()
+        return transacao.id
+
+
+def _renderizar(app, transacao_id, *opcoes):
+    with app.test_request_context():
+        transacoes = Transacao.query.options(*opcoes).filter_by(id=transacao_id).all()
+        return render_template_string(TEMPLATE, transacoes=transacoes)
+
+
+def test_sem_debug_nao_verifica(app, transacao_id):
+    assert not app.debug
+    assert _renderizar(app, transacao_id) == 'Mercado'
+
+
+def test_debug_ativado_depois_de_create_app(app, transacao_id):
+    app.debug = True
+
+    with pytest.raises(CargaSobDemandaError):
+        _renderizar(app, transacao_id)
+
+    assert _renderizar(app, transacao_id, *perfil('transacoes')) == 'Mercado'
+
+
+def test_comandos_orm_que_nao_sao_select(app, transacao_id):
+    app.debug = True
+
+    with app.test_request_context():
+        db.session.execute(update(Transacao).where(Transacao.id == transacao_id).values(descricao='Feira'))
+        db.session.commit()
+        assert db.session.get(Transacao, transacao_id).descricao == 'Feira'
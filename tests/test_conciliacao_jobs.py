@@ -0,0 +1,78 @@
+"""
+Importação de extratos em blocos: matching e gravação dos itens bloco a bloco
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import parsers
+from app.models import db, Conta, Categoria, Transacao, ConciliacaoBancaria, ItemConciliacao
+from app.services import conciliacao_jobs
+
+
+LINHAS_POR_BLOCO = 3
+
+
+@pytest.fixture
+def blocos_lidos(monkeypatch):
+    """Blocos pequenos, registrando o tamanho de cada um"""
+    lidos = []
+
+    def iter_file_chunks(*args, **kwargs):
+        for lote in parsers.iter_file_chunks(*args, chunksize=LINHAS_POR_BLOCO, **kwargs):
+            lidos.append(len(lote))
+            yield lote
+
+    monkeypatch.setattr(conciliacao_jobs, 'iter_file_chunks', iter_file_chunks)
+    return lidos
+
+
+def _conciliacao(user_id, conteudo):
+    conta = Conta.query.filter_by(user_id=user_id).first()
+    conciliacao = ConciliacaoBancaria(user_id=user_id, conta_id=conta.id, arquivo_nome='extrato.csv',
+                                      formato='CSV', arquivo_conteudo=conteudo)
+    db.session.add(conciliacao)
+    db.session.commit()
+    return conciliacao.id
+
+
+def test_extrato_processado_em_blocos(app, user_id, blocos_lidos):
+    linhas = [f'{dia:02d}/03/2024,Compra {dia},"-{dia},00"' for dia in range(1, 11)]
+    # A mesma compra no fim do 1º bloco e no início do 2º: só um item fica com a transação
+    linhas[2:2] = ['05/03/2024,Padaria Central,"-42,50"'] * 2
+    conteudo = ('data,descricao,valor\n' + '\n'.join(linhas) + '\n').encode()
+
+    with app.app_context():
+        conta = Conta.query.filter_by(user_id=user_id).first()
+        despesa = Categoria.query.filter_by(user_id=user_id, tipo='despesa').first()
+        padaria = Transacao(descricao='Padaria Central', valor=Decimal('42.50'), tipo='despesa',
+                            data=date(2024, 3, 5), conta_id=conta.id, categoria_id=despesa.id)
+        db.session.add(padaria)
+        db.session.commit()
+        padaria_id = padaria.id
+
+        conciliacao_id = _conciliacao(user_id, conteudo)
+        assert conciliacao_jobs.processar_conciliacao(conciliacao_id)
+
+        conciliacao = db.session.get(ConciliacaoBancaria, conciliacao_id)
+        itens = ItemConciliacao.query.filter_by(conciliacao_id=conciliacao_id).order_by(ItemConciliacao.id).all()
+
+        assert conciliacao.status == 'pendente_revisao'
+        assert conciliacao.total_linhas == len(itens) == 12
+        assert (conciliacao.data_inicio, conciliacao.data_fim) == (date(2024, 3, 1), date(2024, 3, 10))
+        assert [item.descricao for item in itens][:5] == ['Compra 1', 'Compra 2', 'Padaria Central',
+                                                          'Padaria Central', 'Compra 3']
+        assert [item.transacao_id for item in itens][2:4] == [padaria_id, None]
+
+    assert blocos_lidos == [3, 3, 3, 3]
+
+
+def test_extrato_sem_transacoes(app, user_id, blocos_lidos):
+    with app.app_context():
+        conciliacao_id = _conciliacao(user_id, b'data,descricao,valor\n')
+        conciliacao_jobs.processar_conciliacao(conciliacao_id)
+
+        conciliacao = db.session.get(ConciliacaoBancaria, conciliacao_id)
+        assert conciliacao.status == 'erro'
+        assert conciliacao.mensagem_erro == 'Nenhuma transação encontrada no arquivo'
@@ -0,0 +1,98 @@
+"""
+O dashboard é montado com um número fixo de consultas (montar_dashboard)
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from app.models import db, Conta, Categoria, Transacao, CartaoCredito, Fatura, Orcamento, Meta, DepositoMeta
+from app.services.dashboard_service import montar_dashboard
+
+
+N = 5
+
+
+def _popular(user_id, quantidade, inicio=0):
+    """Cria `quantidade` transações, metas (com depósitos), orçamentos e faturas do mês corrente"""
+    hoje = date.today()
+    conta = Conta.query.filter_by(user_id=user_id).first()
+    despesa = Categoria.query.filter_by(user_id=user_id, tipo='despesa').first()
+    receita = Categoria.query.filter_by(user_id=user_id, tipo='receita').first()
+
+    cartao = CartaoCredito(nome=f'Cartão {inicio}', bandeira='Visa', limite=5000, limite_utilizado=0,
+                           dia_fechamento=5, dia_vencimento=15, user_id=user_id)
+    db.session.add(cartao)
+    db.session.flush()
+
+    for i in range(inicio, inicio + quantidade):
+        dia = hoje.replace(day=1) + timedelta(days=i % 28)
+        db.session.add(Transacao(descricao=f'Compra {i}', valor=Decimal('10.50') + i, tipo='despesa', data=dia,
+                                 conta_id=conta.id, categoria_id=despesa.id, pago=dia <= hoje))
+        db.session.add(Transacao(descricao=f'Receita {i}', valor=Decimal('100'), tipo='receita', data=dia,
+                                 conta_id=conta.id, categoria_id=receita.id, pago=dia <= hoje))
+
+        db.session.add(Fatura(cartao_id=cartao.id, mes_referencia=hoje.month, ano_referencia=hoje.year,
+                              data_fechamento=hoje + timedelta(days=i), data_vencimento=hoje + timedelta(days=i + 10),
+                              valor_total=Decimal('100'), valor_pago=0, status='aberta'))
+
+        db.session.add(Orcamento(user_id=user_id, categoria_id=despesa.id, mes=hoje.month, ano=hoje.year,
+                                 valor_limite=Decimal('50') * (i + 1)))
+
+        meta = Meta(user_id=user_id, titulo=f'Meta {i}', valor_alvo=1000, valor_inicial=10 * i,
+                    data_inicio=hoje - timedelta(days=100), data_fim=hoje + timedelta(days=i + 1), status='ativa')
+        db.session.add(meta)
+        db.session.flush()
+        db.session.add_all([DepositoMeta(meta_id=meta.id, valor=Decimal('25'), data=hoje) for _ in range(3)])
+
+    db.session.commit()
+
+
+def _contar_consultas(engine, funcao):
+    """Executa `funcao` e retorna quantas consultas SQL foram emitidas"""
+    consultas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', contar)
+    try:
+        funcao()
+    finally:
+        event.remove(engine, 'before_cursor_execute', contar)
+    return len(consultas)
+
+
+def test_montar_dashboard_consultas_nao_crescem_com_os_dados(app, user_id):
+    hoje = date.today()
+
+    with app.app_context():
+        _popular(user_id, N)
+        db.session.expunge_all()
+        consultas_n = _contar_consultas(db.engine, lambda: montar_dashboard(user_id, hoje.month, hoje.year))
+
+        _popular(user_id, 9 * N, inicio=N)
+        db.session.expunge_all()
+        consultas_10n = _contar_consultas(db.engine, lambda: montar_dashboard(user_id, hoje.month, hoje.year))
+
+    assert consultas_n == consultas_10n
+
+
+def test_rota_dashboard_consultas_nao_crescem_com_os_dados(app, user_id, cliente):
+    with app.app_context():
+        engine = db.engine
+        _popular(user_id, N)
+    consultas_n = _contar_consultas(engine, lambda: cliente.get('/'))
+
+    with app.app_context():
+        _popular(user_id, 9 * N, inicio=N)
+    resposta = None
+
+    def requisitar():
+        nonlocal resposta
+        resposta = cliente.get('/')
+
+    consultas_10n = _contar_consultas(engine, requisitar)
+
+    assert resposta.status_code == 200
+    assert consultas_n == consultas_10n
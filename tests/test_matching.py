@@ -0,0 +1,121 @@
+"""
+calcular_scores_matching (em lote) dá os mesmos scores de calcular_score_matching
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from app.matching import CandidatosMatching, calcular_score_matching, calcular_scores_matching
+
+
+DATA_BASE = date(2024, 3, 15)
+
+DESCRICOES = [
+    '', ' ', '...', '!!! ---', '*', 'PIX', 'pix recebido', 'PIX RECEBIDO - João', 'Pão de Açúcar',
+    'PAO DE ACUCAR', 'açúcar pão de', 'Supermercado Extra 123', 'extra supermercado', 'Ônibus/Metrô',
+    'onibus metro', 'TED 0001 Fulano', 'Farmácia São João', 'farmacia sao joao', 'Cartão ÇÃO',
+    'uber *trip', 'UBER TRIP', 'Netflix.com', 'NETFLIX COM', '12345', 'a', 'ÁÉÍÓÚ',
+]
+
+
+def _scores(item, transacoes):
+    """Score de referência (um par por vez) e score em lote, na mesma ordem"""
+    candidatos = CandidatosMatching(transacoes)
+    esperado = [calcular_score_matching(item, t) for t in transacoes]
+    obtido = calcular_scores_matching(item, candidatos.valores, candidatos.dias, candidatos.descricoes)
+    return esperado, [int(s) for s in obtido]
+
+
+def _transacao(valor, data, descricao):
+    return SimpleNamespace(valor=Decimal(valor), data=data, descricao=descricao)
+
+
+@pytest.mark.parametrize('descricao_item', DESCRICOES)
+def test_descricoes_vazias_pontuacao_e_acentos(descricao_item):
+    item = {'valor': Decimal('50.00'), 'data': DATA_BASE, 'descricao': descricao_item}
+    transacoes = [_transacao('50.00', DATA_BASE, descricao) for descricao in DESCRICOES]
+
+    esperado, obtido = _scores(item, transacoes)
+
+    assert obtido == esperado
+
+
+@pytest.mark.parametrize('valor_transacao', [
+    '100.00', '100.001', '100.009', '100.01', '99.99', '99.991', '100.0099', '99.9901', '0.01', '1000000.00',
+])
+def test_valores_quase_iguais(valor_transacao):
+    item = {'valor': Decimal('100.00'), 'data': DATA_BASE, 'descricao': 'Mercado'}
+
+    esperado, obtido = _scores(item, [_transacao(valor_transacao, DATA_BASE, 'Mercado')])
+
+    assert obtido == esperado
+
+
+@pytest.mark.parametrize('dias', [0, 1, -1, 2, 3, -3, 4, 7, -7, 8, 30])
+def test_faixas_de_data(dias):
+    item = {'valor': Decimal('10.00'), 'data': DATA_BASE, 'descricao': 'Padaria'}
+
+    esperado, obtido = _scores(item, [_transacao('10.00', DATA_BASE + timedelta(days=dias), 'Padaria')])
+
+    assert obtido == esperado
+
+
+def test_transacao_com_valor_zero():
+    """O score individual divide pelo valor da transação; em lote o critério de valor vale 0"""
+    item = {'valor': Decimal('25.00'), 'data': DATA_BASE, 'descricao': 'Tarifa'}
+    zerada = _transacao('0.00', DATA_BASE, 'Tarifa')
+
+    with pytest.raises(ZeroDivisionError):
+        calcular_score_matching(item, zerada)
+
+    candidatos = CandidatosMatching([zerada])
+    obtido = calcular_scores_matching(item, candidatos.valores, candidatos.dias, candidatos.descricoes)
+
+    # Sem os 40 pontos de valor: 30 da data e 30 da descrição
+    assert list(obtido) == [60]
+
+
+def test_valor_zero_nos_dois_lados():
+    item = {'valor': Decimal('0.00'), 'data': DATA_BASE, 'descricao': 'Estorno'}
+
+    esperado, obtido = _scores(item, [_transacao('0.00', DATA_BASE, 'Estorno')])
+
+    assert obtido == esperado == [100]
+
+
+def test_sem_candidatos():
+    item = {'valor': Decimal('10.00'), 'data': DATA_BASE, 'descricao': 'Nada'}
+    candidatos = CandidatosMatching([])
+
+    assert len(calcular_scores_matching(item, candidatos.valores, candidatos.dias, candidatos.descricoes)) == 0
+
+
+@pytest.mark.parametrize('semente', range(20))
+def test_pares_aleatorios(semente):
+    """Propriedade: para itens e transações aleatórios, os scores em lote são idênticos"""
+    aleatorio = random.Random(semente)
+
+    def valor():
+        if aleatorio.random() < 0.2:
+            return Decimal('100.00')
+        return Decimal(aleatorio.randint(1, 200000)) / 100
+
+    def descricao():
+        palavras = aleatorio.sample(DESCRICOES, aleatorio.randint(0, 3))
+        return ' '.join(palavras)
+
+    for _ in range(25):
+        item = {'valor': valor(), 'data': DATA_BASE + timedelta(days=aleatorio.randint(-10, 10)),
+                'descricao': descricao()}
+        transacoes = sorted(
+            (_transacao(valor(), DATA_BASE + timedelta(days=aleatorio.randint(-10, 10)), descricao())
+             for _ in range(40)),
+            key=lambda t: t.data
+        )
+
+        esperado, obtido = _scores(item, transacoes)
+
+        assert obtido == esperado
@@ -0,0 +1,59 @@
+"""
+Cabeçalho Server-Timing: apenas em debug ou para administradores
+"""
+import pytest
+
+from app import create_app
+from app.models import db
+from tests.conftest import ConfigTeste, _criar_usuario
+
+
+class ConfigPerfil(ConfigTeste):
+    PERFIL_REQUISICOES = True
+    ADMIN_EMAILS = {'admin@exemplo.com'}
+
+
+@pytest.fixture
+def app_perfil():
+    app = create_app(ConfigPerfil)
+    with app.app_context():
+        db.create_all()
+        user_id = _criar_usuario()
+
+    app.user_id = user_id
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+def _cliente(app, autenticado=True):
+    cliente = app.test_client()
+    if autenticado:
+        with cliente.session_transaction() as sessao:
+            sessao['_user_id'] = str(app.user_id)
+            sessao['_fresh'] = True
+    return cliente
+
+
+def test_anonimo_nao_recebe_server_timing(app_perfil):
+    resposta = _cliente(app_perfil, autenticado=False).get('/login')
+
+    assert resposta.status_code == 200
+    assert 'Server-Timing' not in resposta.headers
+
+
+def test_usuario_comum_nao_recebe_server_timing(app_perfil):
+    assert 'Server-Timing' not in _cliente(app_perfil).get('/contas').headers
+
+
+def test_administrador_recebe_server_timing(app_perfil):
+    app_perfil.config['ADMIN_EMAILS'] = {'teste@exemplo.com'}
+
+    assert _cliente(app_perfil).get('/contas').headers['Server-Timing'].startswith('db;dur=')
+
+
+def test_debug_recebe_server_timing(app_perfil):
+    app_perfil.debug = True
+
+    assert 'Server-Timing' in _cliente(app_perfil, autenticado=False).get('/login').headers
@@ -0,0 +1,106 @@
+"""
+Exclusão de ocorrências de recorrências virtuais: só a ocorrência excluída
+some, gravada ou não, inclusive quando é a própria regra
+"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.models import db, Conta, Categoria, Transacao
+from app.services.recorrencias_virtuais import buscar_ocorrencias
+
+
+INICIO = date(2030, 1, 31)
+FIM = date(2031, 12, 31)
+QUANTIDADE = 6
+
+
+@pytest.fixture
+def regra_id(app, user_id):
+    """Despesa mensal virtual com 6 ocorrências, começando em 31/01"""
+    app.config['RECORRENCIAS_VIRTUAIS'] = True
+    with app.app_context():
+        conta = Conta.query.filter_by(user_id=user_id).first()
+        despesa = Categoria.query.filter_by(user_id=user_id, tipo='despesa').first()
+        regra = Transacao(descricao='Aluguel', valor=Decimal('1500'), tipo='despesa', data=INICIO,
+                          forma_pagamento='dinheiro', conta_id=conta.id, categoria_id=despesa.id, user_id=user_id,
+                          recorrente=True, frequencia_recorrencia='mensal', data_inicio_recorrencia=INICIO,
+                          quantidade_recorrencias=QUANTIDADE, numero_ocorrencia=1, recorrencia_virtual=True)
+        db.session.add(regra)
+        db.session.commit()
+        return regra.id
+
+
+def _ocorrencias(app, user_id):
+    """{numero: (data, gravada)} de todas as ocorrências da série, gravadas e virtuais"""
+    with app.app_context():
+        ocorrencias = {
+            ocorrencia.numero_ocorrencia: (ocorrencia.data, False)
+            for ocorrencia in buscar_ocorrencias(user_id, INICIO, FIM)
+        }
+        for transacao in Transacao.query.filter_by(user_id=user_id, recorrente=True):
+            assert transacao.numero_ocorrencia not in ocorrencias
+            ocorrencias[transacao.numero_ocorrencia] = (transacao.data, True)
+    return ocorrencias
+
+
+def test_ocorrencia_gravada_excluida_nao_volta(app, user_id, cliente, regra_id):
+    resposta = cliente.post(f'/transacoes/recorrencia/{regra_id}/2/toggle-pago')
+    assert resposta.get_json()['pago'] is True
+
+    with app.app_context():
+        gravada = Transacao.query.filter_by(transacao_recorrente_pai_id=regra_id, numero_ocorrencia=2).one()
+        gravada_id = gravada.id
+
+    cliente.post(f'/transacoes/{gravada_id}/deletar')
+
+    ocorrencias = _ocorrencias(app, user_id)
+    assert sorted(ocorrencias) == [1, 3, 4, 5, 6]
+    assert ocorrencias[1] == (INICIO, True)
+    assert ocorrencias[3] == (date(2030, 3, 31), False)
+
+    # A ocorrência excluída não pode mais ser paga nem editada
+    assert cliente.post(f'/transacoes/recorrencia/{regra_id}/2/toggle-pago').status_code == 404
+    assert cliente.get(f'/transacoes/recorrencia/{regra_id}/2/editar').status_code == 404
+
+
+def test_ocorrencia_virtual_excluida(app, user_id, cliente, regra_id):
+    resposta = cliente.post(f'/transacoes/recorrencia/{regra_id}/4/deletar')
+
+    assert resposta.status_code == 302
+    assert sorted(_ocorrencias(app, user_id)) == [1, 2, 3, 5, 6]
+
+
+def test_excluir_a_regra_mantem_as_demais_ocorrencias(app, user_id, cliente, regra_id):
+    # A 2 já está gravada: a regra passa a ser a 3, a primeira ainda virtual
+    cliente.post(f'/transacoes/recorrencia/{regra_id}/2/toggle-pago')
+
+    cliente.post(f'/transacoes/{regra_id}/deletar')
+
+    ocorrencias = _ocorrencias(app, user_id)
+    assert sorted(ocorrencias) == [2, 3, 4, 5, 6]
+    assert ocorrencias[2] == (date(2030, 2, 28), True)
+    assert ocorrencias[3] == (date(2030, 3, 31), True)
+    # A agenda continua a partir da data inicial (dia 31, não dia 28 ou 30)
+    assert ocorrencias[5] == (date(2030, 5, 31), False)
+
+    with app.app_context():
+        regra = db.session.get(Transacao, regra_id)
+        assert (regra.numero_ocorrencia, regra.data, regra.pago) == (3, date(2030, 3, 31), False)
+        assert Conta.verificar_saldos(user_id) == []
+
+    # Excluindo a nova regra (a 3), segue para a 4
+    cliente.post(f'/transacoes/{regra_id}/deletar')
+    assert sorted(_ocorrencias(app, user_id)) == [2, 4, 5, 6]
+
+
+def test_excluir_todas_as_ocorrencias_remove_a_regra(app, user_id, cliente, regra_id):
+    for numero in range(2, QUANTIDADE + 1):
+        cliente.post(f'/transacoes/recorrencia/{regra_id}/{numero}/deletar')
+
+    cliente.post(f'/transacoes/{regra_id}/deletar')
+
+    assert _ocorrencias(app, user_id) == {}
+    with app.app_context():
+        assert db.session.get(Transacao, regra_id) is None
@@ -0,0 +1,52 @@
+"""
+As telas que listam contas mostram o saldo derivado do extrato (Conta.saldos),
+não o checkpoint saldo_atual
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+
+from app.models import db, Conta, Categoria, Transacao, CartaoCredito, Fatura
+
+
+@pytest.fixture
+def checkpoint_desatualizado(app, user_id):
+    """Conta com saldo de 750,00 pelo extrato e checkpoint de outro dia com valor errado"""
+    ontem = date.today() - timedelta(days=1)
+
+    with app.app_context():
+        conta = Conta.query.filter_by(user_id=user_id).first()
+        despesa = Categoria.query.filter_by(user_id=user_id, tipo='despesa').first()
+        transacao = Transacao(descricao='Aluguel', valor=Decimal('250'), tipo='despesa', data=ontem,
+                              conta_id=conta.id, categoria_id=despesa.id, pago=True)
+        cartao = CartaoCredito(nome='Cartão', bandeira='Visa', limite=5000, limite_utilizado=0,
+                               dia_fechamento=5, dia_vencimento=15, user_id=user_id)
+        db.session.add_all([transacao, cartao])
+        db.session.flush()
+
+        fatura = Fatura(cartao_id=cartao.id, mes_referencia=ontem.month, ano_referencia=ontem.year,
+                        data_fechamento=ontem, data_vencimento=ontem + timedelta(days=10),
+                        valor_total=Decimal('100'), valor_pago=0, status='fechada')
+        db.session.add(fatura)
+        db.session.commit()
+
+        db.session.execute(update(Conta).where(Conta.id == conta.id).values(saldo_atual=1, data_saldo=ontem))
+        db.session.commit()
+
+        return {'transacao': transacao.id, 'fatura': fatura.id}
+
+
+@pytest.mark.parametrize('pagina', [
+    '/transacoes/{transacao}/editar',
+    '/conciliacao/nova',
+    '/faturas/{fatura}',
+])
+def test_pagina_mostra_saldo_do_extrato(cliente, checkpoint_desatualizado, pagina):
+    resposta = cliente.get(pagina.format(**checkpoint_desatualizado))
+    html = resposta.get_data(as_text=True)
+
+    assert resposta.status_code == 200
+    assert 'Saldo: R$ 750.00' in html
+    assert 'Saldo: R$ 1.00' not in html
@@ -0,0 +1,28 @@
+"""
+IP do cliente (get_client_ip) com e sem proxies confiáveis
+"""
+from app import create_app
+from app.security import get_client_ip
+from tests.conftest import ConfigTeste
+
+
+CABECALHOS = {'X-Forwarded-For': '203.0.113.7, 198.51.100.2'}
+
+
+def _ip_visto(app):
+    app.add_url_rule('/_ip', 'ip_teste', get_client_ip)
+    return app.test_client().get('/_ip', headers=CABECALHOS,
+                                 environ_base={'REMOTE_ADDR': '10.0.0.5'}).get_data(as_text=True)
+
+
+def test_sem_proxies_confiaveis_ignora_x_forwarded_for(app):
+    assert app.config['PROXIES_CONFIAVEIS'] == 0
+    assert _ip_visto(app) == '10.0.0.5'
+
+
+def test_com_um_proxy_usa_o_ultimo_salto():
+    class ConfigProxy(ConfigTeste):
+        PROXIES_CONFIAVEIS = 1
+
+    # Só a entrada acrescentada pelo proxy vale; a enviada pelo cliente é ignorada
+    assert _ip_visto(create_app(ConfigProxy)) == '198.51.100.2'